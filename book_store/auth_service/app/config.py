@@ -9,4 +9,15 @@ ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_SECONDS = int(os.getenv("ACCESS_TOKEN_EXPIRE_SECONDS", "3600"))
 REFRESH_TOKEN_EXPIRE_SECONDS = int(os.getenv("REFRESH_TOKEN_EXPIRE_SECONDS", "604800"))
 REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
-OWNER_SECRET=os.getenv("OWNER_SECRET", "my-top-secret-owner-key")
\ No newline at end of file
+OWNER_SECRET=os.getenv("OWNER_SECRET", "my-top-secret-owner-key")
+# Small in-process L1 in front of the Redis profile cache
+PROFILE_CACHE_TTL = int(os.getenv("PROFILE_CACHE_TTL", "3600"))
+PROFILE_L1_TTL = int(os.getenv("PROFILE_L1_TTL", "5"))
+PROFILE_L1_MAX_SIZE = int(os.getenv("PROFILE_L1_MAX_SIZE", "1024"))
+
+# Async mode: async SQLAlchemy sessions (aiosqlite/asyncpg) instead of
+# running the blocking session in the threadpool
+ASYNC_MODE = os.getenv("ASYNC_MODE", "false").lower() == "true"
+
+# JSON library for Redis payloads and responses: auto, orjson, msgspec or json
+JSON_BACKEND = os.getenv("JSON_BACKEND", "auto")
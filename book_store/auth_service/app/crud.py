@@ -15,8 +15,9 @@ def get_user(db: Session, user_id):
 def get_user_by_username(db: Session, username):
     return db.query(models.User).filter(models.User.username == username).first()
 
-def create_user(db: Session, *, email: str, username: str, password: str, full_name: str = None):
-    hashed = hash_password(password)
+def create_user(db: Session, *, email: str, username: str, password: str = None, full_name: str = None, hashed_password: str = None):
+    # callers on the event loop hash up front, bcrypt is too slow to run inline
+    hashed = hashed_password or hash_password(password)
     user = models.User(email=email, username=username, hashed_password=hashed, full_name=full_name)
     db.add(user)
     db.commit()
@@ -38,4 +39,12 @@ def delete_refresh_token(db: Session, token: str):
     if rt:
         db.delete(rt)
         db.commit()
-    return
\ No newline at end of file
+    return
+
+def update_user(db: Session, user: models.User, **fields):
+    for field, value in fields.items():
+        setattr(user, field, value)
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+    return user
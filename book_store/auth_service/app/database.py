@@ -1,18 +1,61 @@
+from typing import Union
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from .config import DATABASE_URL
+from sqlalchemy.orm import Session, sessionmaker
+from .config import DATABASE_URL, ASYNC_MODE
 from pathlib import Path
 
 print(Path("test.db").resolve())
-engine = create_engine(DATABASE_URL, pool_pre_ping=True)
+engine = create_engine(
+    DATABASE_URL,
+    pool_pre_ping=True,
+    connect_args={"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {},
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+DBSession = Session
+
+
+def async_database_url(url: str) -> str:
+    for sync_prefix, async_prefix in (
+        ("sqlite://", "sqlite+aiosqlite://"),
+        ("postgresql+psycopg2://", "postgresql+asyncpg://"),
+        ("postgresql://", "postgresql+asyncpg://"),
+    ):
+        if url.startswith(sync_prefix):
+            return async_prefix + url[len(sync_prefix):]
+    return url
+
+
+if ASYNC_MODE:
+    # imported lazily: sqlalchemy.ext.asyncio needs greenlet, which sync-only
+    # deployments don't have to install
+    from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+    DBSession = Union[Session, AsyncSession]
+    async_engine = create_async_engine(async_database_url(DATABASE_URL), pool_pre_ping=True)
+    # objects are used after commit outside the session's greenlet
+    AsyncSessionLocal = sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
 # Dependency
-def get_db():
+async def get_db():
+    if ASYNC_MODE:
+        async with AsyncSessionLocal() as db:
+            yield db
+        return
+
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+async def run_db(db: DBSession, fn, *args, **kwargs):
+    # crud functions stay sync; they run on the async connection's greenlet
+    # in async mode, or in the threadpool with a blocking session otherwise
+    if ASYNC_MODE:
+        return await db.run_sync(fn, *args, **kwargs)
+    return await run_in_threadpool(fn, db, *args, **kwargs)
@@ -2,10 +2,14 @@ from fastapi import FastAPI
 from app.routes import router as auth_router
 from .database import Base, engine
 from . import models as models
+from .migrations import migrate
+from .serialization import FastJSONResponse
 
-app = FastAPI(title="BookHub Auth Service", version="0.1.0")
+app = FastAPI(title="BookHub Auth Service", version="0.1.0", default_response_class=FastJSONResponse)
 
 # create tables
 Base.metadata.create_all(bind=engine)
+# bring databases created by older versions up to date
+migrate()
 
 app.include_router(auth_router)
\ No newline at end of file
@@ -0,0 +1,71 @@
+"""
+Versioned schema migrations for the auth database.
+
+create_all only creates missing tables, so changes to existing ones
+(columns, indexes) are numbered steps here. Each version runs once, in its
+own transaction, and is recorded in schema_migrations; steps are written to
+be harmless on a database create_all just built from the current models.
+Never edit an applied version - add a new one.
+
+    python -m app.migrations            # apply pending versions
+    python -m app.migrations status
+"""
+import sys
+from datetime import datetime, timezone
+
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+from .database import engine
+
+# users.email/username and refresh_tokens.token are unique, so already indexed;
+# refresh tokens are also looked up and cascaded by user
+MIGRATIONS = [
+    (1, "refresh token user index", [
+        "CREATE INDEX IF NOT EXISTS ix_refresh_tokens_user_id ON refresh_tokens (user_id)",
+    ]),
+]
+
+
+def _ensure_table(conn):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version INTEGER PRIMARY KEY, name VARCHAR(255) NOT NULL, applied_at VARCHAR(40) NOT NULL)"
+    ))
+
+
+def applied_versions() -> set:
+    with engine.begin() as conn:
+        _ensure_table(conn)
+        return {row[0] for row in conn.execute(text("SELECT version FROM schema_migrations"))}
+
+
+def migrate():
+    done = applied_versions()
+    for version, name, steps in MIGRATIONS:
+        if version in done:
+            continue
+        try:
+            with engine.begin() as conn:
+                for step in steps:
+                    if isinstance(step, str):
+                        conn.execute(text(step))
+                    else:
+                        step(conn)
+                conn.execute(
+                    text("INSERT INTO schema_migrations (version, name, applied_at) VALUES (:v, :n, :t)"),
+                    {"v": version, "n": name, "t": datetime.now(timezone.utc).isoformat()},
+                )
+        except IntegrityError:
+            # another replica applied it first
+            continue
+        print(f"[Migrations] applied {version}: {name}")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["status"]:
+        done = applied_versions()
+        for version, name, _ in MIGRATIONS:
+            print(f"{version:>4} {'applied' if version in done else 'pending':8} {name}")
+    else:
+        migrate()
@@ -22,7 +22,7 @@ class User(Base):
 class RefreshToken(Base):
     __tablename__ = "refresh_tokens"
     id = Column(String(36), primary_key=True, default=lambda:str(uuid4()))
-    user_id = Column(String(36), ForeignKey("users.id", ondelete="CASCADE"),nullable=False)
+    user_id = Column(String(36), ForeignKey("users.id", ondelete="CASCADE"),nullable=False, index=True)
     token = Column(Text, unique=True, nullable=False)
     expires_at = Column(DateTime(timezone=True))
     created_at = Column(DateTime(timezone=True), server_default=func.now())
\ No newline at end of file
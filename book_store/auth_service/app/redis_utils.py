@@ -1,46 +1,102 @@
-import redis
-import json
+import redis.asyncio as redis
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
+from .config import PROFILE_CACHE_TTL, PROFILE_L1_TTL, PROFILE_L1_MAX_SIZE
+from .serialization import dumps, loads
 
 
 USE_FAKEREDIS = False
 
 if USE_FAKEREDIS:
-    import fakeredis
+    from fakeredis import aioredis
     # Use FakeRedis for in-memory operations
-    redis_client = fakeredis.FakeRedis(decode_responses=True)
+    redis_client = aioredis.FakeRedis(decode_responses=True)
 else:
     # Use the real Redis client if USE_FAKEREDIS is False
     from .config import REDIS_URL
     redis_client = redis.from_url(REDIS_URL, decode_responses=True)
 
 
-def cache_user_profile(user_id: str, profile: dict, ttl_seconds: int = 3600):
+# in-process L1: user_id -> (expires_at, profile); kept short-lived because
+# other auth replicas can only invalidate the shared Redis copy
+_profile_l1: "OrderedDict[str, tuple[float, dict]]" = OrderedDict()
+
+
+def _l1_get(user_id: str):
+    entry = _profile_l1.get(user_id)
+    if entry is None:
+        return None
+    if entry[0] <= time.monotonic():
+        _profile_l1.pop(user_id, None)
+        return None
+    return entry[1]
+
+
+def _l1_set(user_id: str, profile: dict):
+    _profile_l1[user_id] = (time.monotonic() + PROFILE_L1_TTL, profile)
+    _profile_l1.move_to_end(user_id)
+    while len(_profile_l1) > PROFILE_L1_MAX_SIZE:
+        _profile_l1.popitem(last=False)
+
+
+async def cache_user_profile(user_id: str, profile: dict, ttl_seconds: int = PROFILE_CACHE_TTL):
     """Caches a user profile using SET with an expiration time."""
     key = f"user:{user_id}"
-    redis_client.set(key, json.dumps(profile), ex=ttl_seconds)
+    await redis_client.set(key, dumps(profile), ex=ttl_seconds)
+    _l1_set(str(user_id), profile)
 
-def get_cached_user_profile(user_id: str):
+async def get_cached_user_profile(user_id: str):
     """Retrieves a cached user profile."""
+    profile = _l1_get(str(user_id))
+    if profile is not None:
+        return profile
     key = f"user:{user_id}"
-    data = redis_client.get(key)
-    return json.loads(data) if data else None
-
-def blacklist_token(token: str, ttl_seconds: int):
+    data = await redis_client.get(key)
+    if not data:
+        return None
+    profile = loads(data)
+    _l1_set(str(user_id), profile)
+    return profile
+
+async def invalidate_user_profile(user_id: str):
+    """Drops a cached user profile from both cache tiers."""
+    _profile_l1.pop(str(user_id), None)
+    await redis_client.delete(f"user:{user_id}")
+
+async def check_token_and_get_profile(token: str, user_id: str):
+    """Blacklist check plus cached profile lookup in a single round trip."""
+    profile = _l1_get(str(user_id))
+    if profile is not None:
+        return await is_token_blacklisted(token), profile
+
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.exists(f"token:blacklist:{token}")
+    pipe.get(f"user:{user_id}")
+    blacklisted, data = await pipe.execute()
+    if data:
+        profile = loads(data)
+        _l1_set(str(user_id), profile)
+    return blacklisted == 1, profile
+
+async def blacklist_token(token: str, ttl_seconds: int):
     """Stores a blacklisted token with a TTL using SET."""
     key = f"token:blacklist:{token}"
-    redis_client.set(key, "1", ex=ttl_seconds)
+    await redis_client.set(key, "1", ex=ttl_seconds)
 
-def is_token_blacklisted(token: str):
+async def is_token_blacklisted(token: str):
     """Checks if a token exists in the blacklist."""
     key = f"token:blacklist:{token}"
-    return redis_client.exists(key) == 1
+    return await redis_client.exists(key) == 1
 
 
-def publish_event(topic: str, payload: dict):
-    # for now just print; in production publish to GCP Pub/Sub
+async def publish_event(topic: str, payload: dict):
+    # for now print and fan out over Redis pub/sub; in production publish to GCP Pub/Sub
     print(f"[PUB] topic={topic} payload={payload}")
-    # redis_client.publish(topic, json.dumps(payload))
+    try:
+        await redis_client.publish(topic, dumps(payload))
+    except Exception as e:
+        print("[Redis] publish_event error:", e)
 
 
 # import redis
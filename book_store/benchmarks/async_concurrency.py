@@ -0,0 +1,124 @@
+"""
+Concurrency scaling of an authenticated request whose latency is dominated by
+the call to the auth service.
+
+Compares the old request path (sync `def` handler + blocking httpx.get, which
+pins one of the 40 threadpool workers per in-flight request) with the orders
+service's GET /api/v1/orders/stats as it is now. Auth is a stub that sleeps
+AUTH_LATENCY seconds; every request uses a distinct token so the /me cache
+never hides that latency.
+
+    cd book_store
+    python benchmarks/async_concurrency.py            # threadpool DB sessions
+    ASYNC_MODE=true python benchmarks/async_concurrency.py
+"""
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Header
+
+AUTH_PORT = 18101
+BASELINE_PORT = 18102
+ORDERS_PORT = 18103
+AUTH_LATENCY = float(os.getenv("AUTH_LATENCY", "0.05"))
+CONCURRENCY = [10, 40, 80, 160, 320]
+REQUESTS_PER_LEVEL = int(os.getenv("REQUESTS_PER_LEVEL", "640"))
+
+db_dir = tempfile.mkdtemp()
+os.environ.setdefault("ORDERS_DATABASE_URL", f"sqlite:///{db_dir}/orders.db")
+os.environ["AUTH_SERVICE_URL"] = f"http://127.0.0.1:{AUTH_PORT}"
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "orders_service"))
+
+from app.main import app as orders_app  # noqa: E402
+
+
+def build_auth_stub() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/api/v1/auth/me")
+    async def me(authorization: str = Header(None)):
+        await asyncio.sleep(AUTH_LATENCY)
+        user_id = authorization.rsplit("-", 1)[-1]
+        return {"id": user_id, "username": f"user{user_id}", "email": None, "is_admin": False, "is_active": True}
+
+    return app
+
+
+def build_sync_baseline() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/api/v1/orders/stats")
+    def stats(authorization: str = Header(None)):
+        resp = httpx.get(
+            f"http://127.0.0.1:{AUTH_PORT}/api/v1/auth/me",
+            headers={"Authorization": authorization},
+            timeout=5.0,
+        )
+        return {"user": resp.json()["id"], "total_orders": 0}
+
+    return app
+
+
+def serve(app: FastAPI, port: int) -> uvicorn.Server:
+    config = uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="off")
+    server = uvicorn.Server(config)
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+async def run_level(url: str, concurrency: int) -> dict:
+    latencies = []
+    sem = asyncio.Semaphore(concurrency)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=60.0) as client:
+        async def one(i: int):
+            async with sem:
+                start = time.perf_counter()
+                resp = await client.get(url, headers={"Authorization": f"Bearer bench-{time.time_ns()}-{i}"})
+                resp.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(REQUESTS_PER_LEVEL)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "rps": REQUESTS_PER_LEVEL / elapsed,
+        "p50": statistics.median(latencies) * 1000,
+        "p99": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+    }
+
+
+async def main():
+    serve(build_auth_stub(), AUTH_PORT)
+    serve(build_sync_baseline(), BASELINE_PORT)
+    serve(orders_app, ORDERS_PORT)
+
+    mode = "async sessions" if os.getenv("ASYNC_MODE", "false").lower() == "true" else "threadpool sessions"
+    targets = [
+        ("sync def + httpx.get", f"http://127.0.0.1:{BASELINE_PORT}/api/v1/orders/stats"),
+        (f"orders /stats ({mode})", f"http://127.0.0.1:{ORDERS_PORT}/api/v1/orders/stats"),
+    ]
+    print(f"auth latency {AUTH_LATENCY * 1000:.0f}ms, {REQUESTS_PER_LEVEL} requests per level")
+    print(f"{'target':34} {'conc':>5} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9}")
+    for name, url in targets:
+        await run_level(url, 10)  # warm up connections
+        for concurrency in CONCURRENCY:
+            r = await run_level(url, concurrency)
+            print(f"{name:34} {concurrency:>5} {r['rps']:>9.1f} {r['p50']:>9.1f} {r['p99']:>9.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,108 @@
+"""
+Book search latency: ILIKE scan vs the full-text index, at 1M books.
+
+Fills a throwaway SQLite database with BOOKS synthetic books (titles,
+authors and descriptions drawn from a fixed vocabulary), builds books_fts,
+then times crud.list_books(search=...) for a few queries with the index on
+and with the ILIKE fallback. Point BOOKS_DATABASE_URL at a Postgres database
+to measure the tsvector path instead. Hit counts differ by design: ILIKE is a
+substring match on title/description, FTS matches word prefixes (all words)
+across title, author and description.
+
+    cd book_store
+    python benchmarks/book_search.py              # 1M books, takes a while
+    BOOKS=100000 python benchmarks/book_search.py
+"""
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+from sqlalchemy import text
+
+BOOKS = int(os.getenv("BOOKS", "1000000"))
+RUNS = int(os.getenv("RUNS", "5"))
+QUERIES = ["dragon", "hist", "quantum garden", "the lost empire", "zzzz"]
+
+db_dir = tempfile.mkdtemp()
+os.environ.setdefault("BOOKS_DATABASE_URL", f"sqlite:///{db_dir}/books.db")
+os.environ["BOOK_SEARCH_FTS"] = "true"
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "book_service"))
+
+from app import crud, search  # noqa: E402
+from app.database import Base, SessionLocal, engine  # noqa: E402
+
+WORDS = (
+    "the a of lost empire dragon garden quantum history river silent night "
+    "city winter crown shadow ocean machine letters queen storm forest "
+    "secret journey stars glass iron fire memory house island war children"
+).split()
+AUTHORS = [f"{first} {last}" for first in ("Ann", "Ben", "Chloe", "Dev", "Eli", "Fay")
+           for last in ("Hart", "Ivers", "Jones", "Khan", "Lowe", "Moreau")]
+
+
+def fill(n: int):
+    rng = random.Random(42)
+    insert = text(
+        "INSERT INTO books (id, title, author, isbn, description, price, stock_quantity, category) "
+        "VALUES (:id, :title, :author, :isbn, :description, :price, :stock, :category)"
+    )
+    batch = []
+    for i in range(n):
+        batch.append({
+            "id": str(uuid.uuid4()),
+            "title": " ".join(rng.choices(WORDS, k=rng.randint(2, 5))).title(),
+            "author": rng.choice(AUTHORS),
+            "isbn": f"bench-{i}",
+            "description": " ".join(rng.choices(WORDS, k=40)),
+            "price": round(rng.uniform(5, 80), 2),
+            "stock": rng.randint(0, 500),
+            "category": rng.choice(("Fiction", "History", "Science")),
+        })
+        if len(batch) == 10000:
+            with engine.begin() as conn:
+                conn.execute(insert, batch)
+            batch = []
+    if batch:
+        with engine.begin() as conn:
+            conn.execute(insert, batch)
+
+
+def time_query(q: str) -> tuple[float, int]:
+    timings = []
+    for _ in range(RUNS):
+        db = SessionLocal()
+        try:
+            start = time.perf_counter()
+            _, total = crud.list_books(db, page=1, limit=20, search=q)
+            timings.append(time.perf_counter() - start)
+        finally:
+            db.close()
+    return statistics.median(timings) * 1000, total
+
+
+def main():
+    Base.metadata.create_all(bind=engine)
+    start = time.perf_counter()
+    fill(BOOKS)
+    print(f"inserted {BOOKS} books in {time.perf_counter() - start:.1f}s")
+
+    start = time.perf_counter()
+    search.ensure_search_index(engine)
+    print(f"built search index in {time.perf_counter() - start:.1f}s (enabled={search.enabled})")
+
+    print(f"{'query':18} {'ILIKE ms':>10} {'FTS ms':>10} {'ILIKE hits':>11} {'FTS hits':>9}")
+    for q in QUERIES:
+        search.enabled = False
+        like_ms, like_total = time_query(q)
+        search.enabled = True
+        fts_ms, fts_total = time_query(q)
+        print(f"{q:18} {like_ms:>10.1f} {fts_ms:>10.1f} {like_total:>11} {fts_total:>9}")
+
+
+if __name__ == "__main__":
+    main()
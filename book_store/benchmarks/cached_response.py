@@ -0,0 +1,104 @@
+"""
+Cache-hit latency of GET /api/v1/books/{id}: cached dict vs cached bytes.
+
+"dict + response_model" is the old hit path: the decoded dict comes back
+from cache_get, FastAPI validates it against BookDetail and encodes it again.
+"rendered bytes" is get_book as it is now: the cached JSON body goes out as
+is with its ETag. Both hit a warm cache (fakeredis behind the L1), and the
+requests go through the ASGI app in-process so the network does not
+dominate the numbers.
+
+    cd book_store
+    python benchmarks/cached_response.py
+"""
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+REQUESTS = int(os.getenv("REQUESTS", "5000"))
+
+db_dir = tempfile.mkdtemp()
+os.environ.setdefault("BOOKS_DATABASE_URL", f"sqlite:///{db_dir}/books.db")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "book_service"))
+
+from app import config  # noqa: E402
+
+config.USE_FAKEREDIS = True
+
+from app import crud, schemas  # noqa: E402
+from app.database import SessionLocal  # noqa: E402
+from app.main import app as books_app  # noqa: E402
+from app.redis_utils import cache_get, cache_set  # noqa: E402
+
+
+@books_app.get("/bench/dict/{book_id}", response_model=schemas.BookDetail)
+async def dict_hit(book_id: str):
+    return await cache_get(f"bench:book:{book_id}")
+
+
+def seed_book() -> tuple[str, dict]:
+    db = SessionLocal()
+    try:
+        book = crud.create_book(db, schemas.BookCreate(
+            title="The Pragmatic Programmer",
+            author="David Thomas, Andrew Hunt",
+            isbn=f"bench-{time.time_ns()}",
+            description="From journeyman to master. " * 20,
+            price="42.50",
+            stock_quantity=120,
+            category="Software",
+            publisher="Addison-Wesley",
+            published_date="2019-09-13",
+        ))
+        detail = schemas.BookDetail.from_orm(book)
+        return book.id, detail.model_dump(mode="json")
+    finally:
+        db.close()
+
+
+async def measure(client: httpx.AsyncClient, url: str, headers: dict | None = None) -> dict:
+    for _ in range(200):  # warm up
+        resp = await client.get(url, headers=headers)
+        assert resp.status_code in (200, 304)
+
+    latencies = []
+    for _ in range(REQUESTS):
+        start = time.perf_counter()
+        resp = await client.get(url, headers=headers)
+        latencies.append(time.perf_counter() - start)
+        assert resp.status_code in (200, 304)
+    latencies.sort()
+    return {
+        "mean": statistics.fmean(latencies) * 1e6,
+        "p50": statistics.median(latencies) * 1e6,
+        "p99": latencies[int(len(latencies) * 0.99) - 1] * 1e6,
+    }
+
+
+async def main():
+    book_id, detail = seed_book()
+    await cache_set(f"bench:book:{book_id}", detail, ttl=3600)
+
+    transport = httpx.ASGITransport(app=books_app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://books") as client:
+        etag = (await client.get(f"/api/v1/books/{book_id}")).headers["ETag"]
+        targets = [
+            ("dict + response_model", f"/bench/dict/{book_id}", None),
+            ("rendered bytes", f"/api/v1/books/{book_id}", None),
+            ("rendered bytes, If-None-Match", f"/api/v1/books/{book_id}", {"If-None-Match": etag}),
+        ]
+        print(f"{REQUESTS} cache hits per target, in-process ASGI")
+        print(f"{'target':32} {'mean us':>9} {'p50 us':>9} {'p99 us':>9}")
+        for name, url, headers in targets:
+            r = await measure(client, url, headers)
+            print(f"{name:32} {r['mean']:>9.1f} {r['p50']:>9.1f} {r['p99']:>9.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,137 @@
+"""
+Functional check for hot inventory (inventory.py), sync mode by default.
+
+Flags a book hot, buys through PATCH /stock (Redis), flushes, and checks
+that the row, the cached book detail and the flush stats caught up; then
+takes the book off hot inventory with pending deltas and checks the row and
+the Redis keys. Also checks that a deleted hot book stops taking
+reservations, that a change racing PUT /hot is not lost, and that
+reconcile() restores a book Redis lost. Runs the books app in-process
+against fakeredis (Lua needs lupa) and a throwaway SQLite database; exits 1
+on the first mismatch.
+
+    cd book_store
+    python benchmarks/hot_inventory.py
+    ASYNC_MODE=true python benchmarks/hot_inventory.py
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+db_dir = tempfile.mkdtemp()
+os.environ.setdefault("BOOKS_DATABASE_URL", f"sqlite:///{db_dir}/books.db")
+os.environ["HOT_INVENTORY"] = "true"
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "book_service"))
+
+from app import config  # noqa: E402
+
+config.USE_FAKEREDIS = True
+
+from app import crud, deps, inventory, schemas  # noqa: E402
+from app.database import SessionLocal  # noqa: E402
+from app.main import app as books_app  # noqa: E402
+from app.redis_utils import redis_client  # noqa: E402
+
+INTERNAL = {"X-Internal-Secret": config.INTERNAL_SERVICE_SECRET}
+
+books_app.dependency_overrides[deps.require_admin] = lambda: {"id": "admin", "is_admin": True}
+
+
+def create_book(stock: int) -> str:
+    db = SessionLocal()
+    try:
+        return crud.create_book(db, schemas.BookCreate(
+            title="Hot Release",
+            author="A. Author",
+            isbn=f"hot-{time.time_ns()}",
+            price="24.99",
+            stock_quantity=stock,
+        )).id
+    finally:
+        db.close()
+
+
+def row_stock(book_id: str) -> int | None:
+    db = SessionLocal()
+    try:
+        book = crud.get_book(db, book_id)
+        return None if book is None else book.stock_quantity
+    finally:
+        db.close()
+
+
+def check(ok: bool, what: str):
+    print(f"{'ok  ' if ok else 'FAIL'} {what}")
+    if not ok:
+        sys.exit(1)
+
+
+async def main():
+    transport = httpx.ASGITransport(app=books_app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://books") as client:
+        book_id = create_book(10)
+        url = f"/api/v1/books/{book_id}"
+
+        check((await client.put(f"{url}/hot")).status_code == 204, "PUT /hot")
+        check((await client.get(url)).json()["stock_quantity"] == 10, "detail cached at 10")
+        resp = await client.patch(f"{url}/stock", json={"quantity_change": -3}, headers=INTERNAL)
+        check(resp.status_code == 200 and resp.json()["stock_quantity"] == 7, "hot PATCH -3 answers 7")
+        check(row_stock(book_id) == 10, "row untouched before the flush")
+
+        check(await inventory.flush_once() == 1, "flush_once flushes one book")
+        check(row_stock(book_id) == 7, "row at 7 after the flush")
+        check((await client.get(url)).json()["stock_quantity"] == 7, "cached detail dropped by the flush")
+        check(inventory.inventory_stats["flushes"] == 1, "flush counted")
+
+        resp = await client.patch(f"{url}/stock", json={"quantity_change": -2}, headers=INTERNAL)
+        check(resp.status_code == 200 and resp.json()["stock_quantity"] == 5, "hot PATCH -2 answers 5")
+        check((await client.delete(f"{url}/hot")).status_code == 204, "DELETE /hot with a pending delta")
+        check(row_stock(book_id) == 5, "pending delta flushed to the row")
+        check(not await redis_client.exists(inventory.stock_key(book_id)), "counter removed")
+        check(not await redis_client.sismember(inventory.HOT_SET, book_id), "book left the hot set")
+
+        resp = await client.patch(f"{url}/stock", json={"quantity_change": -1}, headers=INTERNAL)
+        check(resp.status_code == 200 and row_stock(book_id) == 4, "database path again after DELETE /hot")
+
+        check((await client.put(f"{url}/hot")).status_code == 204, "PUT /hot again")
+        check((await client.delete(url)).status_code == 204, "DELETE a hot book")
+        check(not await inventory.hot_subset([book_id]), "deleted book is not hot")
+        resp = await client.patch(f"{url}/stock", json={"quantity_change": -1}, headers=INTERNAL)
+        check(resp.status_code == 404, "PATCH /stock of the deleted book is 404")
+
+        # PUT /hot racing a database-path change: the change has already
+        # found the book cold and waits on the row lock that enable() holds
+        # while it seeds the counter; it must end up in Redis, not the row
+        book_id = create_book(10)
+        url = f"/api/v1/books/{book_id}"
+        db = SessionLocal()
+        try:
+            stock = crud.begin_hot_inventory(db, book_id)
+            racing = asyncio.create_task(
+                client.patch(f"{url}/stock", json={"quantity_change": -1}, headers=INTERNAL)
+            )
+            await asyncio.sleep(0.5)
+            await redis_client.set(inventory.stock_key(book_id), stock)
+            await redis_client.sadd(inventory.HOT_SET, book_id)
+            db.commit()
+        finally:
+            db.close()
+        resp = await racing
+        check(resp.status_code == 200 and resp.json()["stock_quantity"] == 9, "racing change went to the counter")
+        check(row_stock(book_id) == 10, "racing change did not touch the row")
+
+        check(await inventory.reconcile() == [], "reconcile finds no drift")
+        await redis_client.delete(inventory.HOT_SET, inventory.stock_key(book_id))
+        check(await inventory.reconcile() == [], "reconcile after Redis lost the book")
+        check(await inventory.hot_subset([book_id]) == {book_id}, "book hot again, from its database flag")
+        check(int(await redis_client.get(inventory.stock_key(book_id))) == 9, "counter re-seeded from the row")
+    print("OK")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,72 @@
+"""
+Check for stock_keys.prune_once: expired idempotency keys go, live ones stay.
+
+Records one key older than STOCK_IDEMPOTENCY_KEY_TTL and one fresh key,
+both through crud.update_stock, then prunes. The old key must be gone, the
+fresh one kept, and a retry with the fresh key must still change nothing;
+exits 1 if not. Runs on a throwaway SQLite database, or on whatever
+BOOKS_DATABASE_URL points at.
+
+    cd book_store
+    python benchmarks/idempotency_prune.py
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+db_dir = tempfile.mkdtemp()
+os.environ.setdefault("BOOKS_DATABASE_URL", f"sqlite:///{db_dir}/books.db")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "book_service"))
+
+from app import crud, models, schemas, stock_keys  # noqa: E402
+from app.config import STOCK_IDEMPOTENCY_KEY_TTL  # noqa: E402
+from app.database import Base, SessionLocal, engine  # noqa: E402
+
+
+def main():
+    Base.metadata.create_all(bind=engine)
+    run = time.time_ns()
+    old_key, fresh_key = f"prune:{run}:old", f"prune:{run}:fresh"
+
+    db = SessionLocal()
+    try:
+        book_id = crud.create_book(db, schemas.BookCreate(
+            title="Retry Semantics",
+            author="A. Author",
+            isbn=f"prune-{run}",
+            price="9.99",
+            stock_quantity=10,
+        )).id
+        crud.update_stock(db, book_id, -1, idempotency_key=old_key)
+        crud.update_stock(db, book_id, -1, idempotency_key=fresh_key)
+        expired = datetime.now(timezone.utc) - timedelta(seconds=STOCK_IDEMPOTENCY_KEY_TTL + 3600)
+        db.query(models.StockIdempotencyKey).filter(models.StockIdempotencyKey.key == old_key).update(
+            {models.StockIdempotencyKey.created_at: expired}, synchronize_session=False
+        )
+        db.commit()
+    finally:
+        db.close()
+
+    pruned = asyncio.run(stock_keys.prune_once())
+
+    db = SessionLocal()
+    try:
+        left = {key for (key,) in db.query(models.StockIdempotencyKey.key).filter(
+            models.StockIdempotencyKey.key.in_([old_key, fresh_key])
+        )}
+        stock = crud.update_stock(db, book_id, -1, idempotency_key=fresh_key).stock_quantity
+    finally:
+        db.close()
+
+    print(f"pruned={pruned} kept={sorted(left)} stock={stock} on {engine.dialect.name}")
+    ok = pruned >= 1 and left == {fresh_key} and stock == 8
+    print("OK" if ok else "FAILED: expired keys not pruned or live keys lost")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
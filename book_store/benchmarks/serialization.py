@@ -0,0 +1,113 @@
+"""
+Micro-benchmark of the JSON backends in app/serialization.py.
+
+Payloads are a 20-item PaginatedBooks page and a 5-item OrderDetail, built
+from the services' own schemas. Per backend it times:
+  * dumps of the model_dump(mode="python") dict (Decimal/datetime handled by
+    the backend's default hook) - what FastJSONResponse renders
+  * dumps of the model_dump(mode="json") dict - what the caches store
+  * loads of the encoded payload - a Redis cache hit
+pydantic's own model_dump_json() is listed for reference. Backends that are
+not installed are skipped.
+
+    cd book_store
+    python benchmarks/serialization.py
+"""
+import importlib
+import sys
+import timeit
+import uuid
+from datetime import datetime, timedelta
+from decimal import Decimal
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+NUMBER = 20000
+
+
+def import_service(service: str, *modules: str):
+    # every service is an `app` package, so load them one at a time
+    for name in [m for m in sys.modules if m == "app" or m.startswith("app.")]:
+        del sys.modules[name]
+    sys.path.insert(0, str(ROOT / service))
+    try:
+        return [importlib.import_module(f"app.{m}") for m in modules]
+    finally:
+        sys.path.pop(0)
+
+
+def books_page(schemas):
+    items = [
+        schemas.BookListItem(
+            id=str(uuid.uuid4()),
+            title=f"Designing Data-Intensive Applications, vol. {i}",
+            author="Martin Kleppmann",
+            isbn=f"978-1-4493-7332-{i:02d}",
+            price=Decimal("39.99") + i,
+            stock_quantity=100 + i,
+            category="Software",
+        )
+        for i in range(20)
+    ]
+    return schemas.PaginatedBooks(items=items, total=1234, page=1, limit=20, pages=62)
+
+
+def order_detail(schemas):
+    created = datetime(2025, 3, 14, 9, 26, 53)
+    items = [
+        schemas.OrderItemOut(
+            id=str(uuid.uuid4()),
+            book_id=str(uuid.uuid4()),
+            book_title=f"Book {i}",
+            book_isbn=f"978-0-13-468599-{i}",
+            book_author="Robert C. Martin",
+            quantity=i + 1,
+            price_at_purchase=Decimal("24.50"),
+            subtotal=Decimal("24.50") * (i + 1),
+        )
+        for i in range(5)
+    ]
+    return schemas.OrderDetail(
+        id=str(uuid.uuid4()),
+        user_id=str(uuid.uuid4()),
+        status="processing",
+        items=items,
+        total_amount=sum(item.subtotal for item in items),
+        created_at=created,
+        updated_at=created + timedelta(minutes=5),
+    )
+
+
+def usec(fn) -> float:
+    return min(timeit.repeat(fn, number=NUMBER, repeat=3)) / NUMBER * 1e6
+
+
+def main():
+    book_schemas, serialization = import_service("book_service", "schemas", "serialization")
+    (order_schemas,) = import_service("orders_service", "schemas")
+    payloads = [("PaginatedBooks", books_page(book_schemas)), ("OrderDetail", order_detail(order_schemas))]
+
+    backends = []
+    for name, factory in serialization.BACKENDS.items():
+        try:
+            backends.append((name, *factory()))
+        except ImportError:
+            print(f"{name}: not installed, skipped")
+
+    print(f"{'payload':16} {'backend':10} {'dumps py':>10} {'dumps json':>11} {'loads':>8}  (usec/op)")
+    for label, model in payloads:
+        python_dict = model.model_dump()
+        json_dict = model.model_dump(mode="json")
+        print(f"{label:16} {'pydantic':10} {usec(model.model_dump_json):>10.2f} {'-':>11} {'-':>8}")
+        for name, dumps, loads in backends:
+            encoded = dumps(json_dict)
+            print(
+                f"{label:16} {name:10} "
+                f"{usec(lambda: dumps(python_dict)):>10.2f} "
+                f"{usec(lambda: dumps(json_dict)):>11.2f} "
+                f"{usec(lambda: loads(encoded)):>8.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Concurrency check for crud.update_stock: no oversell, no double decrement.
+
+Creates a book with STOCK copies and lets BUYERS threads (one session each)
+buy one copy at the same time through crud.update_stock, every buyer
+sending its request twice with the same idempotency key, as a retry would.
+Exactly STOCK buyers must succeed and the stock must end at 0; exits 1 if
+not. Runs on a throwaway SQLite database, or on whatever BOOKS_DATABASE_URL
+points at (use Postgres to see real row-lock contention).
+
+    cd book_store
+    python benchmarks/stock_oversell.py
+    BUYERS=500 STOCK=120 python benchmarks/stock_oversell.py
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+BUYERS = int(os.getenv("BUYERS", "100"))
+STOCK = int(os.getenv("STOCK", "40"))
+
+db_dir = tempfile.mkdtemp()
+os.environ.setdefault("BOOKS_DATABASE_URL", f"sqlite:///{db_dir}/books.db")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "book_service"))
+
+from sqlalchemy.exc import OperationalError  # noqa: E402
+
+from app import crud, schemas  # noqa: E402
+from app.database import Base, SessionLocal, engine  # noqa: E402
+
+
+def create_book() -> str:
+    db = SessionLocal()
+    try:
+        book = crud.create_book(db, schemas.BookCreate(
+            title="Launch Day Bestseller",
+            author="A. Author",
+            isbn=f"oversell-{time.time_ns()}",
+            price="19.99",
+            stock_quantity=STOCK,
+        ))
+        return book.id
+    finally:
+        db.close()
+
+
+def main():
+    Base.metadata.create_all(bind=engine)
+    book_id = create_book()
+
+    results = {"bought": 0, "sold_out": 0, "errors": 0}
+    lock = threading.Lock()
+    start = threading.Barrier(BUYERS)
+
+    def buyer(n: int):
+        start.wait()
+        outcome = None
+        for _ in range(2):  # the second call is a retry with the same key
+            db = SessionLocal()
+            try:
+                crud.update_stock(db, book_id, -1, idempotency_key=f"oversell:{book_id}:{n}")
+                outcome = outcome or "bought"
+            except ValueError:
+                outcome = outcome or "sold_out"
+            except OperationalError:  # SQLite: database is locked
+                outcome = outcome or "errors"
+            finally:
+                db.close()
+        with lock:
+            results[outcome] += 1
+
+    threads = [threading.Thread(target=buyer, args=(n,)) for n in range(BUYERS)]
+    began = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - began
+
+    db = SessionLocal()
+    try:
+        left = crud.get_book(db, book_id).stock_quantity
+    finally:
+        db.close()
+
+    print(f"{BUYERS} buyers, {STOCK} copies, {elapsed:.2f}s on {engine.dialect.name}")
+    print(f"bought={results['bought']} sold_out={results['sold_out']} errors={results['errors']} stock_left={left}")
+    ok = left == STOCK - results["bought"] and left >= 0 and (results["errors"] or results["bought"] == min(BUYERS, STOCK))
+    print("OK" if ok else "FAILED: stock does not add up")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
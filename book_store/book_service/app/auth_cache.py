@@ -0,0 +1,123 @@
+import asyncio
+import base64
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional
+
+from .config import AUTH_CACHE_TTL, AUTH_CACHE_MAX_SIZE
+from .redis_utils import redis_client
+from .serialization import loads
+
+# Bounded LRU + TTL cache of /auth/me results, keyed by sha256(token).
+# Concurrent lookups for the same token share one call to auth.
+
+INVALIDATION_TOPICS = ("user.updated", "user.logged_out")
+
+_entries: "OrderedDict[str, tuple[float, dict]]" = OrderedDict()
+_keys_by_user: dict[str, set] = {}
+_inflight: dict[str, asyncio.Future] = {}
+
+
+def token_hash(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def token_expiry(token: str) -> Optional[float]:
+    # only used to cap the TTL; the signature is checked by auth
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+    except Exception:
+        return None
+
+
+def _drop(key: str):
+    entry = _entries.pop(key, None)
+    if entry is None:
+        return
+    user_id = str(entry[1].get("id"))
+    keys = _keys_by_user.get(user_id)
+    if keys is not None:
+        keys.discard(key)
+        if not keys:
+            del _keys_by_user[user_id]
+
+
+def _store(key: str, profile: dict, expires_at: float):
+    _drop(key)
+    _entries[key] = (expires_at, profile)
+    _keys_by_user.setdefault(str(profile.get("id")), set()).add(key)
+    while len(_entries) > AUTH_CACHE_MAX_SIZE:
+        _drop(next(iter(_entries)))
+
+
+async def get_or_load(token: str, loader: Callable[[str], Awaitable[dict]]) -> dict:
+    key = token_hash(token)
+    now = time.time()
+    entry = _entries.get(key)
+    if entry is not None and entry[0] > now:
+        _entries.move_to_end(key)
+        return entry[1]
+    if entry is not None:
+        _drop(key)
+
+    pending = _inflight.get(key)
+    if pending is not None:
+        return await asyncio.shield(pending)
+
+    pending = asyncio.get_running_loop().create_future()
+    _inflight[key] = pending
+    try:
+        profile = await loader(token)
+        pending.set_result(profile)
+    except BaseException as e:
+        pending.set_exception(e)
+        pending.exception()  # mark retrieved when nobody else was waiting
+        raise
+    finally:
+        _inflight.pop(key, None)
+
+    expires_at = now + AUTH_CACHE_TTL
+    exp = token_expiry(token)
+    if exp is not None:
+        expires_at = min(expires_at, exp)
+    if expires_at > now:
+        _store(key, profile, expires_at)
+    return profile
+
+
+def invalidate_token(hashed_token: str):
+    _drop(hashed_token)
+
+
+def invalidate_user(user_id: str):
+    for key in list(_keys_by_user.get(str(user_id), ())):
+        _drop(key)
+
+
+def handle_event(topic: str, payload: dict):
+    if topic == "user.logged_out" and payload.get("token_hash"):
+        invalidate_token(payload["token_hash"])
+    if payload.get("user_id") or payload.get("id"):
+        invalidate_user(payload.get("user_id") or payload.get("id"))
+
+
+async def _listen():
+    while True:
+        try:
+            pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+            await pubsub.subscribe(*INVALIDATION_TOPICS)
+            async for message in pubsub.listen():
+                handle_event(message["channel"], loads(message["data"]))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print("[AuthCache] invalidation listener error:", e)
+            await asyncio.sleep(1)
+
+
+def start_invalidation_listener() -> asyncio.Task:
+    return asyncio.create_task(_listen())
@@ -16,4 +16,55 @@ USE_FAKEREDIS = False
 REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
 
 # Internal secret for stock updates from Orders service
-INTERNAL_SERVICE_SECRET = os.getenv("INTERNAL_SERVICE_SECRET", "super-secret-internal")
\ No newline at end of file
+INTERNAL_SERVICE_SECRET = os.getenv("INTERNAL_SERVICE_SECRET", "super-secret-internal")
+
+# Trusted identity headers signed by the gateway (must match the gateway)
+TRUSTED_IDENTITY = os.getenv("TRUSTED_IDENTITY", "false").lower() == "true"
+IDENTITY_SECRET = os.getenv("IDENTITY_SECRET", "super-secret-identity")
+
+# In-process cache of /auth/me lookups (seconds, capped by the token's exp)
+AUTH_CACHE_TTL = int(os.getenv("AUTH_CACHE_TTL", "30"))
+AUTH_CACHE_MAX_SIZE = int(os.getenv("AUTH_CACHE_MAX_SIZE", "10000"))
+
+# Async mode: async SQLAlchemy sessions (aiosqlite/asyncpg) instead of
+# running the blocking session in the threadpool
+ASYNC_MODE = os.getenv("ASYNC_MODE", "false").lower() == "true"
+
+# Book listing pages are invalidated by generation bumps, so they can live long
+BOOK_LIST_CACHE_TTL = int(os.getenv("BOOK_LIST_CACHE_TTL", "3600"))
+
+# cached(): stale window served while recomputing, XFetch beta, recompute lock
+CACHE_STALE_TTL = int(os.getenv("CACHE_STALE_TTL", "300"))
+CACHE_EARLY_REFRESH_BETA = float(os.getenv("CACHE_EARLY_REFRESH_BETA", "1.0"))
+CACHE_LOCK_TTL_MS = int(os.getenv("CACHE_LOCK_TTL_MS", "10000"))
+CACHE_LOCK_WAIT_MS = int(os.getenv("CACHE_LOCK_WAIT_MS", "50"))
+CACHE_LOCK_WAIT_STEPS = int(os.getenv("CACHE_LOCK_WAIT_STEPS", "10"))
+
+# In-process L1 in front of Redis; invalidated over pub/sub, TTL is the backstop
+L1_CACHE_TTL = float(os.getenv("L1_CACHE_TTL", "30"))
+L1_CACHE_MAX_ITEMS = int(os.getenv("L1_CACHE_MAX_ITEMS", "5000"))
+L1_CACHE_MAX_BYTES = int(os.getenv("L1_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+# JSON library for Redis payloads and responses: auto, orjson, msgspec or json
+JSON_BACKEND = os.getenv("JSON_BACKEND", "auto")
+
+# Full-text search index (FTS5 on SQLite, tsvector on Postgres); false = ILIKE
+BOOK_SEARCH_FTS = os.getenv("BOOK_SEARCH_FTS", "true").lower() == "true"
+
+# Outbox relay and Redis Streams consumers (see events.py)
+OUTBOX_RELAY_BATCH = int(os.getenv("OUTBOX_RELAY_BATCH", "500"))
+OUTBOX_POLL_MS = int(os.getenv("OUTBOX_POLL_MS", "500"))
+EVENT_STREAM_MAXLEN = int(os.getenv("EVENT_STREAM_MAXLEN", "100000"))
+EVENT_CONSUMER_BATCH = int(os.getenv("EVENT_CONSUMER_BATCH", "100"))
+EVENT_CLAIM_IDLE_MS = int(os.getenv("EVENT_CLAIM_IDLE_MS", "30000"))
+
+# Hot inventory: stock of books flagged via PUT /{id}/hot lives in Redis
+# counters and is written back to the database every HOT_INVENTORY_FLUSH_MS
+HOT_INVENTORY = os.getenv("HOT_INVENTORY", "false").lower() == "true"
+HOT_INVENTORY_FLUSH_MS = int(os.getenv("HOT_INVENTORY_FLUSH_MS", "1000"))
+HOT_INVENTORY_KEY_TTL = int(os.getenv("HOT_INVENTORY_KEY_TTL", str(24 * 3600)))
+
+# Stock idempotency keys are kept this long (seconds) for retries to be
+# recognised, then pruned every STOCK_IDEMPOTENCY_PRUNE_S (see stock_keys.py)
+STOCK_IDEMPOTENCY_KEY_TTL = int(os.getenv("STOCK_IDEMPOTENCY_KEY_TTL", str(7 * 24 * 3600)))
+STOCK_IDEMPOTENCY_PRUNE_S = int(os.getenv("STOCK_IDEMPOTENCY_PRUNE_S", "3600"))
@@ -1,10 +1,26 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import func, or_, and_
-from typing import Optional, List, Tuple
+from sqlalchemy import func, and_, update
+from sqlalchemy.exc import IntegrityError
+from typing import Optional, List, Tuple, Dict, Set
 from math import ceil
+from datetime import date, datetime
 
 from . import models
+from .events import publish_event
+from .pagination import SortKey, paginate
+from .search import apply_search
 from .schemas import BookCreate, BookUpdate
+from .config import HOT_INVENTORY
+
+STOCK_LOW_THRESHOLD = 10
+
+
+class HotStock(Exception):
+    """The book's stock is held in hot inventory (Redis), not in the row."""
+
+    def __init__(self, book_id: str):
+        super().__init__(book_id)
+        self.book_id = book_id
 
 
 def create_book(db: Session, data: BookCreate) -> models.Book:
@@ -25,6 +41,8 @@ def create_book(db: Session, data: BookCreate) -> models.Book:
             cat = models.Category(name=data.category, description=None)
             db.add(cat)
 
+    db.flush()  # get book.id
+    publish_event(db, "book.created", {"book_id": book.id})
     db.commit()
     db.refresh(book)
     return book
@@ -34,6 +52,12 @@ def get_book(db: Session, book_id: str) -> Optional[models.Book]:
     return db.query(models.Book).filter(models.Book.id == book_id).first()
 
 
+def get_books(db: Session, book_ids: List[str]) -> List[models.Book]:
+    if not book_ids:
+        return []
+    return db.query(models.Book).filter(models.Book.id.in_(set(book_ids))).all()
+
+
 def update_book(db: Session, book: models.Book, data: BookUpdate) -> models.Book:
     for field, value in data.dict(exclude_unset=True).items():
         setattr(book, field, value)
@@ -46,6 +70,7 @@ def update_book(db: Session, book: models.Book, data: BookUpdate) -> models.Book
             db.add(cat)
 
     db.add(book)
+    publish_event(db, "book.updated", {"book_id": book.id})
     db.commit()
     db.refresh(book)
     return book
@@ -56,51 +81,88 @@ def delete_book(db: Session, book: models.Book) -> None:
     db.commit()
 
 
-def list_books(
+def _filter_books(
     db: Session,
-    page: int = 1,
-    limit: int = 20,
     category: Optional[str] = None,
     author: Optional[str] = None,
     search: Optional[str] = None,
     min_price: Optional[float] = None,
     max_price: Optional[float] = None,
-    sort_by: Optional[str] = None,
-    sort_order: str = "asc",
-) -> Tuple[List[models.Book], int]:
+):
     query = db.query(models.Book)
+    rank = None
 
     if category:
         query = query.filter(models.Book.category == category)
     if author:
         query = query.filter(models.Book.author == author)
     if search:
-        like = f"%{search}%"
-        query = query.filter(or_(models.Book.title.ilike(like), models.Book.description.ilike(like)))
+        query, rank = apply_search(query, search)
     if min_price is not None:
         query = query.filter(models.Book.price >= min_price)
     if max_price is not None:
         query = query.filter(models.Book.price <= max_price)
+    return query, rank
 
-    # total before pagination
-    total = query.count()
 
-    # sorting
-    sort_column = {
+def _book_sort_keys(sort_by: Optional[str], sort_order: str, rank: Optional[SortKey]) -> List[SortKey]:
+    desc = sort_order == "desc"
+    column = {
         "price": models.Book.price,
         "title": models.Book.title,
-        "published_date": models.Book.published_date,
+        # undated books sort as the oldest; keyset comparisons need a value
+        "published_date": func.coalesce(models.Book.published_date, date.min),
+        "rating": models.Book.average_rating,
     }.get(sort_by or "", models.Book.created_at)
 
-    if sort_order == "desc":
-        sort_column = sort_column.desc()
-    query = query.order_by(sort_column)
+    keys = [SortKey(column, desc), SortKey(models.Book.id, desc)]
+    # search results go by relevance unless a sort was asked for
+    if rank is not None and not sort_by:
+        keys.insert(0, rank)
+    return keys
+
+
+def list_books(
+    db: Session,
+    page: int = 1,
+    limit: int = 20,
+    sort_by: Optional[str] = None,
+    sort_order: str = "asc",
+    **filters,
+) -> Tuple[List[models.Book], int]:
+    query, rank = _filter_books(db, **filters)
+
+    # total before pagination
+    total = query.count()
+
+    keys = _book_sort_keys(sort_by, sort_order, rank)
+    query = query.order_by(*(key.column.desc() if key.desc else key.column.asc() for key in keys))
 
     # pagination
     items = query.offset((page - 1) * limit).limit(limit).all()
     return items, total
 
 
+def list_books_keyset(
+    db: Session,
+    cursor: Optional[str] = None,
+    limit: int = 20,
+    sort_by: Optional[str] = None,
+    sort_order: str = "asc",
+    **filters,
+) -> Tuple[List[models.Book], Optional[str]]:
+    """Raises ValueError for a cursor that does not belong to this sort."""
+    query, rank = _filter_books(db, **filters)
+    keys = _book_sort_keys(sort_by, sort_order, rank)
+    sort = f"books:{sort_by or ('rank' if rank is not None else 'created_at')}:{sort_order}"
+    return paginate(query, keys, sort, cursor, limit)
+
+
+def count_books(db: Session, **filters) -> int:
+    query, _ = _filter_books(db, **filters)
+    return query.count()
+
+
 def get_categories_with_counts(db: Session):
     # left join books to categories by name
     # simpler: aggregate directly from books and join category desc
@@ -123,12 +185,226 @@ def get_categories_with_counts(db: Session):
     return q.all()
 
 
-def update_stock(db: Session, book: models.Book, quantity_change: int) -> models.Book:
-    new_qty = (book.stock_quantity or 0) + quantity_change
-    if new_qty < 0:
-        raise ValueError("Insufficient stock")
-    book.stock_quantity = new_qty
-    db.add(book)
+def apply_rating_stats(
+    db: Session, book_id: str, review_count: int, rating_sum: int, version: int
+) -> Tuple[bool, Optional[str]]:
+    """
+    Stores a book's rating totals from a review event. The review.* topics are
+    separate streams, so events for one book can arrive out of order; one
+    older than the version already stored is skipped. Returns (changed,
+    category); changed is False for an unknown book, a stale event or values
+    the book already had (a redelivery), so callers only invalidate on a real
+    change.
+    """
+    average = round(rating_sum / review_count, 2) if review_count else 0
+    book = models.Book
+    current = (
+        db.query(book.review_count, book.average_rating, book.category)
+        .filter(book.id == book_id, book.rating_version <= version)
+        .first()
+    )
+    if current is None:
+        return False, None
+    # the version is re-checked here, in case another consumer got in first
+    updated = (
+        db.query(book)
+        .filter(book.id == book_id, book.rating_version <= version)
+        # not an edit of the book itself, so leave updated_at alone
+        .update(
+            {
+                book.review_count: review_count,
+                book.average_rating: average,
+                book.rating_version: version,
+                book.updated_at: book.updated_at,
+            },
+            synchronize_session=False,
+        )
+    )
     db.commit()
-    db.refresh(book)
-    return book
\ No newline at end of file
+    changed = updated > 0 and (current.review_count != review_count or current.average_rating != average)
+    return changed, current.category
+
+
+def _check_stock_low(db: Session, book: models.Book):
+    if book.stock_quantity < STOCK_LOW_THRESHOLD:
+        publish_event(db, "book.stock_low", {"book_id": book.id, "stock_quantity": book.stock_quantity})
+
+
+def _claim_idempotency_key(db: Session, key: Optional[str]) -> bool:
+    """
+    Records `key` in the current transaction. False when a change with this
+    key was already committed, i.e. the request is a retry.
+    """
+    if key is None:
+        return True
+    db.add(models.StockIdempotencyKey(key=key))
+    try:
+        db.flush()
+    except IntegrityError:
+        db.rollback()
+        return False
+    return True
+
+
+def _claim_idempotency_keys(db: Session, keys) -> Optional[Set[str]]:
+    """
+    Records those of `keys` not committed yet in the current transaction and
+    returns them. None when a concurrent request committed one of them in
+    between; the transaction is rolled back and the caller starts over.
+    """
+    record = models.StockIdempotencyKey
+    keys = set(keys)
+    done = {key for (key,) in db.query(record.key).filter(record.key.in_(keys))} if keys else set()
+    fresh = keys - done
+    db.add_all([record(key=key) for key in fresh])
+    try:
+        db.flush()
+    except IntegrityError:
+        db.rollback()
+        return None
+    return fresh
+
+
+def _adjust_stock(db: Session, book_id: str, quantity_change: int) -> bool:
+    # one conditional UPDATE: the row lock makes concurrent changes queue up
+    # instead of overwriting each other, and stock can never go below zero
+    stock = func.coalesce(models.Book.stock_quantity, 0)
+    conditions = [models.Book.id == book_id, stock + quantity_change >= 0]
+    if HOT_INVENTORY:
+        conditions.append(models.Book.hot_inventory.is_(False))
+    result = db.execute(
+        update(models.Book)
+        .where(*conditions)
+        .values(stock_quantity=stock + quantity_change)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+def _stock_change_failed(db: Session, book_id: str):
+    db.rollback()
+    book = get_book(db, book_id)
+    if book is None:
+        raise LookupError(f"Book not found: {book_id}")
+    if HOT_INVENTORY and book.hot_inventory:
+        raise HotStock(book_id)
+    raise ValueError(f"Insufficient stock for book {book.title}")
+
+
+def update_stock(
+    db: Session, book_id: str, quantity_change: int, idempotency_key: Optional[str] = None
+) -> models.Book:
+    """
+    Raises LookupError for an unknown book, ValueError when the change
+    would take stock below zero and HotStock when the book's stock is in
+    hot inventory. A retry with an already applied
+    idempotency_key changes nothing and returns the book as it is now.
+    """
+    if _claim_idempotency_key(db, idempotency_key):
+        if not _adjust_stock(db, book_id, quantity_change):
+            _stock_change_failed(db, book_id)
+        _check_stock_low(db, get_book(db, book_id))
+        db.commit()
+
+    book = get_book(db, book_id)
+    if book is None:
+        raise LookupError(f"Book not found: {book_id}")
+    return book
+
+
+def update_stock_batch(db: Session, reservations: Dict[Optional[str], Dict[str, int]]) -> List[models.Book]:
+    """
+    Applies several reservations, each {book_id: change} under its own
+    idempotency key (None for none), all-or-nothing in one transaction.
+    Reservations whose key was already applied are skipped, so a retry only
+    applies what is missing however its reservations are grouped. Raises
+    like update_stock; returns every book named, in order.
+    """
+    fresh = None
+    while fresh is None:
+        fresh = _claim_idempotency_keys(db, [key for key in reservations if key is not None])
+
+    changes: Dict[str, int] = {}
+    for key, reservation in reservations.items():
+        if key is None or key in fresh:
+            for book_id, change in reservation.items():
+                changes[book_id] = changes.get(book_id, 0) + change
+    # same lock order in every batch, so two batches cannot deadlock
+    for book_id in sorted(changes):
+        if not _adjust_stock(db, book_id, changes[book_id]):
+            _stock_change_failed(db, book_id)
+    for book in get_books(db, list(changes)):
+        _check_stock_low(db, book)
+    db.commit()
+
+    book_ids = list(dict.fromkeys(book_id for reservation in reservations.values() for book_id in reservation))
+    books = {book.id: book for book in get_books(db, book_ids)}
+    missing = [book_id for book_id in book_ids if book_id not in books]
+    if missing:
+        raise LookupError(f"Book not found: {missing[0]}")
+    return [books[book_id] for book_id in book_ids]
+
+
+def apply_stock_deltas(db: Session, deltas: Dict[str, int], idempotency_key: str) -> List[Tuple[str, Optional[str]]]:
+    """
+    Adds hot-inventory deltas (see inventory.py) to stock_quantity, in one
+    transaction. Redis already kept the counters from going below zero, so
+    the updates are unconditional. Unknown books are skipped. Returns (id,
+    category) of the books changed, read before the commit expires them.
+    """
+    if _claim_idempotency_key(db, idempotency_key):
+        stock = func.coalesce(models.Book.stock_quantity, 0)
+        for book_id in sorted(deltas):
+            db.execute(
+                update(models.Book)
+                .where(models.Book.id == book_id)
+                .values(stock_quantity=stock + deltas[book_id])
+                .execution_options(synchronize_session=False)
+            )
+        for book in get_books(db, list(deltas)):
+            _check_stock_low(db, book)
+    books = [(book.id, book.category) for book in get_books(db, list(deltas))]
+    db.commit()
+    return books
+
+
+def begin_hot_inventory(db: Session, book_id: str) -> Optional[int]:
+    """
+    Flags the book hot and returns its stock without committing: the row
+    stays locked until the caller ends the transaction, so no database stock
+    change lands between this read and the commit. None for an unknown book.
+    """
+    book = models.Book
+    flagged = db.query(book).filter(book.id == book_id).update(
+        {book.hot_inventory: True, book.updated_at: book.updated_at}, synchronize_session=False
+    )
+    if not flagged:
+        return None
+    return db.query(func.coalesce(book.stock_quantity, 0)).filter(book.id == book_id).scalar()
+
+
+def set_hot_inventory(db: Session, book_id: str, hot: bool) -> None:
+    book = models.Book
+    db.query(book).filter(book.id == book_id).update(
+        {book.hot_inventory: hot, book.updated_at: book.updated_at}, synchronize_session=False
+    )
+    db.commit()
+
+
+def hot_inventory_book_ids(db: Session) -> List[str]:
+    return [book_id for (book_id,) in db.query(models.Book.id).filter(models.Book.hot_inventory.is_(True))]
+
+
+def end_transaction(db: Session, commit: bool) -> None:
+    if commit:
+        db.commit()
+    else:
+        db.rollback()
+
+
+def prune_idempotency_keys(db: Session, older_than: datetime) -> int:
+    """Deletes stock idempotency keys recorded before `older_than`. Returns how many."""
+    record = models.StockIdempotencyKey
+    deleted = db.query(record).filter(record.created_at < older_than).delete(synchronize_session=False)
+    db.commit()
+    return deleted
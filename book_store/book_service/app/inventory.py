@@ -0,0 +1,356 @@
+"""
+Redis-resident stock for high-contention books (HOT_INVENTORY=true).
+
+Books flagged hot (PUT /api/v1/books/{id}/hot) keep their live stock in
+inventory:{id}:stock. Stock changes for them run as one Lua script that
+checks every counter of the request before touching any, so a batch is
+all-or-nothing and stock never goes below zero, without a database write per
+purchase. Each change is also added to inventory:{id}:pending, and the
+flusher writes those deltas back to books.stock_quantity in one transaction
+per round.
+
+A flush round first moves the pending deltas into the inventory:flushing
+hash under a fresh id, then applies them with that id as the idempotency
+key. A replica that dies mid-flush leaves the hash behind, and the next
+round (on any replica) re-applies it, which the key turns into a no-op if
+it had committed. Deltas still in Redis are lost if Redis loses its data;
+reconcile() reports the resulting drift on startup.
+
+The flag is kept both in inventory:hot and in books.hot_inventory.
+Database stock changes skip flagged rows, so the flag is checked under the
+row lock, and the switch in enable() cannot lose a change.
+
+Single Redis node only: the scripts touch keys they do not declare.
+
+    python -m app.inventory            # compare counters with the database
+    python -m app.inventory fix        # reset drifted counters from it
+"""
+import asyncio
+import sys
+import uuid
+
+from . import crud
+from .config import HOT_INVENTORY_FLUSH_MS, HOT_INVENTORY_KEY_TTL
+from .database import run_db, run_in_session
+from .redis_utils import bump_list_generations, cache_delete, redis_client
+
+HOT_SET = "inventory:hot"
+DIRTY_SET = "inventory:dirty"
+FLUSHING = "inventory:flushing"
+
+inventory_stats = {"reserved": 0, "rejected": 0, "replayed": 0, "flushes": 0, "flushed_books": 0}
+
+
+class InsufficientStock(ValueError):
+    def __init__(self, book_id: str):
+        super().__init__(book_id)
+        self.book_id = book_id
+
+
+def stock_key(book_id: str) -> str:
+    return f"inventory:{book_id}:stock"
+
+
+def pending_key(book_id: str) -> str:
+    return f"inventory:{book_id}:pending"
+
+
+def idempotency_key(key: str) -> str:
+    return f"inventory:idem:{key}"
+
+
+# KEYS: dirty set, stock and pending key per book, then idempotency key or ""
+#       per reservation
+# ARGV: key ttl, number of books, book id per book, then per reservation its
+#       number of changes and (book index, change) per change
+# Reservations whose key is already set are skipped (a replay), the others
+# are applied all or none.
+# -> {1, stocks, indexes of the reservations applied}, {0, i} book i short
+_CHANGE = """
+local n = tonumber(ARGV[2])
+local totals, applied = {}, {}
+for i = 1, n do totals[i] = 0 end
+local a = 3 + n
+for r = 2 + 2 * n, #KEYS do
+    local fresh = KEYS[r] == '' or redis.call('EXISTS', KEYS[r]) == 0
+    local count = tonumber(ARGV[a])
+    if fresh then
+        applied[#applied + 1] = r - 1 - 2 * n
+        for e = 1, count do
+            local i = tonumber(ARGV[a + 2 * e - 1])
+            totals[i] = totals[i] + tonumber(ARGV[a + 2 * e])
+        end
+    end
+    a = a + 1 + 2 * count
+end
+for i = 1, n do
+    local stock = tonumber(redis.call('GET', KEYS[2 * i]) or '0')
+    if stock + totals[i] < 0 then return {0, i} end
+end
+local stocks = {}
+for i = 1, n do
+    stocks[i] = redis.call('INCRBY', KEYS[2 * i], totals[i])
+    if totals[i] ~= 0 then
+        redis.call('INCRBY', KEYS[1 + 2 * i], totals[i])
+        redis.call('SADD', KEYS[1], ARGV[2 + i])
+    end
+end
+for _, j in ipairs(applied) do
+    local key = KEYS[1 + 2 * n + j]
+    if key ~= '' then redis.call('SET', key, '1', 'EX', ARGV[1]) end
+end
+return {1, stocks, applied}
+"""
+
+# same layout; undoes reservations applied with _CHANGE and forgets their keys
+_UNDO = """
+local n = tonumber(ARGV[2])
+local a = 3 + n
+for r = 2 + 2 * n, #KEYS do
+    local count = tonumber(ARGV[a])
+    for e = 1, count do
+        local i = tonumber(ARGV[a + 2 * e - 1])
+        redis.call('DECRBY', KEYS[2 * i], ARGV[a + 2 * e])
+        redis.call('DECRBY', KEYS[1 + 2 * i], ARGV[a + 2 * e])
+        redis.call('SADD', KEYS[1], ARGV[2 + i])
+    end
+    if KEYS[r] ~= '' then redis.call('DEL', KEYS[r]) end
+    a = a + 1 + 2 * count
+end
+return 1
+"""
+
+# KEYS: dirty set, flushing hash; ARGV: new flush id
+# -> HGETALL of the flushing hash ('#id' plus book id -> delta), or {}
+_TAKE = """
+if redis.call('EXISTS', KEYS[2]) == 0 then
+    for _, id in ipairs(redis.call('SMEMBERS', KEYS[1])) do
+        local pending = 'inventory:' .. id .. ':pending'
+        local delta = tonumber(redis.call('GET', pending) or '0')
+        if delta ~= 0 then
+            redis.call('HSET', KEYS[2], id, delta)
+            redis.call('DECRBY', pending, delta)
+        end
+    end
+    redis.call('DEL', KEYS[1])
+    if redis.call('HLEN', KEYS[2]) == 0 then return {} end
+    redis.call('HSET', KEYS[2], '#id', ARGV[1])
+end
+return redis.call('HGETALL', KEYS[2])
+"""
+
+# KEYS: flushing hash; ARGV: flush id -> deletes it if still that flush
+_DONE = """
+if redis.call('HGET', KEYS[1], '#id') == ARGV[1] then return redis.call('DEL', KEYS[1]) end
+return 0
+"""
+
+_change = redis_client.register_script(_CHANGE)
+_undo = redis_client.register_script(_UNDO)
+_take = redis_client.register_script(_TAKE)
+_done = redis_client.register_script(_DONE)
+
+
+def _script_call(reservations: dict):
+    books = list(dict.fromkeys(book_id for changes in reservations.values() for book_id in changes))
+    index = {book_id: i for i, book_id in enumerate(books, 1)}
+    keys = [DIRTY_SET]
+    args = [HOT_INVENTORY_KEY_TTL, len(books), *books]
+    for book_id in books:
+        keys += [stock_key(book_id), pending_key(book_id)]
+    for key, changes in reservations.items():
+        keys.append(idempotency_key(key) if key else "")
+        args.append(len(changes))
+        for book_id, change in changes.items():
+            args += [index[book_id], change]
+    return books, keys, args
+
+
+async def hot_subset(book_ids) -> set:
+    """The books among `book_ids` whose stock is currently kept in Redis."""
+    book_ids = list(book_ids)
+    pipe = redis_client.pipeline(transaction=False)
+    for book_id in book_ids:
+        pipe.sismember(HOT_SET, book_id)
+        pipe.exists(stock_key(book_id))
+    flags = await pipe.execute()
+    return {book_id for i, book_id in enumerate(book_ids) if flags[2 * i] and flags[2 * i + 1]}
+
+
+async def change_stock(changes: dict, key: str | None = None) -> dict:
+    """
+    Applies stock changes to hot books, all or none. Returns the new stock
+    per book (the current one for a replayed key); raises InsufficientStock.
+    """
+    stock, _ = await change_reservations({key: changes})
+    return stock
+
+
+async def change_reservations(reservations: dict) -> tuple[dict, list]:
+    """
+    Applies several reservations at once, each {book_id: change} under its
+    own idempotency key (None for none). Those whose key was already applied
+    are skipped, the rest are applied all or none. Returns the new stock per
+    book and the keys applied now; raises InsufficientStock.
+    """
+    books, keys, args = _script_call(reservations)
+    result = await _change(keys=keys, args=args)
+    if result[0] == 0:
+        inventory_stats["rejected"] += 1
+        raise InsufficientStock(books[int(result[1]) - 1])
+    keys = list(reservations)
+    applied = [keys[int(j) - 1] for j in result[2]]
+    inventory_stats["reserved"] += len(applied)
+    inventory_stats["replayed"] += len(keys) - len(applied)
+    return {book_id: int(stock) for book_id, stock in zip(books, result[1])}, applied
+
+
+async def undo_change(changes: dict, key: str | None = None):
+    await undo_reservations({key: changes})
+
+
+async def undo_reservations(reservations: dict):
+    _, keys, args = _script_call(reservations)
+    await _undo(keys=keys, args=args)
+
+
+async def enable(db, book_id: str) -> bool:
+    """
+    Moves the book's stock into a Redis counter. False for an unknown book.
+
+    The row is flagged hot and locked in one transaction that commits only
+    after the counter is set from it. A database stock change either commits
+    before the stock is read, or waits for the lock, finds the flag and is
+    sent to Redis by the route (crud.HotStock), so none is missed.
+    """
+    if await hot_subset([book_id]):
+        return True
+    await flush_once()  # deltas left from an earlier hot period go to the row first
+    stock = await run_db(db, crud.begin_hot_inventory, book_id)
+    if stock is None:
+        await run_db(db, crud.end_transaction, False)
+        return False
+    try:
+        pipe = redis_client.pipeline(transaction=True)
+        pipe.set(stock_key(book_id), stock)
+        pipe.sadd(HOT_SET, book_id)
+        await pipe.execute()
+    except Exception:
+        await run_db(db, crud.end_transaction, False)
+        raise
+    try:
+        await run_db(db, crud.end_transaction, True)
+    except Exception:
+        await _forget(book_id)
+        raise
+    return True
+
+
+async def disable(book_id: str):
+    # the counter goes before the flush: a change that still finds the book
+    # hot then fails for want of stock (or only adds to pending, which is
+    # flushed as usual) instead of selling against a counter the database
+    # path no longer sees. Database changes are refused until the flag is
+    # cleared, after the flush, so the row is never changed from both sides.
+    await _forget(book_id)
+    await flush_once()
+    await run_in_session(crud.set_hot_inventory, book_id, False)
+
+
+async def _forget(book_id: str):
+    pipe = redis_client.pipeline(transaction=True)
+    pipe.srem(HOT_SET, book_id)
+    pipe.delete(stock_key(book_id))
+    await pipe.execute()
+
+
+async def flush_once() -> int:
+    """Writes pending deltas back to the database. Returns the number of books."""
+    entries = await _take(keys=[DIRTY_SET, FLUSHING], args=[uuid.uuid4().hex])
+    if not entries:
+        return 0
+    pairs = dict(zip(entries[::2], entries[1::2]))
+    flush_id = pairs.pop("#id")
+    deltas = {book_id: int(delta) for book_id, delta in pairs.items()}
+
+    books = await run_in_session(crud.apply_stock_deltas, deltas, f"inventory-flush:{flush_id}")
+    await _done(keys=[FLUSHING], args=[flush_id])
+
+    for book_id, _ in books:
+        await cache_delete(f"book:{book_id}")
+    await bump_list_generations(*(category for _, category in books))
+    inventory_stats["flushes"] += 1
+    inventory_stats["flushed_books"] += len(deltas)
+    return len(deltas)
+
+
+async def _flush_loop():
+    while True:
+        try:
+            await flush_once()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print("[Inventory] flush error:", e)
+        await asyncio.sleep(HOT_INVENTORY_FLUSH_MS / 1000)
+
+
+def start_flusher() -> asyncio.Task:
+    return asyncio.create_task(_flush_loop())
+
+
+async def _counter_state(book_id: str) -> tuple:
+    # counter, pending delta, and whether a flush of the book is in progress
+    pipe = redis_client.pipeline(transaction=True)
+    pipe.get(stock_key(book_id))
+    pipe.get(pending_key(book_id))
+    pipe.hexists(FLUSHING, book_id)
+    counter, pending, flushing = await pipe.execute()
+    return counter, int(pending or 0), bool(flushing)
+
+
+async def reconcile(fix: bool = False) -> list:
+    """
+    Flushes, then compares each hot counter with the database stock plus
+    what is still pending. Missing counters (Redis lost its data) are
+    re-seeded from the database; drifted ones are reset to it with fix=True.
+    Books with a flush in progress, or whose counters moved while the row
+    was read, are skipped: part of their delta may already be in the row.
+    Returns the drifted books as (book_id, counter, expected).
+    """
+    await flush_once()
+    # a book flagged on one side only (Redis lost its data, or an older
+    # version enabled it) is made hot on both
+    members = await redis_client.smembers(HOT_SET)
+    flagged = set(await run_in_session(crud.hot_inventory_book_ids))
+    for book_id in flagged - members:
+        await redis_client.sadd(HOT_SET, book_id)
+    for book_id in members - flagged:
+        await run_in_session(crud.set_hot_inventory, book_id, True)
+    drift = []
+    for book_id in members | flagged:
+        before = await _counter_state(book_id)
+        book = await run_in_session(crud.get_book, book_id)
+        if book is None:
+            await _forget(book_id)
+            continue
+        counter, pending, flushing = await _counter_state(book_id)
+        if flushing or before != (counter, pending, flushing):
+            print(f"[Inventory] {book_id} is being flushed or changed, not checked")
+            continue
+        expected = (book.stock_quantity or 0) + pending
+        if counter is None:
+            print(f"[Inventory] no counter for {book_id}, seeding {expected} from the database")
+            await redis_client.set(stock_key(book_id), expected, nx=True)
+        elif int(counter) != expected:
+            drift.append((book_id, int(counter), expected))
+            print(f"[Inventory] {book_id}: counter {counter}, database + pending {expected}")
+            if fix:
+                await redis_client.set(stock_key(book_id), expected)
+    return drift
+
+
+if __name__ == "__main__":
+    # python -m app.inventory [fix]
+    drifted = asyncio.run(reconcile(fix=sys.argv[1:] == ["fix"]))
+    print(f"[Inventory] {len(drifted)} drifted counters")
@@ -0,0 +1,65 @@
+import time
+from collections import OrderedDict
+
+from .config import L1_CACHE_TTL, L1_CACHE_MAX_ITEMS, L1_CACHE_MAX_BYTES
+
+# In-process LRU in front of Redis, bounded by entry count and by the size of
+# the JSON each entry was decoded from. Entries hold the decoded value, so a
+# hit costs neither a round trip nor json.loads. Replicas stay coherent through
+# the invalidation messages cache_delete publishes (see redis_utils); the TTL
+# only bounds staleness if one of those is missed.
+
+_entries: "OrderedDict[str, tuple[float, int, object]]" = OrderedDict()
+_bytes = 0
+# bumped on every invalidation; a fill started before one is dropped, so a
+# read racing a delete cannot put the old value back
+epoch = 0
+
+
+def get(key: str):
+    entry = _entries.get(key)
+    if entry is None:
+        return None
+    if entry[0] <= time.monotonic():
+        _drop(key)
+        return None
+    _entries.move_to_end(key)
+    return entry[2]
+
+
+def put(key: str, value, nbytes: int, read_epoch: int | None = None, ttl: float = L1_CACHE_TTL):
+    global _bytes
+    if read_epoch is not None and read_epoch != epoch:
+        return
+    if nbytes > L1_CACHE_MAX_BYTES:
+        return
+    _drop(key)
+    _entries[key] = (time.monotonic() + ttl, nbytes, value)
+    _bytes += nbytes
+    while len(_entries) > L1_CACHE_MAX_ITEMS or _bytes > L1_CACHE_MAX_BYTES:
+        _drop(next(iter(_entries)))
+
+
+def _drop(key: str):
+    global _bytes
+    entry = _entries.pop(key, None)
+    if entry is not None:
+        _bytes -= entry[1]
+
+
+def invalidate(*keys: str):
+    global epoch
+    epoch += 1
+    for key in keys:
+        _drop(key)
+
+
+def clear():
+    global epoch, _bytes
+    epoch += 1
+    _entries.clear()
+    _bytes = 0
+
+
+def stats() -> dict:
+    return {"items": len(_entries), "bytes": _bytes}
@@ -1,16 +1,71 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from .database import Base, engine
+from . import auth_cache, deps, events, inventory, l1_cache, rating_events, redis_utils, stock_keys
 from . import models as models
 from .routes import router as books_router
+from .search import ensure_search_index
+from .migrations import migrate
+from .serialization import FastJSONResponse
+from .config import HOT_INVENTORY
 
-app = FastAPI(title="BookHub Books Service", version="0.1.0")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    listener = auth_cache.start_invalidation_listener()
+    l1_listener = redis_utils.start_l1_invalidation_listener()
+    rating_listener = rating_events.start_rating_listener()
+    relay = events.start_relay()
+    pruner = stock_keys.start_pruner()
+    flusher = None
+    if HOT_INVENTORY:
+        # write back what a previous run left pending and check the counters
+        try:
+            await inventory.reconcile()
+        except Exception as e:
+            print("[Inventory] startup reconciliation failed:", e)
+        flusher = inventory.start_flusher()
+    yield
+    listener.cancel()
+    l1_listener.cancel()
+    rating_listener.cancel()
+    relay.cancel()
+    pruner.cancel()
+    if flusher is not None:
+        flusher.cancel()
+        try:
+            await inventory.flush_once()
+        except Exception as e:
+            print("[Inventory] final flush failed:", e)
+    await deps.http_client.aclose()
+
+
+app = FastAPI(title="BookHub Books Service", version="0.1.0", lifespan=lifespan, default_response_class=FastJSONResponse)
 
 # create tables
 Base.metadata.create_all(bind=engine)
+# bring databases created by older versions up to date
+migrate()
+ensure_search_index(engine)
 
 app.include_router(books_router)
 
 
 @app.get("/")
 def root():
-    return {"status": "Books service running"}
\ No newline at end of file
+    return {"status": "Books service running"}
+
+
+@app.get("/stats/cache")
+def cache_stats():
+    return {**redis_utils.cache_stats, "l1": l1_cache.stats()}
+
+
+@app.get("/stats/events")
+async def event_stats():
+    return await events.stats()
+
+
+@app.get("/stats/inventory")
+def inventory_stats():
+    return {"enabled": HOT_INVENTORY, **inventory.inventory_stats}
@@ -0,0 +1,99 @@
+"""
+Versioned schema migrations for the books database.
+
+create_all only creates missing tables, so changes to existing ones
+(columns, indexes) are numbered steps here. Each version runs once, in its
+own transaction, and is recorded in schema_migrations; steps are written to
+be harmless on a database create_all just built from the current models.
+Never edit an applied version - add a new one.
+
+    python -m app.migrations            # apply pending versions
+    python -m app.migrations status
+"""
+import sys
+from datetime import datetime, timezone
+
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import IntegrityError
+
+from .database import engine
+
+# composite indexes follow crud.list_books: equality filters first, then the
+# sort key, then id (the keyset tiebreaker)
+MIGRATIONS = [
+    (1, "listing indexes", [
+        "CREATE INDEX IF NOT EXISTS ix_books_created_at ON books (created_at, id)",
+        "CREATE INDEX IF NOT EXISTS ix_books_category_created_at ON books (category, created_at, id)",
+        "CREATE INDEX IF NOT EXISTS ix_books_category_price ON books (category, price, id)",
+        "CREATE INDEX IF NOT EXISTS ix_books_author_created_at ON books (author, created_at, id)",
+        "CREATE INDEX IF NOT EXISTS ix_books_price ON books (price, id)",
+        "CREATE INDEX IF NOT EXISTS ix_books_title ON books (title, id)",
+    ]),
+    (2, "rating columns", [
+        lambda conn: _add_columns(conn, "books", {
+            "average_rating": "FLOAT NOT NULL DEFAULT 0",
+            "review_count": "INTEGER NOT NULL DEFAULT 0",
+        }),
+        "CREATE INDEX IF NOT EXISTS ix_books_rating ON books (average_rating, id)",
+    ]),
+    (3, "rating version", [
+        lambda conn: _add_columns(conn, "books", {"rating_version": "INTEGER NOT NULL DEFAULT 0"}),
+    ]),
+    (4, "outbox event ids", [
+        lambda conn: _add_columns(conn, "outbox", {"event_id": "VARCHAR(36)"}),
+    ]),
+    (5, "hot inventory flag", [
+        lambda conn: _add_columns(conn, "books", {"hot_inventory": "BOOLEAN NOT NULL DEFAULT FALSE"}),
+    ]),
+]
+
+
+def _add_columns(conn, table: str, columns: dict):
+    existing = {c["name"] for c in inspect(conn).get_columns(table)}
+    for name, ddl in columns.items():
+        if name not in existing:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+
+
+def _ensure_table(conn):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version INTEGER PRIMARY KEY, name VARCHAR(255) NOT NULL, applied_at VARCHAR(40) NOT NULL)"
+    ))
+
+
+def applied_versions() -> set:
+    with engine.begin() as conn:
+        _ensure_table(conn)
+        return {row[0] for row in conn.execute(text("SELECT version FROM schema_migrations"))}
+
+
+def migrate():
+    done = applied_versions()
+    for version, name, steps in MIGRATIONS:
+        if version in done:
+            continue
+        try:
+            with engine.begin() as conn:
+                for step in steps:
+                    if isinstance(step, str):
+                        conn.execute(text(step))
+                    else:
+                        step(conn)
+                conn.execute(
+                    text("INSERT INTO schema_migrations (version, name, applied_at) VALUES (:v, :n, :t)"),
+                    {"v": version, "n": name, "t": datetime.now(timezone.utc).isoformat()},
+                )
+        except IntegrityError:
+            # another replica applied it first
+            continue
+        print(f"[Migrations] applied {version}: {name}")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["status"]:
+        done = applied_versions()
+        for version, name, _ in MIGRATIONS:
+            print(f"{version:>4} {'applied' if version in done else 'pending':8} {name}")
+    else:
+        migrate()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, Text, Date, DateTime, Numeric
+from sqlalchemy import Boolean, Column, String, Integer, Float, Text, Date, DateTime, Numeric, Index, false
 from sqlalchemy.sql import func
 from uuid import uuid4
 from .database import Base
@@ -23,6 +23,24 @@ class Book(Base):
     published_date = Column(Date)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    # read model of the reviews service's rating stats, kept by rating_events
+    average_rating = Column(Float, nullable=False, default=0, server_default="0")
+    review_count = Column(Integer, nullable=False, default=0, server_default="0")
+    rating_version = Column(Integer, nullable=False, default=0, server_default="0")
+    # mirrors inventory:hot; database stock changes skip flagged rows, so the
+    # flag is checked under the same row lock as the change (see inventory.py)
+    hot_inventory = Column(Boolean, nullable=False, default=False, server_default=false())
+
+    # also created on existing databases by migrations.py
+    __table_args__ = (
+        Index("ix_books_created_at", "created_at", "id"),
+        Index("ix_books_category_created_at", "category", "created_at", "id"),
+        Index("ix_books_category_price", "category", "price", "id"),
+        Index("ix_books_author_created_at", "author", "created_at", "id"),
+        Index("ix_books_price", "price", "id"),
+        Index("ix_books_title", "title", "id"),
+        Index("ix_books_rating", "average_rating", "id"),
+    )
 
 
 class Category(Base):
@@ -30,4 +48,26 @@ class Category(Base):
 
     id = Column(String(36), primary_key=True, default=uuid_str)
     name = Column(String(100), unique=True, nullable=False)
-    description = Column(Text)
\ No newline at end of file
+    description = Column(Text)
+
+
+class StockIdempotencyKey(Base):
+    # keys of applied stock changes (Idempotency-Key header), stored in the
+    # change's own transaction so a retried request is recognised
+    __tablename__ = "stock_idempotency_keys"
+
+    key = Column(String(255), primary_key=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+
+class OutboxEvent(Base):
+    # written in the same transaction as the change it describes; relayed to
+    # Redis Streams and deleted by events.py
+    __tablename__ = "outbox"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    # what consumers deduplicate on: SQLite hands out the ids of deleted rows
+    # again, and the relay deletes every row it sends
+    event_id = Column(String(36), default=uuid_str)
+    topic = Column(String(100), nullable=False)
+    payload = Column(Text, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
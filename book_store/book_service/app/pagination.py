@@ -0,0 +1,94 @@
+import base64
+from datetime import date, datetime
+from decimal import Decimal
+from typing import NamedTuple
+
+from sqlalchemy import DateTime, String, and_, or_, type_coerce
+
+from .serialization import dumps, loads
+
+# Keyset (cursor) pagination. Rows are ordered by a list of sort keys ending
+# in a unique column, and the next page starts strictly after the last row's
+# key values, so page N costs the same as page 1 (given an index on the keys).
+# The cursor is opaque to clients: base64 of the key values plus a signature of
+# the sort it was issued for, so it cannot be replayed against another sort.
+
+
+class SortKey(NamedTuple):
+    column: object  # column or SQL expression
+    desc: bool = False
+
+
+def encode_cursor(values: list, sort: str) -> str:
+    raw = dumps({"k": values, "s": sort})
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _restore(column, value):
+    # cursor values went through JSON; bind them with the column's own type
+    if value is None:
+        return None
+    try:
+        python_type = column.type.python_type
+    except (AttributeError, NotImplementedError):
+        return value
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    if python_type is date:
+        return date.fromisoformat(value)
+    if python_type in (Decimal, int, float, str):
+        return python_type(value)
+    return value
+
+
+def decode_cursor(cursor: str, keys: list[SortKey], sort: str) -> list:
+    """Raises ValueError for anything that is not a cursor for this sort."""
+    try:
+        payload = loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        values = payload["k"]
+        if payload["s"] != sort or len(values) != len(keys):
+            raise ValueError
+        return [_restore(key.column, value) for key, value in zip(keys, values)]
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def after(keys: list[SortKey], values: list):
+    # (k1, k2, ...) strictly after (v1, v2, ...) in the keys' own directions
+    clauses = []
+    for i, key in enumerate(keys):
+        equal = [k.column == v for k, v in zip(keys[:i], values[:i])]
+        step = key.column < values[i] if key.desc else key.column > values[i]
+        clauses.append(and_(*equal, step))
+    return or_(*clauses)
+
+
+def paginate(query, keys: list[SortKey], sort: str, cursor: str | None, limit: int):
+    """
+    Returns (items, next_cursor). Items are what `query` yields (entities, or
+    tuples when it selects several columns); next_cursor is None on the last
+    page. The query must not be ordered yet.
+    """
+    width = len(query.column_descriptions)
+    if query.session.get_bind().dialect.name == "sqlite":
+        # SQLite keeps datetimes as text, and CURRENT_TIMESTAMP defaults have
+        # no fraction while bound values do; compare the stored text itself
+        keys = [
+            SortKey(type_coerce(key.column, String), key.desc) if isinstance(key.column.type, DateTime) else key
+            for key in keys
+        ]
+    if cursor:
+        query = query.filter(after(keys, decode_cursor(cursor, keys, sort)))
+    rows = (
+        query.add_columns(*(key.column for key in keys))
+        .order_by(*(key.column.desc() if key.desc else key.column.asc() for key in keys))
+        .limit(limit + 1)
+        .all()
+    )
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(list(rows[-1][width:]), sort)
+    items = [row[0] if width == 1 else tuple(row[:width]) for row in rows]
+    return items, next_cursor
@@ -0,0 +1,39 @@
+import asyncio
+
+from . import crud
+from .database import run_in_session
+from .events import start_consumer
+from .redis_utils import bump_list_generations, cache_delete
+
+# Keeps books.average_rating / review_count in step with the reviews service,
+# read from its review.* event streams as the consumer group books.ratings.
+# Each event carries the book's totals after the write, so applying one twice
+# (delivery is at-least-once) is harmless and book reads never call reviews.
+# The totals are versioned per book, and the three topics are separate
+# streams, so an event older than the stored version is dropped rather than
+# rolling the book back. Events from before versioning count as version 0.
+# A real change drops the book's cached detail and bumps the list generations,
+# so rating sorts and filters on listing pages see it straight away.
+
+RATING_GROUP = "books.ratings"
+RATING_TOPICS = ("review.created", "review.updated", "review.deleted")
+
+
+async def handle_event(topic: str, payload: dict):
+    book_id = payload.get("book_id")
+    if not book_id or "review_count" not in payload:
+        return
+    changed, category = await run_in_session(
+        crud.apply_rating_stats,
+        book_id,
+        int(payload["review_count"]),
+        int(payload["rating_sum"]),
+        int(payload.get("version", 0)),
+    )
+    if changed:
+        await cache_delete(f"book:{book_id}")
+        await bump_list_generations(category)
+
+
+def start_rating_listener() -> asyncio.Task:
+    return start_consumer(RATING_GROUP, RATING_TOPICS, handle_event)
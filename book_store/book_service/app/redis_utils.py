@@ -1,49 +1,354 @@
-import os
-import json
+import asyncio
+import functools
 import hashlib
+import inspect
+import json
+import math
+import os
+import random
+import time
+import uuid
+from typing import NamedTuple
+
+from fastapi import Request, Response
+from pydantic import BaseModel
 
-from .config import USE_FAKEREDIS, REDIS_URL
+from .config import (
+    USE_FAKEREDIS,
+    REDIS_URL,
+    CACHE_STALE_TTL,
+    CACHE_EARLY_REFRESH_BETA,
+    CACHE_LOCK_TTL_MS,
+    CACHE_LOCK_WAIT_MS,
+    CACHE_LOCK_WAIT_STEPS,
+    L1_CACHE_TTL,
+)
+from . import l1_cache
+from .serialization import dumps, loads
 
 if USE_FAKEREDIS:
-    import fakeredis
+    from fakeredis import aioredis
 
-    redis_client = fakeredis.FakeStrictRedis(decode_responses=True)
+    redis_client = aioredis.FakeRedis(decode_responses=True)
     print("[BooksService] Using fakeredis (in-memory)")
 else:
-    import redis
+    import redis.asyncio as redis
 
     redis_client = redis.from_url(REDIS_URL, decode_responses=True)
     print("[BooksService] Using real Redis:", REDIS_URL)
 
 
-def cache_set(key: str, value: dict, ttl: int):
+async def cache_set(key: str, value: dict, ttl: int):
     try:
-        redis_client.set(key, json.dumps(value), ex=ttl)
+        data = dumps(value)
+        await redis_client.set(key, data, ex=ttl)
+        l1_cache.put(key, value, len(data), ttl=min(ttl, L1_CACHE_TTL))
     except Exception as e:
         print("[Redis] cache_set error:", e)
 
 
-def cache_get(key: str):
+async def cache_get(key: str):
+    value = l1_cache.get(key)
+    if value is not None:
+        return value
+    read_epoch = l1_cache.epoch
     try:
-        data = redis_client.get(key)
-        return json.loads(data) if data else None
+        data = await redis_client.get(key)
+        if not data:
+            return None
+        value = loads(data)
+        l1_cache.put(key, value, len(data), read_epoch)
+        return value
     except Exception as e:
         print("[Redis] cache_get error:", e)
         return None
 
 
-def cache_delete(key: str):
+async def cache_delete(key: str):
+    l1_cache.invalidate(key)
     try:
-        redis_client.delete(key)
+        await redis_client.delete(key)
+        await redis_client.publish(L1_INVALIDATION_CHANNEL, dumps({"keys": [key], "origin": INSTANCE_ID}))
     except Exception as e:
         print("[Redis] cache_delete error:", e)
 
 
+# ---------- L1 coherence ---------- #
+
+L1_INVALIDATION_CHANNEL = "books.cache.invalidate"
+INSTANCE_ID = uuid.uuid4().hex
+
+
+async def _listen_l1_invalidations():
+    while True:
+        try:
+            pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+            await pubsub.subscribe(L1_INVALIDATION_CHANNEL)
+            # anything published while we were not subscribed is lost
+            l1_cache.clear()
+            async for message in pubsub.listen():
+                payload = loads(message["data"])
+                if payload.get("origin") != INSTANCE_ID:
+                    l1_cache.invalidate(*payload.get("keys", ()))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print("[Redis] L1 invalidation listener error:", e)
+            await asyncio.sleep(1)
+
+
+def start_l1_invalidation_listener() -> asyncio.Task:
+    return asyncio.create_task(_listen_l1_invalidations())
+
+
 def make_filters_hash(filters: dict) -> str:
     encoded = json.dumps(filters, sort_keys=True)
     return hashlib.md5(encoded.encode("utf-8")).hexdigest()[0:10]
 
 
-def publish_event(topic: str, payload: dict):
-    # For now just print; you can later wire to real pub/sub
-    print(f"[PUB] topic={topic} payload={payload}")
\ No newline at end of file
+# Listing pages embed a generation number in their key. Writes bump it, which
+# orphans every page of that scope at once (old keys just age out). Pages
+# filtered by category use that category's own generation, so a write only
+# touches the catalogue-wide pages and its own category.
+LIST_GENERATION_KEY = "books:list:gen"
+
+
+def list_generation_key(category: str | None = None) -> str:
+    return f"{LIST_GENERATION_KEY}:cat:{category}" if category else LIST_GENERATION_KEY
+
+
+async def get_list_generation(category: str | None = None):
+    try:
+        return int(await redis_client.get(list_generation_key(category)) or 0)
+    except Exception as e:
+        print("[Redis] get_list_generation error:", e)
+        return None
+
+
+async def bump_list_generations(*categories: str | None):
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.incr(LIST_GENERATION_KEY)
+        for category in {c for c in categories if c}:
+            pipe.incr(list_generation_key(category))
+        await pipe.execute()
+    except Exception as e:
+        print("[Redis] bump_list_generations error:", e)
+
+
+# ---------- cached(): stampede-protected read-through cache ---------- #
+#
+# Values are stored as {"v": value, "exp": soft expiry, "d": compute seconds}
+# with a Redis TTL of ttl + stale_ttl:
+#   * fresh hit      -> served; refreshed early in the background with a
+#                       probability that grows as expiry nears (XFetch)
+#   * stale hit      -> served as is while one background task recomputes
+#   * miss           -> one caller per key recomputes (in-process futures plus
+#                       a short Redis lock across replicas), the rest wait
+# Loaders must not use request-scoped resources: background refreshes run
+# after the response is sent (see database.run_in_session).
+
+# Rendered mode (cached(render=True)) keeps the response body itself: the
+# JSON bytes plus their ETag, stored in Redis as "R1 <exp> <d> <etag>\n<body>".
+# Hits go out through cached_response() as a raw Response, skipping decode,
+# response_model validation and re-encoding.
+
+RENDERED_PREFIX = "R1 "
+
+
+class CachedBody(NamedTuple):
+    body: bytes
+    etag: str
+
+
+def render_body(value) -> CachedBody | None:
+    if value is None:
+        return None
+    if isinstance(value, BaseModel):
+        body = value.model_dump_json().encode("utf-8")
+    else:
+        body = dumps(value)
+    return CachedBody(body, f'"{hashlib.md5(body).hexdigest()}"')
+
+
+def cached_response(request: Request, cached: CachedBody) -> Response:
+    headers = {"ETag": cached.etag}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and cached.etag in {tag.strip() for tag in if_none_match.split(",")}:
+        return Response(status_code=304, headers=headers)
+    return Response(cached.body, media_type="application/json", headers=headers)
+
+
+def _decode_entry(data: str):
+    if data.startswith(RENDERED_PREFIX):
+        header, body = data.split("\n", 1)
+        _, exp, delta, etag = header.split(" ")
+        return {"v": CachedBody(body.encode("utf-8"), etag), "exp": float(exp), "d": float(delta)}
+    entry = loads(data)
+    return entry if isinstance(entry, dict) and "exp" in entry else None
+
+
+def _encode_entry(entry: dict) -> str:
+    value = entry["v"]
+    if isinstance(value, CachedBody):
+        return f"{RENDERED_PREFIX}{entry['exp']} {entry['d']} {value.etag}\n{value.body.decode('utf-8')}"
+    return dumps(entry)
+
+
+cache_stats = {"l1_hit": 0, "hit": 0, "stale": 0, "miss": 0, "recompute": 0, "error": 0}
+_inflight: dict[str, asyncio.Future] = {}
+_refreshing: set[str] = set()
+_background: set[asyncio.Task] = set()
+
+
+async def _read_entry(key: str):
+    entry = l1_cache.get(key)
+    if entry is not None:
+        cache_stats["l1_hit"] += 1
+        return entry
+    read_epoch = l1_cache.epoch
+    try:
+        data = await redis_client.get(key)
+        entry = _decode_entry(data) if data else None
+        if entry is None:
+            return None
+        l1_cache.put(key, entry, len(data), read_epoch)
+        return entry
+    except Exception as e:
+        cache_stats["error"] += 1
+        print("[Cache] read error:", e)
+        return None
+
+
+async def _compute(key: str, loader, ttl: int, stale_ttl: int):
+    read_epoch = l1_cache.epoch
+    start = time.monotonic()
+    value = await loader()
+    if isinstance(value, BaseModel):
+        value = value.model_dump(mode="json")
+    cache_stats["recompute"] += 1
+    if value is None:
+        return None
+
+    entry = {"v": value, "exp": time.time() + ttl, "d": time.monotonic() - start}
+    data = _encode_entry(entry)
+    l1_cache.put(key, entry, len(data), read_epoch)
+    try:
+        await redis_client.set(key, data, ex=ttl + stale_ttl)
+    except Exception as e:
+        cache_stats["error"] += 1
+        print("[Cache] write error:", e)
+    return value
+
+
+async def _acquire_lock(key: str) -> bool:
+    try:
+        return bool(await redis_client.set(f"lock:{key}", "1", nx=True, px=CACHE_LOCK_TTL_MS))
+    except Exception:
+        return True  # no Redis, no cross-replica coordination
+
+
+async def _release_lock(key: str):
+    try:
+        await redis_client.delete(f"lock:{key}")
+    except Exception:
+        pass
+
+
+async def _load_once(key: str, loader, ttl: int, stale_ttl: int):
+    pending = _inflight.get(key)
+    if pending is not None:
+        return await asyncio.shield(pending)
+
+    pending = asyncio.get_running_loop().create_future()
+    _inflight[key] = pending
+    try:
+        if not await _acquire_lock(key):
+            # another replica is computing it; give it a moment to land
+            for _ in range(CACHE_LOCK_WAIT_STEPS):
+                await asyncio.sleep(CACHE_LOCK_WAIT_MS / 1000)
+                entry = await _read_entry(key)
+                if entry is not None:
+                    pending.set_result(entry["v"])
+                    return entry["v"]
+            value = await _compute(key, loader, ttl, stale_ttl)
+        else:
+            try:
+                value = await _compute(key, loader, ttl, stale_ttl)
+            finally:
+                await _release_lock(key)
+        pending.set_result(value)
+        return value
+    except BaseException as e:
+        pending.set_exception(e)
+        pending.exception()  # mark retrieved when nobody else was waiting
+        raise
+    finally:
+        _inflight.pop(key, None)
+
+
+def _refresh_in_background(key: str, loader, ttl: int, stale_ttl: int):
+    if key in _refreshing:
+        return
+
+    async def refresh():
+        try:
+            if await _acquire_lock(key):
+                try:
+                    await _compute(key, loader, ttl, stale_ttl)
+                finally:
+                    await _release_lock(key)
+        except Exception as e:
+            cache_stats["error"] += 1
+            print("[Cache] background refresh error:", e)
+        finally:
+            _refreshing.discard(key)
+
+    _refreshing.add(key)
+    task = asyncio.create_task(refresh())
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+
+
+async def get_or_compute(key: str, loader, ttl: int, stale_ttl: int = CACHE_STALE_TTL, beta: float = CACHE_EARLY_REFRESH_BETA):
+    entry = await _read_entry(key)
+    if entry is not None:
+        remaining = entry["exp"] - time.time()
+        if remaining > 0:
+            cache_stats["hit"] += 1
+            # XFetch: -delta * beta * ln(rand) grows past `remaining` more often near expiry
+            if -entry.get("d", 0) * beta * math.log(random.random() or 1e-12) >= remaining:
+                _refresh_in_background(key, loader, ttl, stale_ttl)
+            return entry["v"]
+        cache_stats["stale"] += 1
+        _refresh_in_background(key, loader, ttl, stale_ttl)
+        return entry["v"]
+
+    cache_stats["miss"] += 1
+    return await _load_once(key, loader, ttl, stale_ttl)
+
+
+def cached(key, ttl: int, stale_ttl: int = CACHE_STALE_TTL, beta: float = CACHE_EARLY_REFRESH_BETA, render: bool = False):
+    """
+    Decorates an async loader. `key` gets the loader's arguments and returns
+    the cache key (or an awaitable of it); None skips the cache. Models are
+    stored and returned as JSON-ready dicts, or as a CachedBody with
+    render=True; None results are not cached.
+    """
+    def decorator(fn):
+        async def load(*args, **kwargs):
+            value = await fn(*args, **kwargs)
+            if render:
+                return render_body(value)
+            return value.model_dump(mode="json") if isinstance(value, BaseModel) else value
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            cache_key = key(*args, **kwargs)
+            if inspect.isawaitable(cache_key):
+                cache_key = await cache_key
+            if cache_key is None:
+                return await load(*args, **kwargs)
+            return await get_or_compute(cache_key, lambda: load(*args, **kwargs), ttl, stale_ttl, beta)
+        return wrapper
+    return decorator
@@ -1,40 +1,43 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query, Header
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Header, Request
 from math import ceil
+from datetime import datetime, timezone
 
-from .database import get_db
-from . import crud, models, schemas
+from .database import DBSession, get_db, run_db, run_in_session
+from . import crud, inventory, models, schemas
 from .deps import get_current_user, require_admin
 from .redis_utils import (
-    cache_get,
-    cache_set,
+    cached,
+    cached_response,
     cache_delete,
     make_filters_hash,
-    publish_event,
+    get_list_generation,
+    bump_list_generations,
 )
-from .config import INTERNAL_SERVICE_SECRET
+from .config import INTERNAL_SERVICE_SECRET, BOOK_LIST_CACHE_TTL, HOT_INVENTORY
 
 router = APIRouter(prefix="/api/v1/books", tags=["books"])
 
 
 @router.post("", response_model=schemas.BookDetail, status_code=201)
-def create_book(
+async def create_book(
     payload: schemas.BookCreate,
-    db: Session = Depends(get_db),
+    db: DBSession = Depends(get_db),
     admin: dict = Depends(require_admin),
 ):
     try:
-        book = crud.create_book(db, payload)
+        book = await run_db(db, crud.create_book, payload)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-    # clear listing caches & publish event
-    publish_event("book.created", {"book_id": book.id})
+    # clear listing caches
+    await bump_list_generations(book.category)
+    await cache_delete("categories:all")
     return book
 
 
 @router.get("", response_model=schemas.PaginatedBooks)
-def list_books(
+async def list_books(
+    request: Request,
     page: int = Query(1, ge=1),
     limit: int = Query(20, ge=1, le=100),
     category: str | None = None,
@@ -42,12 +45,13 @@ def list_books(
     search: str | None = None,
     min_price: float | None = None,
     max_price: float | None = None,
-    sort_by: str | None = Query(None, regex="^(price|title|published_date)$"),
+    sort_by: str | None = Query(None, regex="^(price|title|published_date|rating)$"),
     sort_order: str = Query("asc", regex="^(asc|desc)$"),
-    db: Session = Depends(get_db),
+    paging: str = Query("offset", regex="^(offset|cursor)$"),
+    cursor: str | None = None,
+    include_total: bool = False,
 ):
     filters = {
-        "page": page,
         "limit": limit,
         "category": category,
         "author": author,
@@ -57,48 +61,67 @@ def list_books(
         "sort_by": sort_by,
         "sort_order": sort_order,
     }
-    filters_hash = make_filters_hash(filters)
-    cache_key = f"books:list:{page}:{filters_hash}"
+    if cursor or paging == "cursor":
+        try:
+            body = await load_books_cursor_page({**filters, "cursor": cursor, "include_total": include_total})
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return cached_response(request, body)
 
-    cached = cache_get(cache_key)
-    if cached:
-        return cached
+    return cached_response(request, await load_books_page({**filters, "page": page}))
 
-    items, total = crud.list_books(
-        db,
-        page=page,
-        limit=limit,
-        category=category,
-        author=author,
-        search=search,
-        min_price=min_price,
-        max_price=max_price,
-        sort_by=sort_by,
-        sort_order=sort_order,
-    )
 
-    pages = ceil(total / limit) if limit else 1
+async def books_page_key(filters: dict, kind: str = "list"):
+    generation = await get_list_generation(filters["category"])
+    if generation is None:
+        return None
+    scope = f"cat:{filters['category']}" if filters["category"] else "all"
+    key = f"books:{kind}:{scope}:{generation}"
+    if kind == "list":
+        key += f":{filters.get('page', 'cursor')}"
+    return f"{key}:{make_filters_hash(filters)}"
 
-    resp = schemas.PaginatedBooks(
+
+@cached(key=books_page_key, ttl=BOOK_LIST_CACHE_TTL, render=True)
+async def load_books_page(filters: dict):
+    items, total = await run_in_session(crud.list_books, **filters)
+    limit = filters["limit"]
+    return schemas.PaginatedBooks(
         items=items,
         total=total,
-        page=page,
+        page=filters["page"],
         limit=limit,
-        pages=pages,
+        pages=ceil(total / limit) if limit else 1,
     )
-    cache_set(cache_key, resp.dict(), ttl=15 * 60)
-    return resp
 
 
+COUNT_FILTERS = ("category", "author", "search", "min_price", "max_price")
+
+
+@cached(key=books_page_key, ttl=BOOK_LIST_CACHE_TTL, render=True)
+async def load_books_cursor_page(filters: dict):
+    params = {k: v for k, v in filters.items() if k != "include_total"}
+    items, next_cursor = await run_in_session(crud.list_books_keyset, **params)
+    total = None
+    if filters["include_total"]:
+        total = await count_books({k: filters[k] for k in COUNT_FILTERS})
+    return schemas.PaginatedBooks(items=items, total=total, limit=filters["limit"], next_cursor=next_cursor)
+
+
+# counts change only with writes, so the generation keeps them exact
+@cached(key=lambda filters: books_page_key(filters, kind="count"), ttl=BOOK_LIST_CACHE_TTL)
+async def count_books(filters: dict):
+    return await run_in_session(crud.count_books, **filters)
+
 
 @router.get("/categories", response_model=schemas.CategoriesResponse)
-def get_categories(db: Session = Depends(get_db)):
-    cache_key = "categories:all"
-    print("called")
-    cached = cache_get(cache_key)
-    if cached:
-        return cached
-    rows = crud.get_categories_with_counts(db)
+async def get_categories(request: Request):
+    return cached_response(request, await load_categories())
+
+
+@cached(key=lambda: "categories:all", ttl=24 * 60 * 60, render=True)
+async def load_categories():
+    rows = await run_in_session(crud.get_categories_with_counts)
     categories = [
         schemas.CategoryOut(
             id=row.id,
@@ -108,89 +131,228 @@ def get_categories(db: Session = Depends(get_db)):
         )
         for row in rows
     ]
-    resp = schemas.CategoriesResponse(categories=categories)
-    cache_set(cache_key, resp.dict(), ttl=24 * 60 * 60)
-    return resp
+    return schemas.CategoriesResponse(categories=categories)
 
 
-@router.get("/{book_id}", response_model=schemas.BookDetail)
-def get_book(
-    book_id: str,
-    db: Session = Depends(get_db),
+@router.post("/batch", response_model=schemas.BookBatchResponse)
+async def get_books_batch(
+    payload: schemas.BookBatchRequest,
+    db: DBSession = Depends(get_db),
 ):
-    cache_key = f"book:{book_id}"
-    cached = cache_get(cache_key)
-    if cached:
-        return cached
+    if len(payload.ids) > 100:
+        raise HTTPException(status_code=400, detail="At most 100 ids per batch")
 
-    book = crud.get_book(db, book_id)
-    if not book:
+    books = await run_db(db, crud.get_books, payload.ids)
+    found = {book.id for book in books}
+    return schemas.BookBatchResponse(
+        items=[schemas.BookDetail.from_orm(book) for book in books],
+        missing=[book_id for book_id in dict.fromkeys(payload.ids) if book_id not in found],
+    )
+
+
+@router.get("/{book_id}", response_model=schemas.BookDetail)
+async def get_book(book_id: str, request: Request):
+    detail = await load_book_detail(book_id)
+    if detail is None:
         raise HTTPException(status_code=404, detail="Book not found")
+    return cached_response(request, detail)
+
+
+@cached(key=lambda book_id: f"book:{book_id}", ttl=60 * 60, render=True)
+async def load_book_detail(book_id: str):
+    book = await run_in_session(crud.get_book, book_id)
+    if not book:
+        return None
 
-    # TODO: later enrich with average_rating & review_count from Reviews service
-    detail = schemas.BookDetail.from_orm(book)
-    cache_set(cache_key, detail.dict(), ttl=60 * 60)
-    return detail
+    return schemas.BookDetail.from_orm(book)
 
 
 @router.put("/{book_id}", response_model=schemas.BookDetail)
-def update_book(
+async def update_book(
     book_id: str,
     payload: schemas.BookUpdate,
-    db: Session = Depends(get_db),
+    db: DBSession = Depends(get_db),
     admin: dict = Depends(require_admin),
 ):
-    book = crud.get_book(db, book_id)
+    book = await run_db(db, crud.get_book, book_id)
     if not book:
         raise HTTPException(status_code=404, detail="Book not found")
 
-    book = crud.update_book(db, book, payload)
+    # a hot book's live stock is its Redis counter, which a plain write to
+    # the row would not change; stock goes through PATCH /stock instead
+    if HOT_INVENTORY and "stock_quantity" in payload.dict(exclude_unset=True) and await inventory.hot_subset([book_id]):
+        raise HTTPException(
+            status_code=409,
+            detail="Stock of this book is held in hot inventory; use PATCH /stock or DELETE /hot first",
+        )
+
+    old_category = book.category
+    book = await run_db(db, crud.update_book, book, payload)
     # invalidate caches
-    cache_delete(f"book:{book_id}")
-    # in real life, also clear list caches; here we skip or rely on TTL
-    publish_event("book.updated", {"book_id": book.id})
+    await cache_delete(f"book:{book_id}")
+    await bump_list_generations(old_category, book.category)
+    if old_category != book.category:
+        await cache_delete("categories:all")
     return schemas.BookDetail.from_orm(book)
 
 
 @router.delete("/{book_id}", status_code=204)
-def delete_book(
+async def delete_book(
     book_id: str,
-    db: Session = Depends(get_db),
+    db: DBSession = Depends(get_db),
     admin: dict = Depends(require_admin),
 ):
-    book = crud.get_book(db, book_id)
+    book = await run_db(db, crud.get_book, book_id)
     if not book:
         raise HTTPException(status_code=404, detail="Book not found")
-    crud.delete_book(db, book)
-    cache_delete(f"book:{book_id}")
+    category = book.category
+    if HOT_INVENTORY:
+        # otherwise its counter would keep taking reservations for a book
+        # that is gone
+        await inventory.disable(book_id)
+    await run_db(db, crud.delete_book, book)
+    await cache_delete(f"book:{book_id}")
+    await bump_list_generations(category)
+    await cache_delete("categories:all")
     return
 
 
+# a book is between hot inventory and the database (PUT/DELETE /hot running)
+HOT_SWITCH_DETAIL = "Stock of this book is being moved, try again"
+
+
+async def _change_hot_stock(book_id: str, quantity_change: int, idempotency_key: str | None):
+    try:
+        stock = await inventory.change_stock({book_id: quantity_change}, idempotency_key)
+    except inventory.InsufficientStock:
+        raise HTTPException(status_code=400, detail="Insufficient stock")
+    # the database and caches catch up when the flusher runs
+    return schemas.StockUpdateResponse(
+        id=book_id, stock_quantity=stock[book_id], updated_at=datetime.now(timezone.utc)
+    )
+
+
 @router.patch("/{book_id}/stock", response_model=schemas.StockUpdateResponse)
-def update_stock(
+async def update_stock(
     book_id: str,
     payload: schemas.StockUpdateRequest,
-    db: Session = Depends(get_db),
+    db: DBSession = Depends(get_db),
     x_internal_secret: str = Header(default=None, alias="X-Internal-Secret"),
+    idempotency_key: str | None = Header(default=None, alias="Idempotency-Key"),
 ):
     if x_internal_secret != INTERNAL_SERVICE_SECRET:
         raise HTTPException(status_code=403, detail="Forbidden")
 
-    book = crud.get_book(db, book_id)
-    if not book:
-        raise HTTPException(status_code=404, detail="Book not found")
+    if HOT_INVENTORY and await inventory.hot_subset([book_id]):
+        return await _change_hot_stock(book_id, payload.quantity_change, idempotency_key)
 
     try:
-        book = crud.update_stock(db, book, payload.quantity_change)
+        book = await run_db(db, crud.update_stock, book_id, payload.quantity_change, idempotency_key)
+    except LookupError:
+        raise HTTPException(status_code=404, detail="Book not found")
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    except crud.HotStock:
+        # made hot since the check above
+        if not await inventory.hot_subset([book_id]):
+            raise HTTPException(status_code=503, detail=HOT_SWITCH_DETAIL)
+        return await _change_hot_stock(book_id, payload.quantity_change, idempotency_key)
 
-    cache_delete(f"book:{book_id}")
-    if (book.stock_quantity or 0) < 10:
-        publish_event("book.stock_low", {"book_id": book.id, "stock_quantity": book.stock_quantity})
+    await cache_delete(f"book:{book_id}")
+    await bump_list_generations(book.category)
 
     return schemas.StockUpdateResponse(
         id=book.id,
         stock_quantity=book.stock_quantity,
         updated_at=book.updated_at,
-    )
\ No newline at end of file
+    )
+
+
+@router.patch("/stock/batch", response_model=schemas.StockBatchResponse)
+async def update_stock_batch(
+    payload: schemas.StockBatchRequest,
+    db: DBSession = Depends(get_db),
+    x_internal_secret: str = Header(default=None, alias="X-Internal-Secret"),
+    idempotency_key: str | None = Header(default=None, alias="Idempotency-Key"),
+):
+    if x_internal_secret != INTERNAL_SERVICE_SECRET:
+        raise HTTPException(status_code=403, detail="Forbidden")
+    if not payload.items:
+        raise HTTPException(status_code=400, detail="No items")
+
+    # items are grouped into reservations by idempotency key; each is applied
+    # at most once, and repeated book ids within one are merged
+    reservations: dict[str | None, dict[str, int]] = {}
+    for item in payload.items:
+        changes = reservations.setdefault(item.idempotency_key or idempotency_key, {})
+        changes[item.book_id] = changes.get(item.book_id, 0) + item.quantity_change
+    book_ids = list(dict.fromkeys(item.book_id for item in payload.items))
+
+    # a book made hot while the batch ran fails it with HotStock; it is
+    # split again once, by then the switch has normally finished
+    for _ in range(2):
+        try:
+            results = await _apply_reservations(db, reservations, book_ids)
+        except crud.HotStock:
+            continue
+        return schemas.StockBatchResponse(items=[results[book_id] for book_id in book_ids])
+    raise HTTPException(status_code=503, detail=HOT_SWITCH_DETAIL)
+
+
+async def _apply_reservations(db, reservations: dict, book_ids: list) -> dict:
+    # hot books are changed in Redis first and undone if the rest fails
+    hot = await inventory.hot_subset(book_ids) if HOT_INVENTORY else set()
+    hot_reservations, db_reservations = {}, {}
+    for key, changes in reservations.items():
+        for book_id, change in changes.items():
+            (hot_reservations if book_id in hot else db_reservations).setdefault(key, {})[book_id] = change
+    now = datetime.now(timezone.utc)
+    results: dict[str, schemas.StockUpdateResponse] = {}
+
+    if hot_reservations:
+        try:
+            stock, applied = await inventory.change_reservations(hot_reservations)
+        except inventory.InsufficientStock as e:
+            book = await run_db(db, crud.get_book, e.book_id)
+            raise HTTPException(status_code=400, detail=f"Insufficient stock for book {book.title if book else e.book_id}")
+        for book_id, quantity in stock.items():
+            results[book_id] = schemas.StockUpdateResponse(id=book_id, stock_quantity=quantity, updated_at=now)
+
+    if db_reservations:
+        try:
+            books = await run_db(db, crud.update_stock_batch, db_reservations)
+        except (LookupError, ValueError, crud.HotStock) as e:
+            if hot_reservations:
+                await inventory.undo_reservations({key: hot_reservations[key] for key in applied})
+            if isinstance(e, crud.HotStock):
+                raise
+            raise HTTPException(status_code=404 if isinstance(e, LookupError) else 400, detail=str(e))
+
+        await bump_list_generations(*(book.category for book in books))
+        for book in books:
+            await cache_delete(f"book:{book.id}")
+            results[book.id] = schemas.StockUpdateResponse(
+                id=book.id, stock_quantity=book.stock_quantity, updated_at=book.updated_at
+            )
+
+    return results
+
+
+@router.put("/{book_id}/hot", status_code=204)
+async def enable_hot_inventory(
+    book_id: str,
+    db: DBSession = Depends(get_db),
+    admin: dict = Depends(require_admin),
+):
+    if not HOT_INVENTORY:
+        raise HTTPException(status_code=409, detail="Hot inventory is disabled")
+    if not await inventory.enable(db, book_id):
+        raise HTTPException(status_code=404, detail="Book not found")
+
+
+@router.delete("/{book_id}/hot", status_code=204)
+async def disable_hot_inventory(
+    book_id: str,
+    admin: dict = Depends(require_admin),
+):
+    await inventory.disable(book_id)
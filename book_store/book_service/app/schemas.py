@@ -36,6 +36,8 @@ class BookListItem(BaseModel):
     price: condecimal(max_digits=10, decimal_places=2)
     stock_quantity: int
     category: Optional[str]
+    average_rating: Optional[float] = None
+    review_count: Optional[int] = None
 
     model_config={"from_attributes":True}
 
@@ -47,7 +49,7 @@ class BookDetail(BookBase):
     id: str
     created_at: Optional[datetime]
     updated_at: Optional[datetime]
-    # These can be filled later from Reviews service; for now optional
+    # kept from the reviews service's review.* events (see rating_events)
     average_rating: Optional[float] = None
     review_count: Optional[int] = None
 
@@ -59,10 +61,12 @@ class BookDetail(BookBase):
 
 class PaginatedBooks(BaseModel):
     items: list[BookListItem]
-    total: int
-    page: int
+    # cursor paging: total only with include_total, no page/pages
+    total: Optional[int] = None
+    page: Optional[int] = None
     limit: int
-    pages: int
+    pages: Optional[int] = None
+    next_cursor: Optional[str] = None
 
 
 class CategoryOut(BaseModel):
@@ -88,4 +92,29 @@ class StockUpdateRequest(BaseModel):
 class StockUpdateResponse(BaseModel):
     id: str
     stock_quantity: int
-    updated_at: Optional[datetime]
\ No newline at end of file
+    updated_at: Optional[datetime]
+
+
+class BookBatchRequest(BaseModel):
+    ids: List[str]
+
+
+class BookBatchResponse(BaseModel):
+    items: List[BookDetail]
+    missing: List[str] = []
+
+
+class StockBatchItem(BaseModel):
+    book_id: str
+    quantity_change: int
+    # groups items into separately idempotent reservations; items without
+    # one fall under the request's Idempotency-Key header
+    idempotency_key: Optional[str] = None
+
+
+class StockBatchRequest(BaseModel):
+    items: List[StockBatchItem]
+
+
+class StockBatchResponse(BaseModel):
+    items: List[StockUpdateResponse]
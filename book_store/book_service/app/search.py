@@ -0,0 +1,146 @@
+import re
+
+from sqlalchemy import Float, Integer, func, literal_column, or_, text
+from sqlalchemy.engine import Engine
+
+from .config import BOOK_SEARCH_FTS
+from . import models
+from .pagination import SortKey
+
+# Full-text search over title, author and description.
+#   SQLite:   external-content FTS5 table books_fts, kept in sync by triggers
+#             on books, ranked with bm25 (title > author > description).
+#   Postgres: generated tsvector column books.search_vector with a GIN index,
+#             ranked with ts_rank_cd using the same weights.
+# Every search word is matched as a prefix, all of them must match. When the
+# index is not available (other databases, SQLite without FTS5, or
+# BOOK_SEARCH_FTS=false) list_books falls back to ILIKE.
+#
+#     python -m app.search      # create if missing and rebuild
+
+enabled = False
+
+_SQLITE_DDL = [
+    """
+    CREATE VIRTUAL TABLE books_fts USING fts5(
+        title, author, description,
+        content='books', content_rowid='rowid',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS books_fts_ai AFTER INSERT ON books BEGIN
+        INSERT INTO books_fts(rowid, title, author, description)
+        VALUES (new.rowid, new.title, new.author, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS books_fts_ad AFTER DELETE ON books BEGIN
+        INSERT INTO books_fts(books_fts, rowid, title, author, description)
+        VALUES ('delete', old.rowid, old.title, old.author, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS books_fts_au AFTER UPDATE OF title, author, description ON books BEGIN
+        INSERT INTO books_fts(books_fts, rowid, title, author, description)
+        VALUES ('delete', old.rowid, old.title, old.author, old.description);
+        INSERT INTO books_fts(rowid, title, author, description)
+        VALUES (new.rowid, new.title, new.author, new.description);
+    END
+    """,
+    # fill the index from rows that existed before it
+    "INSERT INTO books_fts(books_fts) VALUES ('rebuild')",
+]
+
+_POSTGRES_DDL = [
+    """
+    ALTER TABLE books ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(author, '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce(description, '')), 'C')
+    ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_books_search_vector ON books USING GIN (search_vector)",
+]
+
+
+def ensure_search_index(engine: Engine):
+    global enabled
+    if not BOOK_SEARCH_FTS:
+        return
+
+    dialect = engine.dialect.name
+    try:
+        with engine.begin() as conn:
+            if dialect == "sqlite":
+                exists = conn.execute(
+                    text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'books_fts'")
+                ).first()
+                if not exists:
+                    for ddl in _SQLITE_DDL:
+                        conn.execute(text(ddl))
+                    print("[Search] created books_fts")
+            elif dialect == "postgresql":
+                for ddl in _POSTGRES_DDL:
+                    conn.execute(text(ddl))
+            else:
+                print(f"[Search] no full-text index for {dialect}, using ILIKE")
+                return
+        enabled = True
+    except Exception as e:
+        print("[Search] full-text index unavailable, using ILIKE:", e)
+
+
+def search_terms(search: str) -> list[str]:
+    return re.findall(r"\w+", search.lower())
+
+
+def apply_search(query, search: str):
+    """
+    Filters `query` (over models.Book) to books matching `search`.
+    Returns (query, rank), where rank is a SortKey putting the best match
+    first, or None when the ILIKE fallback was used.
+    """
+    terms = search_terms(search)
+    dialect = query.session.get_bind().dialect.name
+    if not enabled or not terms:
+        like = f"%{search}%"
+        return query.filter(or_(models.Book.title.ilike(like), models.Book.description.ilike(like))), None
+
+    if dialect == "sqlite":
+        match = " ".join(f'"{term}"*' for term in terms)
+        fts = (
+            text(
+                "SELECT rowid AS book_rowid, bm25(books_fts, 10.0, 5.0, 1.0) AS rank "
+                "FROM books_fts WHERE books_fts MATCH :match"
+            )
+            .bindparams(match=match)
+            .columns(book_rowid=Integer, rank=Float)
+            .subquery("fts")
+        )
+        query = query.join(fts, fts.c.book_rowid == literal_column("books.rowid"))
+        return query, SortKey(fts.c.rank)  # bm25: lower is better
+
+    tsquery = func.to_tsquery("simple", " & ".join(f"{term}:*" for term in terms))
+    vector = literal_column("books.search_vector")
+    query = query.filter(vector.op("@@")(tsquery))
+    return query, SortKey(func.ts_rank_cd(vector, tsquery), desc=True)
+
+
+def rebuild_search_index(engine: Engine):
+    # books has no INTEGER PRIMARY KEY, so a SQLite VACUUM may renumber the
+    # rowids books_fts points at; rebuild after one
+    with engine.begin() as conn:
+        if engine.dialect.name == "sqlite":
+            conn.execute(text("INSERT INTO books_fts(books_fts) VALUES ('rebuild')"))
+        elif engine.dialect.name == "postgresql":
+            conn.execute(text("REINDEX INDEX ix_books_search_vector"))
+    print("[Search] index rebuilt")
+
+
+if __name__ == "__main__":
+    # python -m app.search
+    from .database import engine
+
+    ensure_search_index(engine)
+    rebuild_search_index(engine)
@@ -0,0 +1,73 @@
+import json
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Any
+from uuid import UUID
+
+from fastapi.responses import JSONResponse
+
+from .config import JSON_BACKEND
+
+# JSON for Redis payloads and responses. orjson or msgspec when installed
+# (JSON_BACKEND=auto takes the first one available), the stdlib otherwise.
+# Every backend writes Decimal as a string, the way pydantic renders
+# condecimal fields, and dates/times as ISO 8601.
+
+
+def _default(obj):
+    if isinstance(obj, Decimal):
+        return str(obj)
+    if isinstance(obj, (datetime, date, time)):
+        return obj.isoformat()
+    if isinstance(obj, UUID):
+        return str(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _orjson():
+    import orjson
+
+    def dumps(obj) -> bytes:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+    return dumps, orjson.loads
+
+
+def _msgspec():
+    import msgspec
+
+    encoder = msgspec.json.Encoder(enc_hook=_default)
+    decoder = msgspec.json.Decoder()
+    return encoder.encode, decoder.decode
+
+
+def _stdlib():
+    encoder = json.JSONEncoder(default=_default, ensure_ascii=False, separators=(",", ":"))
+
+    def dumps(obj) -> bytes:
+        return encoder.encode(obj).encode("utf-8")
+
+    return dumps, json.loads
+
+
+BACKENDS = {"orjson": _orjson, "msgspec": _msgspec, "json": _stdlib}
+
+
+def load_backend(name: str):
+    if name != "auto" and name not in BACKENDS:
+        raise ValueError(f"Unknown JSON_BACKEND {name!r}")
+    for candidate in (("orjson", "msgspec", "json") if name == "auto" else (name, "json")):
+        try:
+            return (candidate, *BACKENDS[candidate]())
+        except ImportError:
+            print(f"[JSON] {candidate} not installed, falling back")
+
+
+BACKEND, dumps, loads = load_backend(JSON_BACKEND)
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,44 @@
+"""
+Prunes stock_idempotency_keys.
+
+A key only has to outlive the retries of the change it recorded (orders'
+retry loop, redelivered checkout batches, a hot-inventory flush re-applied
+after a crash), so keys older than STOCK_IDEMPOTENCY_KEY_TTL are deleted
+every STOCK_IDEMPOTENCY_PRUNE_S. Every replica prunes; a repeated DELETE
+is harmless.
+
+    python -m app.stock_keys            # prune once
+"""
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from . import crud
+from .config import STOCK_IDEMPOTENCY_KEY_TTL, STOCK_IDEMPOTENCY_PRUNE_S
+from .database import run_in_session
+
+
+async def prune_once() -> int:
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=STOCK_IDEMPOTENCY_KEY_TTL)
+    deleted = await run_in_session(crud.prune_idempotency_keys, cutoff)
+    if deleted:
+        print(f"[StockKeys] pruned {deleted} idempotency keys")
+    return deleted
+
+
+async def _prune_loop():
+    while True:
+        try:
+            await prune_once()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print("[StockKeys] prune error:", e)
+        await asyncio.sleep(STOCK_IDEMPOTENCY_PRUNE_S)
+
+
+def start_pruner() -> asyncio.Task:
+    return asyncio.create_task(_prune_loop())
+
+
+if __name__ == "__main__":
+    asyncio.run(prune_once())
@@ -1,6 +1,21 @@
+import hashlib
+import hmac
+import json
+import time
+from urllib.parse import quote
 import jwt
 from fastapi import Request, HTTPException
-from config import SECRET_KEY, ALGORITHM
+from config import SECRET_KEY, ALGORITHM, IDENTITY_SECRET, IDENTITY_TTL
+from redis_utils import redis_client
+
+IDENTITY_HEADERS = (
+    "x-user-id",
+    "x-user-name",
+    "x-user-email",
+    "x-user-admin",
+    "x-identity-expires",
+    "x-identity-signature",
+)
 
 def get_user_from_token(request: Request):
     auth = request.headers.get("Authorization")
@@ -14,6 +29,62 @@ def get_user_from_token(request: Request):
 
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        request.state.token = token
+        request.state.token_payload = payload
         return payload   # Contains user_id, is_admin, email
     except Exception:
-        raise HTTPException(status_code=401, detail="Invalid token")
\ No newline at end of file
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+
+def sign_identity(user_id: str, username: str, email: str, is_admin: str, expires: str) -> str:
+    message = "\n".join([user_id, username, email, is_admin, expires])
+    return hmac.new(IDENTITY_SECRET.encode(), message.encode(), hashlib.sha256).hexdigest()
+
+
+async def identity_headers(request: Request) -> dict:
+    """
+    Signed X-User-* headers for an already decoded token. Revocation is
+    checked here and the profile comes from auth's Redis profile cache;
+    an empty dict means "no trusted identity", so services fall back to
+    asking auth themselves.
+    """
+    payload = getattr(request.state, "token_payload", None)
+    if payload is None:
+        return {}
+
+    token = request.state.token
+    user_id = payload.get("user_id")
+    try:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.exists(f"token:blacklist:{token}")
+            pipe.get(f"user:{user_id}")
+            blacklisted, cached = await pipe.execute()
+    except Exception as e:
+        print("[Gateway] identity lookup error:", e)
+        return {}
+
+    if blacklisted:
+        raise HTTPException(status_code=401, detail="Token revoked")
+    if not cached:
+        return {}
+
+    profile = json.loads(cached)
+    if not profile.get("is_active", True):
+        return {}
+
+    expires = min(int(payload["exp"]), int(time.time()) + IDENTITY_TTL)
+    fields = [
+        str(profile["id"]),
+        quote(profile.get("username") or ""),
+        quote(profile.get("email") or ""),
+        "1" if profile.get("is_admin") else "0",
+        str(expires),
+    ]
+    return {
+        "X-User-Id": fields[0],
+        "X-User-Name": fields[1],
+        "X-User-Email": fields[2],
+        "X-User-Admin": fields[3],
+        "X-Identity-Expires": fields[4],
+        "X-Identity-Signature": sign_identity(*fields),
+    }
@@ -11,4 +11,32 @@ USE_FAKEREDIS = os.getenv("USE_FAKEREDIS", "False").lower() == "False"
 REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
 
 SECRET_KEY = os.getenv("SECRET_KEY", "supersecret")
-ALGORITHM = "HS256"
\ No newline at end of file
+ALGORITHM = "HS256"
+
+# Upstream connection pools (one long-lived client per service)
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "100"))
+UPSTREAM_MAX_KEEPALIVE = int(os.getenv("UPSTREAM_MAX_KEEPALIVE", "20"))
+UPSTREAM_KEEPALIVE_EXPIRY = float(os.getenv("UPSTREAM_KEEPALIVE_EXPIRY", "30"))
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "2.0"))
+UPSTREAM_READ_TIMEOUT = float(os.getenv("UPSTREAM_READ_TIMEOUT", "10.0"))
+UPSTREAM_WRITE_TIMEOUT = float(os.getenv("UPSTREAM_WRITE_TIMEOUT", "10.0"))
+UPSTREAM_POOL_TIMEOUT = float(os.getenv("UPSTREAM_POOL_TIMEOUT", "5.0"))
+UPSTREAM_HTTP2 = os.getenv("UPSTREAM_HTTP2", "false").lower() == "true"
+
+# Pipe request/response bodies through instead of buffering them in memory
+PROXY_STREAMING = os.getenv("PROXY_STREAMING", "true").lower() == "true"
+
+# Sliding-window rate limiter
+RATE_LIMIT_WINDOW = int(os.getenv("RATE_LIMIT_WINDOW", "60"))
+# callers below this fraction of their limit are admitted without asking Redis
+RATE_LIMIT_LOCAL_FRACTION = float(os.getenv("RATE_LIMIT_LOCAL_FRACTION", "0.5"))
+# locally admitted hits are pushed to Redis after this many hits or seconds
+RATE_LIMIT_SYNC_BATCH = int(os.getenv("RATE_LIMIT_SYNC_BATCH", "10"))
+RATE_LIMIT_SYNC_INTERVAL = float(os.getenv("RATE_LIMIT_SYNC_INTERVAL", "1.0"))
+RATE_LIMIT_LOCAL_KEYS = int(os.getenv("RATE_LIMIT_LOCAL_KEYS", "10000"))
+
+# Trusted identity: the gateway verifies the token once and forwards signed
+# X-User-* headers that downstream services accept without calling auth
+TRUSTED_IDENTITY = os.getenv("TRUSTED_IDENTITY", "false").lower() == "true"
+IDENTITY_SECRET = os.getenv("IDENTITY_SECRET", "super-secret-identity")
+IDENTITY_TTL = int(os.getenv("IDENTITY_TTL", "60"))
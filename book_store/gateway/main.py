@@ -1,12 +1,21 @@
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, HTTPException
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
 import time
 
+import upstream
 from routes import router
 from rate_limiter import rate_limit
 from auth_middleware import get_user_from_token
 
-app = FastAPI(title="API Gateway")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await upstream.start_clients()
+    yield
+    await upstream.close_clients()
+
+app = FastAPI(title="API Gateway", lifespan=lifespan)
 
 # CORS
 app.add_middleware(
@@ -28,7 +37,10 @@ async def log_requests(request: Request, call_next):
 # Rate Limiting Middleware
 @app.middleware("http")
 async def rate_limiter(request: Request, call_next):
-    user = get_user_from_token(request)
+    try:
+        user = get_user_from_token(request)
+    except HTTPException as e:
+        return JSONResponse(status_code=e.status_code, content={"detail": e.detail})
 
     if user:
         key = f"user:{user['user_id']}"
@@ -38,9 +50,17 @@ async def rate_limiter(request: Request, call_next):
         key = f"ip:{ip}"
         limit = 20
 
-    rate_limit(key, limit)
+    result = await rate_limit(key, limit)
+    if not result.allowed:
+        return JSONResponse(
+            status_code=429,
+            content={"detail": "Rate limit exceeded"},
+            headers=result.headers(),
+        )
 
-    return await call_next(request)
+    response = await call_next(request)
+    response.headers.update(result.headers())
+    return response
 
 @app.get("/health")
 def health():
@@ -54,4 +74,8 @@ def health():
         }
     }
 
+@app.get("/stats/upstreams")
+def upstream_stats():
+    return upstream.get_stats()
+
 app.include_router(router)
\ No newline at end of file
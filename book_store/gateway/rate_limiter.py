@@ -1,23 +1,142 @@
+import math
 import time
-import json
-from fastapi import HTTPException
-from config import USE_FAKEREDIS, REDIS_URL
-
-if USE_FAKEREDIS:
-    import fakeredis
-    redis_client = fakeredis.FakeRedis()
-else:
-    import redis
-    redis_client = redis.from_url(REDIS_URL, decode_responses=True)
-
-def rate_limit(key: str, limit: int, ttl: int = 60):
+from collections import OrderedDict
+from dataclasses import dataclass
+from config import (
+    RATE_LIMIT_WINDOW,
+    RATE_LIMIT_LOCAL_FRACTION,
+    RATE_LIMIT_SYNC_BATCH,
+    RATE_LIMIT_SYNC_INTERVAL,
+    RATE_LIMIT_LOCAL_KEYS,
+)
+from redis_utils import redis_client
+
+# Sliding window counter: the previous fixed window is weighted by how much of
+# it still overlaps the sliding window. `committed` hits were already admitted
+# locally and are always recorded; `cost` is the hit being decided now.
+# Returns {allowed, estimated count, ms until the caller may retry}.
+SLIDING_WINDOW_LUA = """
+local limit = tonumber(ARGV[1])
+local window_ms = tonumber(ARGV[2])
+local elapsed_ms = tonumber(ARGV[3])
+local committed = tonumber(ARGV[4])
+local cost = tonumber(ARGV[5])
+
+local cur = tonumber(redis.call('GET', KEYS[1]) or '0')
+local prev = tonumber(redis.call('GET', KEYS[2]) or '0')
+local weight = (window_ms - elapsed_ms) / window_ms
+
+if committed > 0 then
+    cur = redis.call('INCRBY', KEYS[1], committed)
+    redis.call('PEXPIRE', KEYS[1], window_ms * 2)
+end
+
+local estimated = math.floor(prev * weight + cur)
+if estimated + cost <= limit then
+    if cost > 0 then
+        cur = redis.call('INCRBY', KEYS[1], cost)
+        redis.call('PEXPIRE', KEYS[1], window_ms * 2)
+    end
+    return {1, estimated + cost, 0}
+end
+
+local retry_ms = window_ms - elapsed_ms
+local room = limit - cur - cost
+if room >= 0 and prev > 0 then
+    retry_ms = math.ceil(window_ms * (1 - room / prev)) - elapsed_ms
+end
+return {0, estimated, math.max(retry_ms, 1)}
+"""
+
+_script = redis_client.register_script(SLIDING_WINDOW_LUA)
+
+
+@dataclass
+class RateLimitResult:
+    allowed: bool
+    limit: int
+    remaining: int
+    reset: int
+    retry_after: int = 0
+
+    def headers(self) -> dict:
+        headers = {
+            "RateLimit-Limit": str(self.limit),
+            "RateLimit-Remaining": str(self.remaining),
+            "RateLimit-Reset": str(self.reset),
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(self.retry_after)
+        return headers
+
+
+@dataclass
+class _LocalCounter:
+    window: int
+    remote: int = 0      # count Redis reported on the last sync
+    pending: int = 0     # hits admitted locally since the last sync
+    synced_at: float = 0.0
+
+
+_local: "OrderedDict[str, _LocalCounter]" = OrderedDict()
+
+
+def _local_counter(key: str, window: int) -> _LocalCounter:
+    counter = _local.get(key)
+    if counter is None:
+        counter = _LocalCounter(window=window)
+        _local[key] = counter
+        if len(_local) > RATE_LIMIT_LOCAL_KEYS:
+            _local.popitem(last=False)
+    else:
+        _local.move_to_end(key)
+    if counter.window != window:
+        # a new window started; the Redis estimate still carries the
+        # weighted previous window, so only the cached count is dropped
+        counter.window = window
+        counter.remote = 0
+        counter.synced_at = 0.0
+    return counter
+
+
+async def rate_limit(key: str, limit: int, window: int = RATE_LIMIT_WINDOW) -> RateLimitResult:
     """
-    Redis Sliding Window Counter
+    Redis Sliding Window Counter with an in-process pre-check
     """
-    current = redis_client.get(key)
-    if current is None:
-        redis_client.set(key, 1, ex=ttl)
-        return
-    if int(current) >= limit:
-        raise HTTPException(status_code=429, detail="Rate limit exceeded")
-    redis_client.incr(key)
\ No newline at end of file
+    now = time.time()
+    window_ms = window * 1000
+    now_ms = int(now * 1000)
+    current = now_ms // window_ms
+    elapsed_ms = now_ms - current * window_ms
+    reset = math.ceil((window_ms - elapsed_ms) / 1000)
+
+    counter = _local_counter(key, current)
+    local_estimate = counter.remote + counter.pending + 1
+    if (
+        counter.synced_at
+        and local_estimate <= limit * RATE_LIMIT_LOCAL_FRACTION
+        and counter.pending < RATE_LIMIT_SYNC_BATCH
+        and now - counter.synced_at < RATE_LIMIT_SYNC_INTERVAL
+    ):
+        counter.pending += 1
+        return RateLimitResult(True, limit, limit - local_estimate, reset)
+
+    committed = counter.pending
+    counter.pending = 0
+    try:
+        allowed, count, retry_ms = await _script(
+            keys=[f"ratelimit:{key}:{current}", f"ratelimit:{key}:{current - 1}"],
+            args=[limit, window_ms, elapsed_ms, committed, 1],
+        )
+    except Exception as e:
+        # fail open: a Redis outage must not take the whole API down
+        print("[RateLimit] redis error:", e)
+        counter.pending = committed + 1
+        return RateLimitResult(True, limit, max(limit - local_estimate, 0), reset)
+
+    counter.remote = int(count)
+    counter.synced_at = now
+    remaining = max(limit - int(count), 0)
+    if not allowed:
+        return RateLimitResult(False, limit, 0, reset, max(math.ceil(int(retry_ms) / 1000), 1))
+    return RateLimitResult(True, limit, remaining, reset)
@@ -0,0 +1,8 @@
+from config import USE_FAKEREDIS, REDIS_URL
+
+if USE_FAKEREDIS:
+    from fakeredis import aioredis
+    redis_client = aioredis.FakeRedis(decode_responses=True)
+else:
+    import redis.asyncio as redis
+    redis_client = redis.from_url(REDIS_URL, decode_responses=True)
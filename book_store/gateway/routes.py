@@ -1,24 +1,98 @@
-from fastapi import APIRouter, Request, HTTPException
+from fastapi import APIRouter, Request, HTTPException, Response
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 import httpx
-from config import AUTH_SERVICE, BOOK_SERVICE, ORDER_SERVICE, REVIEW_SERVICE
+import upstream
+from auth_middleware import IDENTITY_HEADERS, identity_headers
+from config import PROXY_STREAMING, TRUSTED_IDENTITY
 router = APIRouter()
 SERVICE_MAP = {
-    "/api/v1/auth": AUTH_SERVICE,
-    "/api/v1/books": BOOK_SERVICE,
-    "/api/v1/orders": ORDER_SERVICE,
-    "/api/v1/reviews": REVIEW_SERVICE,
+    "/api/v1/auth": "auth",
+    "/api/v1/books": "books",
+    "/api/v1/orders": "orders",
+    "/api/v1/reviews": "reviews",
 }
 
-async def forward(request: Request, service_url: str):
-    async with httpx.AsyncClient() as client:
-        url = service_url + request.url.path
-        response = await client.request(
-            request.method,
-            url,
-            headers=request.headers.raw,
-            content=await request.body()
-        )
-    return response
+# RFC 7230 section 6.1: connection-scoped, never forwarded by a proxy
+HOP_BY_HOP_HEADERS = {
+    "connection",
+    "keep-alive",
+    "proxy-authenticate",
+    "proxy-authorization",
+    "te",
+    "trailer",
+    "trailers",
+    "transfer-encoding",
+    "upgrade",
+}
+
+# a buffered response body is already decoded and re-framed by us
+BUFFERED_EXCLUDED_HEADERS = {"content-length", "content-encoding"}
+
+
+def filter_headers(headers, extra_excluded=()):
+    # headers named in "Connection: foo, bar" are hop-by-hop as well
+    excluded = set(HOP_BY_HOP_HEADERS) | set(extra_excluded)
+    for k, v in headers:
+        if k.lower() == "connection":
+            excluded.update(token.strip().lower() for token in v.split(","))
+    return [(k, v) for k, v in headers if k.lower() not in excluded]
+
+
+async def build_upstream_request(request: Request, service: str, content):
+    client = upstream.get_client(service)
+    # identity headers are only ever set by us, never passed through
+    headers = filter_headers(
+        [(k.decode("latin-1"), v.decode("latin-1")) for k, v in request.headers.raw],
+        extra_excluded={"host", *IDENTITY_HEADERS},
+    )
+    if TRUSTED_IDENTITY:
+        headers.extend((await identity_headers(request)).items())
+    return client.build_request(
+        request.method,
+        request.url.path,
+        params=request.query_params.multi_items(),
+        headers=headers,
+        content=content,
+    )
+
+
+async def send_upstream(service: str, upstream_request: httpx.Request, stream: bool):
+    try:
+        return await upstream.send(service, upstream_request, stream=stream)
+    except httpx.TimeoutException:
+        raise HTTPException(status_code=504, detail=f"{service} service timed out")
+    except httpx.HTTPError:
+        raise HTTPException(status_code=502, detail=f"{service} service unavailable")
+
+
+async def forward(request: Request, service: str):
+    upstream_request = await build_upstream_request(request, service, await request.body())
+    response = await send_upstream(service, upstream_request, stream=False)
+
+    proxied = Response(content=response.content, status_code=response.status_code)
+    for k, v in filter_headers(response.headers.multi_items(), BUFFERED_EXCLUDED_HEADERS):
+        proxied.headers.append(k, v)
+    return proxied
+
+
+async def forward_streaming(request: Request, service: str):
+    # the inbound body is piped upstream chunk by chunk as it arrives
+    has_body = "content-length" in request.headers or "transfer-encoding" in request.headers
+    content = request.stream() if has_body else None
+    upstream_request = await build_upstream_request(request, service, content)
+    response = await send_upstream(service, upstream_request, stream=True)
+
+    # raw bytes are relayed untouched, so content-encoding/length stay valid
+    proxied = StreamingResponse(
+        response.aiter_raw(),
+        status_code=response.status_code,
+        background=BackgroundTask(response.aclose),
+    )
+    for k, v in filter_headers(response.headers.multi_items()):
+        proxied.headers.append(k, v)
+    return proxied
+
 
 @router.api_route("/{path:path}", methods=["GET", "POST", "PUT", "PATCH", "DELETE"])
 async def gateway_router(request: Request):
@@ -26,5 +100,7 @@ async def gateway_router(request: Request):
 
     for prefix, service in SERVICE_MAP.items():
         if path.startswith(prefix):
+            if PROXY_STREAMING:
+                return await forward_streaming(request, service)
             return await forward(request, service)
-    raise HTTPException(status_code=404, detail="Route not found")
\ No newline at end of file
+    raise HTTPException(status_code=404, detail="Route not found")
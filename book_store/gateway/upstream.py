@@ -0,0 +1,123 @@
+import time
+import httpx
+from config import (
+    AUTH_SERVICE,
+    BOOK_SERVICE,
+    ORDER_SERVICE,
+    REVIEW_SERVICE,
+    UPSTREAM_MAX_CONNECTIONS,
+    UPSTREAM_MAX_KEEPALIVE,
+    UPSTREAM_KEEPALIVE_EXPIRY,
+    UPSTREAM_CONNECT_TIMEOUT,
+    UPSTREAM_READ_TIMEOUT,
+    UPSTREAM_WRITE_TIMEOUT,
+    UPSTREAM_POOL_TIMEOUT,
+    UPSTREAM_HTTP2,
+)
+
+UPSTREAMS = {
+    "auth": AUTH_SERVICE,
+    "books": BOOK_SERVICE,
+    "orders": ORDER_SERVICE,
+    "reviews": REVIEW_SERVICE,
+}
+
+# one pooled client per upstream, created by the app lifespan
+_clients: dict[str, httpx.AsyncClient] = {}
+_stats: dict[str, dict] = {}
+
+
+def _http2_enabled() -> bool:
+    if not UPSTREAM_HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        print("[Gateway] UPSTREAM_HTTP2 set but 'h2' is not installed, using HTTP/1.1")
+        return False
+    return True
+
+
+def _empty_stats() -> dict:
+    return {
+        "requests": 0,
+        "errors": 0,
+        "in_flight": 0,
+        "total_ms": 0.0,
+        "max_ms": 0.0,
+        "status": {},
+    }
+
+
+async def start_clients():
+    limits = httpx.Limits(
+        max_connections=UPSTREAM_MAX_CONNECTIONS,
+        max_keepalive_connections=UPSTREAM_MAX_KEEPALIVE,
+        keepalive_expiry=UPSTREAM_KEEPALIVE_EXPIRY,
+    )
+    timeout = httpx.Timeout(
+        connect=UPSTREAM_CONNECT_TIMEOUT,
+        read=UPSTREAM_READ_TIMEOUT,
+        write=UPSTREAM_WRITE_TIMEOUT,
+        pool=UPSTREAM_POOL_TIMEOUT,
+    )
+    http2 = _http2_enabled()
+    for name, base_url in UPSTREAMS.items():
+        _clients[name] = httpx.AsyncClient(
+            base_url=base_url,
+            limits=limits,
+            timeout=timeout,
+            http2=http2,
+        )
+        _stats[name] = _empty_stats()
+
+
+async def close_clients():
+    for client in _clients.values():
+        await client.aclose()
+    _clients.clear()
+
+
+def get_client(name: str) -> httpx.AsyncClient:
+    client = _clients.get(name)
+    if client is None:
+        raise RuntimeError(f"Upstream client '{name}' is not started")
+    return client
+
+
+async def send(name: str, request: httpx.Request, stream: bool = False) -> httpx.Response:
+    client = get_client(name)
+    stats = _stats[name]
+    stats["requests"] += 1
+    stats["in_flight"] += 1
+    start = time.perf_counter()
+    try:
+        response = await client.send(request, stream=stream)
+    except httpx.HTTPError:
+        stats["errors"] += 1
+        raise
+    finally:
+        stats["in_flight"] -= 1
+        elapsed = (time.perf_counter() - start) * 1000
+        stats["total_ms"] += elapsed
+        stats["max_ms"] = max(stats["max_ms"], elapsed)
+
+    code = str(response.status_code)
+    stats["status"][code] = stats["status"].get(code, 0) + 1
+    return response
+
+
+def get_stats() -> dict:
+    result = {}
+    for name, stats in _stats.items():
+        done = stats["requests"] - stats["in_flight"]
+        result[name] = {
+            "url": UPSTREAMS[name],
+            "requests": stats["requests"],
+            "errors": stats["errors"],
+            "in_flight": stats["in_flight"],
+            "avg_ms": round(stats["total_ms"] / done, 2) if done else 0.0,
+            "max_ms": round(stats["max_ms"], 2),
+            "status": dict(stats["status"]),
+        }
+    return result
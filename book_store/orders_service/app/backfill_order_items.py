@@ -0,0 +1,70 @@
+"""
+One-off backfill of the book snapshot columns on order_items.
+
+Makes sure the book_title / book_isbn / book_author columns exist (migration
+1, create_all never alters tables) and fills rows created before orders
+stored the snapshot, using the books batch endpoint 100 ids at a time.
+
+    python -m app.backfill_order_items
+"""
+import httpx
+from sqlalchemy import inspect, text
+
+from .config import BOOKS_SERVICE_URL
+from .database import engine
+
+SNAPSHOT_COLUMNS = {
+    "book_title": "VARCHAR(255)",
+    "book_isbn": "VARCHAR(50)",
+    "book_author": "VARCHAR(255)",
+}
+BATCH_SIZE = 100
+
+
+def ensure_snapshot_columns(conn):
+    # migration 1 (see migrations.py)
+    existing = {c["name"] for c in inspect(conn).get_columns("order_items")}
+    for name, ddl in SNAPSHOT_COLUMNS.items():
+        if name not in existing:
+            conn.execute(text(f"ALTER TABLE order_items ADD COLUMN {name} {ddl}"))
+            print(f"[Backfill] added order_items.{name}")
+
+
+def backfill():
+    from .migrations import migrate  # migrations imports this module
+
+    migrate()
+
+    with engine.connect() as conn:
+        book_ids = [
+            row[0]
+            for row in conn.execute(text("SELECT DISTINCT book_id FROM order_items WHERE book_title IS NULL"))
+        ]
+    print(f"[Backfill] {len(book_ids)} books to resolve")
+
+    updated = 0
+    with httpx.Client(timeout=10.0) as client:
+        for start in range(0, len(book_ids), BATCH_SIZE):
+            batch = book_ids[start:start + BATCH_SIZE]
+            resp = client.post(f"{BOOKS_SERVICE_URL}/api/v1/books/batch", json={"ids": batch})
+            resp.raise_for_status()
+            body = resp.json()
+
+            with engine.begin() as conn:
+                for b in body["items"]:
+                    result = conn.execute(
+                        text(
+                            "UPDATE order_items SET book_title = :title, book_isbn = :isbn, book_author = :author "
+                            "WHERE book_id = :id AND book_title IS NULL"
+                        ),
+                        {"title": b["title"], "isbn": b["isbn"], "author": b["author"], "id": b["id"]},
+                    )
+                    updated += result.rowcount
+            for book_id in body.get("missing", []):
+                print(f"[Backfill] book {book_id} no longer exists, left as is")
+
+    print(f"[Backfill] updated {updated} order items")
+
+
+if __name__ == "__main__":
+    backfill()
@@ -0,0 +1,134 @@
+import asyncio
+import time
+
+from fastapi import HTTPException
+
+from . import crud
+from .config import CHECKOUT_WORKERS, CHECKOUT_BATCH
+from .database import run_in_session
+from .deps import reserve_books_stock, update_books_stock
+from .events import CONSUMER_NAME, start_consumer
+from .redis_utils import bump_order_generations, cache_delete, redis_client
+
+# Asynchronous checkout (CHECKOUT_MODE=async).
+#
+# POST /orders stores the order as "queued" together with an order.queued
+# outbox event and answers 202. CHECKOUT_WORKERS consumers per replica read
+# those events in batches of up to CHECKOUT_BATCH and reserve stock for a
+# whole batch at once: every order's items go into one all-or-nothing
+# /stock/batch call, i.e. one books transaction. If that
+# fails for lack of stock, the batch's orders are reserved one by one in
+# arrival order and the ones that no longer fit are rejected. Orders then
+# move to pending or rejected, and anyone waiting on
+# GET /orders/{id}/status?wait= is woken over pub/sub.
+#
+# Redelivered batches skip orders that are no longer queued, and each order's
+# stock change carries its own idempotency key (reserve_key), in the batch
+# call and the one-by-one fallback alike. Books applies a key at most once,
+# so a worker dying between the books call and finish_reservations does not
+# reserve twice, however the retry groups the orders.
+
+CHECKOUT_GROUP = "orders.checkout"
+
+checkout_stats = {"batches": 0, "orders": 0, "confirmed": 0, "rejected": 0, "fallbacks": 0, "last_batch_ms": 0.0}
+
+
+def status_channel(order_id: str) -> str:
+    return f"order:{order_id}:status"
+
+
+def reserve_key(order_id: str) -> str:
+    return f"order:{order_id}:reserve"
+
+
+async def _reserve_one_by_one(orders: list) -> tuple[list, list]:
+    confirmed, rejected = [], []
+    try:
+        for order in orders:
+            try:
+                await update_books_stock(
+                    {book_id: -qty for book_id, qty in order["items"].items()}, reserve_key(order["order_id"])
+                )
+                confirmed.append(order["order_id"])
+            except HTTPException as e:
+                if e.status_code != 400:
+                    raise
+                rejected.append(order["order_id"])
+    except Exception:
+        # settle what was decided; the rest stays queued for the retry
+        await run_in_session(crud.finish_reservations, confirmed, rejected)
+        raise
+    return confirmed, rejected
+
+
+async def reserve_batch(events: list):
+    start = time.perf_counter()
+    requests = {payload["order_id"]: payload for _, payload in events}
+    queued = set(await run_in_session(crud.queued_order_ids, list(requests)))
+    orders = [payload for order_id, payload in requests.items() if order_id in queued]
+    if not orders:
+        return
+
+    reservations = {
+        reserve_key(order["order_id"]): {book_id: -qty for book_id, qty in order["items"].items()}
+        for order in orders
+    }
+    try:
+        await reserve_books_stock(reservations)
+        confirmed, rejected = [order["order_id"] for order in orders], []
+    except HTTPException as e:
+        if e.status_code != 400:
+            raise  # books unavailable: the batch stays pending and is retried
+        checkout_stats["fallbacks"] += 1
+        confirmed, rejected = await _reserve_one_by_one(orders)
+
+    await run_in_session(crud.finish_reservations, confirmed, rejected)
+
+    for order in orders:
+        await cache_delete(f"order:{order['order_id']}")
+    await bump_order_generations(*(order["user_id"] for order in orders))
+    pipe = redis_client.pipeline(transaction=False)
+    for order_id in confirmed:
+        pipe.publish(status_channel(order_id), "pending")
+    for order_id in rejected:
+        pipe.publish(status_channel(order_id), "rejected")
+    await pipe.execute()
+
+    checkout_stats["batches"] += 1
+    checkout_stats["orders"] += len(orders)
+    checkout_stats["confirmed"] += len(confirmed)
+    checkout_stats["rejected"] += len(rejected)
+    checkout_stats["last_batch_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+
+async def wait_for_status(order_id: str, timeout: float, current_status) -> None:
+    """
+    Returns once the order has left "queued" or `timeout` seconds passed.
+    `current_status` is awaited after subscribing, so a change that lands in
+    between is not missed.
+    """
+    pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+    try:
+        await pubsub.subscribe(status_channel(order_id))
+        if await current_status() != "queued":
+            return
+        deadline = time.monotonic() + timeout
+        while (remaining := deadline - time.monotonic()) > 0:
+            if await pubsub.get_message(timeout=remaining):
+                return
+    finally:
+        await pubsub.reset()
+
+
+def start_workers() -> list[asyncio.Task]:
+    return [
+        start_consumer(
+            CHECKOUT_GROUP,
+            ("order.queued",),
+            reserve_batch,
+            batch=CHECKOUT_BATCH,
+            consumer=f"{CONSUMER_NAME}-{i}",
+            batched=True,
+        )
+        for i in range(CHECKOUT_WORKERS)
+    ]
@@ -1,21 +1,31 @@
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, selectinload
 from sqlalchemy import func
 from typing import List, Tuple, Optional
 from decimal import Decimal
 
 from . import models
+from .events import publish_event
+from .pagination import SortKey, paginate
 
 
 def create_order(
     db: Session,
     user_id: str,
     items_data: List[dict],
+    queued: bool = False,
+    order_id: Optional[str] = None,
 ) -> models.Order:
+    """
+    Stores a placed order. With queued=True the stock is not reserved yet:
+    the order starts as "queued" and its order.queued event is the request
+    the checkout workers pick up (see checkout.py).
+    """
     total_amount = sum(Decimal(str(i["subtotal"])) for i in items_data)
 
     order = models.Order(
+        id=order_id or models.uuid_str(),
         user_id=user_id,
-        status="pending",
+        status="queued" if queued else "pending",
         total_amount=total_amount,
     )
     db.add(order)
@@ -25,40 +35,125 @@ def create_order(
         item = models.OrderItem(
             order_id=order.id,
             book_id=i["book_id"],
+            book_title=i.get("book_title"),
+            book_isbn=i.get("book_isbn"),
+            book_author=i.get("book_author"),
             quantity=i["quantity"],
             price_at_purchase=i["price_at_purchase"],
             subtotal=i["subtotal"],
         )
         db.add(item)
 
+    if queued:
+        quantities: dict = {}
+        for i in items_data:
+            quantities[i["book_id"]] = quantities.get(i["book_id"], 0) + i["quantity"]
+        publish_event(db, "order.queued", {"order_id": order.id, "user_id": user_id, "items": quantities})
+    else:
+        publish_event(db, "order.created", {"order_id": order.id, "user_id": user_id})
     db.commit()
-    db.refresh(order)
-    return order
+    return get_order_with_items(db, order.id)
 
 
 def get_order(db: Session, order_id: str) -> Optional[models.Order]:
     return db.query(models.Order).filter(models.Order.id == order_id).first()
 
 
+def get_order_with_items(db: Session, order_id: str) -> Optional[models.Order]:
+    return (
+        db.query(models.Order)
+        .options(selectinload(models.Order.items))
+        .populate_existing()
+        .filter(models.Order.id == order_id)
+        .first()
+    )
+
+
+def _user_orders(db: Session, user_id: str, status: Optional[str] = None):
+    q = db.query(models.Order).filter(models.Order.user_id == user_id)
+    if status:
+        q = q.filter(models.Order.status == status)
+    return q
+
+
+def _with_item_counts(db: Session, q, user_id: str):
+    # item counts for the whole page in one grouped join instead of a query per order
+    counts = (
+        db.query(models.OrderItem.order_id, func.count(models.OrderItem.id).label("item_count"))
+        .join(models.Order, models.Order.id == models.OrderItem.order_id)
+        .filter(models.Order.user_id == user_id)
+        .group_by(models.OrderItem.order_id)
+        .subquery()
+    )
+    return q.outerjoin(counts, counts.c.order_id == models.Order.id).add_columns(func.coalesce(counts.c.item_count, 0))
+
+
 def list_orders_for_user(
     db: Session,
     user_id: str,
     page: int,
     limit: int,
     status: Optional[str] = None,
-) -> Tuple[List[models.Order], int]:
-    q = db.query(models.Order).filter(models.Order.user_id == user_id)
-    if status:
-        q = q.filter(models.Order.status == status)
-
+) -> Tuple[List[Tuple[models.Order, int]], int]:
+    q = _user_orders(db, user_id, status)
     total = q.count()
-    items = (
-        q.order_by(models.Order.created_at.desc())
+
+    rows = (
+        _with_item_counts(db, q, user_id)
+        .order_by(models.Order.created_at.desc(), models.Order.id.desc())
         .offset((page - 1) * limit)
         .limit(limit)
         .all()
     )
-    return items, total
+    return [(order, item_count) for order, item_count in rows], total
+
+
+ORDER_SORT_KEYS = [SortKey(models.Order.created_at, desc=True), SortKey(models.Order.id, desc=True)]
+
+
+def list_orders_for_user_keyset(
+    db: Session,
+    user_id: str,
+    cursor: Optional[str],
+    limit: int,
+    status: Optional[str] = None,
+) -> Tuple[List[Tuple[models.Order, int]], Optional[str]]:
+    """Raises ValueError for a cursor that was not issued by this listing."""
+    q = _with_item_counts(db, _user_orders(db, user_id, status), user_id)
+    return paginate(q, ORDER_SORT_KEYS, "orders:created_at:desc", cursor, limit)
+
+
+def count_orders_for_user(db: Session, user_id: str, status: Optional[str] = None) -> int:
+    return _user_orders(db, user_id, status).count()
+
+
+def get_order_status(db: Session, order_id: str):
+    # columns, not the entity: re-read after a worker changed it
+    return db.query(models.Order.id, models.Order.status, models.Order.updated_at).filter(
+        models.Order.id == order_id
+    ).first()
+
+
+def queued_order_ids(db: Session, order_ids: List[str]) -> List[str]:
+    rows = db.query(models.Order.id).filter(models.Order.id.in_(order_ids), models.Order.status == "queued")
+    return [row.id for row in rows]
+
+
+def finish_reservations(db: Session, confirmed: List[str], rejected: List[str]):
+    """Moves queued orders on to pending (stock reserved) or rejected, in one transaction."""
+    for status, topic, ids in (("pending", "order.created", confirmed), ("rejected", "order.rejected", rejected)):
+        if not ids:
+            continue
+        orders = (
+            db.query(models.Order)
+            .filter(models.Order.id.in_(ids), models.Order.status == "queued")
+            .with_for_update()
+            .all()
+        )
+        for order in orders:
+            order.status = status
+            publish_event(db, topic, {"order_id": order.id, "user_id": order.user_id})
+    db.commit()
 
 
 def get_order_items(db: Session, order_id: str) -> List[models.OrderItem]:
@@ -68,6 +163,8 @@ def get_order_items(db: Session, order_id: str) -> List[models.OrderItem]:
 def update_order_status(db: Session, order: models.Order, new_status: str) -> models.Order:
     order.status = new_status
     db.add(order)
+    if new_status in ("completed", "cancelled"):
+        publish_event(db, f"order.{new_status}", {"order_id": order.id, "user_id": order.user_id})
     db.commit()
     db.refresh(order)
     return order
@@ -76,6 +173,7 @@ def update_order_status(db: Session, order: models.Order, new_status: str) -> mo
 def cancel_order(db: Session, order: models.Order) -> models.Order:
     order.status = "cancelled"
     db.add(order)
+    publish_event(db, "order.cancelled", {"order_id": order.id, "user_id": order.user_id})
     db.commit()
     db.refresh(order)
     return order
@@ -1,15 +1,51 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from .database import Base, engine
+from . import auth_cache, checkout, deps, events, redis_utils
 from . import models
+from .config import CHECKOUT_MODE
+from .migrations import migrate
 from .routes import router as orders_router
+from .serialization import FastJSONResponse
 
-app = FastAPI(title="BookHub Orders Service", version="0.1.0")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    listener = auth_cache.start_invalidation_listener()
+    relay = events.start_relay()
+    workers = checkout.start_workers() if CHECKOUT_MODE == "async" else []
+    yield
+    listener.cancel()
+    relay.cancel()
+    for worker in workers:
+        worker.cancel()
+    await deps.http_client.aclose()
+
+
+app = FastAPI(title="BookHub Orders Service", version="0.1.0", lifespan=lifespan, default_response_class=FastJSONResponse)
 
 Base.metadata.create_all(bind=engine)
+# bring databases created by older versions up to date
+migrate()
 
 app.include_router(orders_router)
 
 
 @app.get("/")
 def root():
-    return {"status": "Orders service running"}
\ No newline at end of file
+    return {"status": "Orders service running"}
+
+
+@app.get("/stats/cache")
+def cache_stats():
+    return redis_utils.cache_stats
+
+
+@app.get("/stats/events")
+async def event_stats():
+    return await events.stats()
+
+
+@app.get("/stats/checkout")
+def checkout_stats():
+    return {"mode": CHECKOUT_MODE, **checkout.checkout_stats}
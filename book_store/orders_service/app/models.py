@@ -1,4 +1,5 @@
-from sqlalchemy import Column, String, DateTime, Numeric, Integer, ForeignKey
+from sqlalchemy import Column, String, Text, DateTime, Numeric, Integer, ForeignKey, Index
+from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from uuid import uuid4
 from .database import Base
@@ -13,18 +14,45 @@ class Order(Base):
 
     id = Column(String(36), primary_key=True, default=uuid_str)
     user_id = Column(String(36), nullable=False)
-    status = Column(String(20), nullable=False, default="pending")  # pending, processing, completed, cancelled
+    status = Column(String(20), nullable=False, default="pending")  # queued, pending, processing, completed, cancelled, rejected
     total_amount = Column(Numeric(10, 2), nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
+    # load explicitly with selectinload(); items are removed by the FK cascade
+    items = relationship("OrderItem", order_by="OrderItem.id", passive_deletes=True)
+
+    # also created on existing databases by migrations.py
+    __table_args__ = (
+        Index("ix_orders_user_created_at", "user_id", "created_at", "id"),
+        Index("ix_orders_user_status_created_at", "user_id", "status", "created_at", "id"),
+    )
+
 
 class OrderItem(Base):
     __tablename__ = "order_items"
 
     id = Column(String(36), primary_key=True, default=uuid_str)
-    order_id = Column(String(36), ForeignKey("orders.id", ondelete="CASCADE"), nullable=False)
+    order_id = Column(String(36), ForeignKey("orders.id", ondelete="CASCADE"), nullable=False, index=True)
     book_id = Column(String(36), nullable=False)
+    # snapshot of the book at purchase time, so reads never call the books service
+    book_title = Column(String(255))
+    book_isbn = Column(String(50))
+    book_author = Column(String(255))
     quantity = Column(Integer, nullable=False)
     price_at_purchase = Column(Numeric(10, 2), nullable=False)
-    subtotal = Column(Numeric(10, 2), nullable=False)
\ No newline at end of file
+    subtotal = Column(Numeric(10, 2), nullable=False)
+
+
+class OutboxEvent(Base):
+    # written in the same transaction as the change it describes; relayed to
+    # Redis Streams and deleted by events.py
+    __tablename__ = "outbox"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    # what consumers deduplicate on: SQLite hands out the ids of deleted rows
+    # again, and the relay deletes every row it sends
+    event_id = Column(String(36), default=uuid_str)
+    topic = Column(String(100), nullable=False)
+    payload = Column(Text, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
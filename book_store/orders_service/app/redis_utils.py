@@ -1,41 +1,234 @@
-import json
-from .config import USE_FAKEREDIS, REDIS_URL
+import asyncio
+import functools
+import inspect
+import math
+import random
+import time
+
+from pydantic import BaseModel
+
+from .config import (
+    USE_FAKEREDIS,
+    REDIS_URL,
+    CACHE_STALE_TTL,
+    CACHE_EARLY_REFRESH_BETA,
+    CACHE_LOCK_TTL_MS,
+    CACHE_LOCK_WAIT_MS,
+    CACHE_LOCK_WAIT_STEPS,
+)
+from .serialization import dumps, loads
 
 if USE_FAKEREDIS:
-    import fakeredis
+    from fakeredis import aioredis
 
-    redis_client = fakeredis.FakeStrictRedis(decode_responses=True)
+    redis_client = aioredis.FakeRedis(decode_responses=True)
     print("[OrdersService] Using fakeredis (in-memory)")
 else:
-    import redis
+    import redis.asyncio as redis
 
     redis_client = redis.from_url(REDIS_URL, decode_responses=True)
     print("[OrdersService] Using real Redis:", REDIS_URL)
 
 
-def cache_set(key: str, value: dict, ttl: int):
+async def cache_set(key: str, value: dict, ttl: int):
     try:
-        redis_client.set(key, json.dumps(value), ex=ttl)
+        await redis_client.set(key, dumps(value), ex=ttl)
     except Exception as e:
         print("[Redis] cache_set error:", e)
 
 
-def cache_get(key: str):
+async def cache_get(key: str):
     try:
-        data = redis_client.get(key)
-        return json.loads(data) if data else None
+        data = await redis_client.get(key)
+        return loads(data) if data else None
     except Exception as e:
         print("[Redis] cache_get error:", e)
         return None
 
 
-def cache_delete(key: str):
+async def cache_delete(key: str):
     try:
-        redis_client.delete(key)
+        await redis_client.delete(key)
     except Exception as e:
         print("[Redis] cache_delete error:", e)
 
 
-def publish_event(topic: str, payload: dict):
-    # placeholder for real pub/sub
-    print(f"[PUB] topic={topic} payload={payload}")
\ No newline at end of file
+# Order pages embed their user's generation number in the key
+# (orders:user:{id}:gen). Placing, checking out, cancelling or re-statusing
+# an order bumps it, which orphans every cached page of that user whatever
+# its page, limit or status filter; the old keys just age out.
+
+def order_generation_key(user_id: str) -> str:
+    return f"orders:user:{user_id}:gen"
+
+
+async def get_order_generation(user_id: str):
+    try:
+        return int(await redis_client.get(order_generation_key(user_id)) or 0)
+    except Exception as e:
+        print("[Redis] get_order_generation error:", e)
+        return None
+
+
+async def bump_order_generations(*user_ids: str):
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        for user_id in set(user_ids):
+            pipe.incr(order_generation_key(user_id))
+        await pipe.execute()
+    except Exception as e:
+        print("[Redis] bump_order_generations error:", e)
+
+
+# ---------- cached(): stampede-protected read-through cache ---------- #
+#
+# Values are stored as {"v": value, "exp": soft expiry, "d": compute seconds}
+# with a Redis TTL of ttl + stale_ttl:
+#   * fresh hit      -> served; refreshed early in the background with a
+#                       probability that grows as expiry nears (XFetch)
+#   * stale hit      -> served as is while one background task recomputes
+#   * miss           -> one caller per key recomputes (in-process futures plus
+#                       a short Redis lock across replicas), the rest wait
+# Loaders must not use request-scoped resources: background refreshes run
+# after the response is sent (see database.run_in_session).
+
+cache_stats = {"hit": 0, "stale": 0, "miss": 0, "recompute": 0, "error": 0}
+_inflight: dict[str, asyncio.Future] = {}
+_refreshing: set[str] = set()
+_background: set[asyncio.Task] = set()
+
+
+async def _read_entry(key: str):
+    try:
+        data = await redis_client.get(key)
+        entry = loads(data) if data else None
+        return entry if isinstance(entry, dict) and "exp" in entry else None
+    except Exception as e:
+        cache_stats["error"] += 1
+        print("[Cache] read error:", e)
+        return None
+
+
+async def _compute(key: str, loader, ttl: int, stale_ttl: int):
+    start = time.monotonic()
+    value = await loader()
+    if isinstance(value, BaseModel):
+        value = value.model_dump(mode="json")
+    cache_stats["recompute"] += 1
+    if value is None:
+        return None
+
+    entry = {"v": value, "exp": time.time() + ttl, "d": time.monotonic() - start}
+    try:
+        await redis_client.set(key, dumps(entry), ex=ttl + stale_ttl)
+    except Exception as e:
+        cache_stats["error"] += 1
+        print("[Cache] write error:", e)
+    return value
+
+
+async def _acquire_lock(key: str) -> bool:
+    try:
+        return bool(await redis_client.set(f"lock:{key}", "1", nx=True, px=CACHE_LOCK_TTL_MS))
+    except Exception:
+        return True  # no Redis, no cross-replica coordination
+
+
+async def _release_lock(key: str):
+    try:
+        await redis_client.delete(f"lock:{key}")
+    except Exception:
+        pass
+
+
+async def _load_once(key: str, loader, ttl: int, stale_ttl: int):
+    pending = _inflight.get(key)
+    if pending is not None:
+        return await asyncio.shield(pending)
+
+    pending = asyncio.get_running_loop().create_future()
+    _inflight[key] = pending
+    try:
+        if not await _acquire_lock(key):
+            # another replica is computing it; give it a moment to land
+            for _ in range(CACHE_LOCK_WAIT_STEPS):
+                await asyncio.sleep(CACHE_LOCK_WAIT_MS / 1000)
+                entry = await _read_entry(key)
+                if entry is not None:
+                    pending.set_result(entry["v"])
+                    return entry["v"]
+            value = await _compute(key, loader, ttl, stale_ttl)
+        else:
+            try:
+                value = await _compute(key, loader, ttl, stale_ttl)
+            finally:
+                await _release_lock(key)
+        pending.set_result(value)
+        return value
+    except BaseException as e:
+        pending.set_exception(e)
+        pending.exception()  # mark retrieved when nobody else was waiting
+        raise
+    finally:
+        _inflight.pop(key, None)
+
+
+def _refresh_in_background(key: str, loader, ttl: int, stale_ttl: int):
+    if key in _refreshing:
+        return
+
+    async def refresh():
+        try:
+            if await _acquire_lock(key):
+                try:
+                    await _compute(key, loader, ttl, stale_ttl)
+                finally:
+                    await _release_lock(key)
+        except Exception as e:
+            cache_stats["error"] += 1
+            print("[Cache] background refresh error:", e)
+        finally:
+            _refreshing.discard(key)
+
+    _refreshing.add(key)
+    task = asyncio.create_task(refresh())
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+
+
+async def get_or_compute(key: str, loader, ttl: int, stale_ttl: int = CACHE_STALE_TTL, beta: float = CACHE_EARLY_REFRESH_BETA):
+    entry = await _read_entry(key)
+    if entry is not None:
+        remaining = entry["exp"] - time.time()
+        if remaining > 0:
+            cache_stats["hit"] += 1
+            # XFetch: -delta * beta * ln(rand) grows past `remaining` more often near expiry
+            if -entry.get("d", 0) * beta * math.log(random.random() or 1e-12) >= remaining:
+                _refresh_in_background(key, loader, ttl, stale_ttl)
+            return entry["v"]
+        cache_stats["stale"] += 1
+        _refresh_in_background(key, loader, ttl, stale_ttl)
+        return entry["v"]
+
+    cache_stats["miss"] += 1
+    return await _load_once(key, loader, ttl, stale_ttl)
+
+
+def cached(key, ttl: int, stale_ttl: int = CACHE_STALE_TTL, beta: float = CACHE_EARLY_REFRESH_BETA):
+    """
+    Decorates an async loader. `key` gets the loader's arguments and returns
+    the cache key (or an awaitable of it); None skips the cache. Models are
+    stored and returned as JSON-ready dicts; None results are not cached.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            cache_key = key(*args, **kwargs)
+            if inspect.isawaitable(cache_key):
+                cache_key = await cache_key
+            if cache_key is None:
+                value = await fn(*args, **kwargs)
+                return value.model_dump(mode="json") if isinstance(value, BaseModel) else value
+            return await get_or_compute(cache_key, lambda: fn(*args, **kwargs), ttl, stale_ttl, beta)
+        return wrapper
+    return decorator
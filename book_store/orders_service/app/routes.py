@@ -1,44 +1,34 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from math import ceil
 from decimal import Decimal
+from uuid import uuid4
 
-from .database import get_db
-from . import schemas, crud, models
-from .deps import get_current_user, require_admin, fetch_book, update_book_stock
-from .redis_utils import cache_get, cache_set, cache_delete, publish_event
+from .database import DBSession, get_db, run_db, run_in_session
+from . import checkout, schemas, crud, models
+from .deps import get_current_user, require_admin, fetch_books, update_books_stock
+from .redis_utils import cached, cache_delete, bump_order_generations, get_order_generation
+from .config import ORDER_COUNT_CACHE_TTL, CHECKOUT_MODE
 
 router = APIRouter(prefix="/api/v1/orders", tags=["orders"])
 
 
 # --------- Helpers --------- #
 
-def build_order_detail(
-    db: Session,
-    order: models.Order,
-    books_cache: dict[str, dict] | None = None,
-) -> schemas.OrderDetail:
-    items = crud.get_order_items(db, order.id)
-    result_items = []
-
-    if books_cache is None:
-        books_cache = {}
-
-    for it in items:
-        if it.book_id not in books_cache:
-            books_cache[it.book_id] = fetch_book(it.book_id)
-
-        book_data = books_cache[it.book_id]
-        result_items.append(
-            schemas.OrderItemOut(
-                id=it.id,
-                book_id=it.book_id,
-                book_title=book_data.get("title"),
-                quantity=it.quantity,
-                price_at_purchase=Decimal(str(it.price_at_purchase)),
-                subtotal=Decimal(str(it.subtotal)),
-            )
+def build_order_detail(order: models.Order) -> schemas.OrderDetail:
+    # order.items must be loaded already (crud.get_order_with_items)
+    result_items = [
+        schemas.OrderItemOut(
+            id=it.id,
+            book_id=it.book_id,
+            book_title=it.book_title,
+            book_isbn=it.book_isbn,
+            book_author=it.book_author,
+            quantity=it.quantity,
+            price_at_purchase=Decimal(str(it.price_at_purchase)),
+            subtotal=Decimal(str(it.subtotal)),
         )
+        for it in order.items
+    ]
 
     return schemas.OrderDetail(
         id=order.id,
@@ -54,24 +44,31 @@ def build_order_detail(
 # --------- Endpoints --------- #
 
 @router.post("", response_model=schemas.OrderDetail, status_code=201)
-def create_order(
+async def create_order(
     payload: schemas.OrderCreate,
-    db: Session = Depends(get_db),
+    response: Response,
+    db: DBSession = Depends(get_db),
     current_user: dict = Depends(get_current_user),
 ):
     if not payload.items:
         raise HTTPException(status_code=400, detail="No items in order")
 
-    # Fetch books and validate stock
-    books_cache: dict[str, dict] = {}
+    if any(item.quantity <= 0 for item in payload.items):
+        raise HTTPException(status_code=400, detail="Quantity must be positive")
+
+    # Fetch all books in one call and validate stock
+    books_cache = await fetch_books([item.book_id for item in payload.items])
     items_data_for_db = []
+    quantities: dict[str, int] = {}
 
     for item in payload.items:
-        b = fetch_book(item.book_id)
-        books_cache[item.book_id] = b
+        quantities[item.book_id] = quantities.get(item.book_id, 0) + item.quantity
+
+    for item in payload.items:
+        b = books_cache[item.book_id]
 
         stock = b.get("stock_quantity", 0)
-        if stock < item.quantity:
+        if stock < quantities[item.book_id]:
             raise HTTPException(status_code=400, detail=f"Insufficient stock for book {b.get('title')}")
 
         price = Decimal(str(b["price"]))
@@ -80,67 +77,109 @@ def create_order(
         items_data_for_db.append(
             {
                 "book_id": item.book_id,
+                "book_title": b.get("title"),
+                "book_isbn": b.get("isbn"),
+                "book_author": b.get("author"),
                 "quantity": item.quantity,
                 "price_at_purchase": price,
                 "subtotal": subtotal,
             }
         )
 
-    # Deduct stock in Books service
-    for item in payload.items:
-        update_book_stock(item.book_id, -item.quantity)
-
-    order = crud.create_order(db, current_user["id"], items_data_for_db)
+    if CHECKOUT_MODE == "async":
+        # stock is reserved by the checkout workers; poll /{id}/status
+        order = await run_db(db, crud.create_order, current_user["id"], items_data_for_db, True)
+        await bump_order_generations(current_user["id"])
+        response.status_code = 202
+        return build_order_detail(order)
+
+    # Deduct stock in Books service, all-or-nothing; the order id is chosen
+    # up front so the stock calls can be keyed by it
+    order_id = str(uuid4())
+    await update_books_stock({book_id: -qty for book_id, qty in quantities.items()}, f"order:{order_id}:reserve")
+
+    try:
+        order = await run_db(db, crud.create_order, current_user["id"], items_data_for_db, order_id=order_id)
+    except Exception:
+        # give the reserved stock back if the order could not be stored
+        await update_books_stock(quantities, f"order:{order_id}:release")
+        raise
 
     # clear caches
-    cache_delete(f"orders:user:{current_user['id']}:page:1:all")  # simple invalidation
-    cache_delete(f"order:{order.id}")
+    await bump_order_generations(current_user["id"])
+    await cache_delete(f"order:{order.id}")
 
-    publish_event("order.created", {"order_id": order.id, "user_id": order.user_id})
-    return build_order_detail(db, order, books_cache)
+    return build_order_detail(order)
 
 
 @router.get("", response_model=schemas.PaginatedOrders)
-def list_orders(
+async def list_orders(
     page: int = Query(1, ge=1),
     limit: int = Query(20, ge=1, le=100),
-    status: str | None = Query(None, regex="^(pending|processing|completed|cancelled)$"),
-    db: Session = Depends(get_db),
+    status: str | None = Query(None, regex="^(queued|pending|processing|completed|cancelled|rejected)$"),
+    paging: str = Query("offset", regex="^(offset|cursor)$"),
+    cursor: str | None = None,
+    include_total: bool = False,
+    db: DBSession = Depends(get_db),
     current_user: dict = Depends(get_current_user),
 ):
-    cache_key = f"orders:user:{current_user['id']}:page:{page}:{status or 'all'}"
-    cached = cache_get(cache_key)
-    if cached:
-        return cached
-
-    orders, total = crud.list_orders_for_user(db, current_user["id"], page, limit, status)
-    items = []
-    for o in orders:
-        item_count = len(crud.get_order_items(db, o.id))
-        items.append(
-            schemas.OrderListItem(
-                id=o.id,
-                status=o.status,
-                total_amount=Decimal(str(o.total_amount)),
-                item_count=item_count,
-                created_at=o.created_at,
-                updated_at=o.updated_at,
+    if cursor or paging == "cursor":
+        try:
+            orders, next_cursor = await run_db(
+                db, crud.list_orders_for_user_keyset, current_user["id"], cursor, limit, status
             )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        total = await count_orders(current_user["id"], status) if include_total else None
+        return schemas.PaginatedOrders(
+            items=build_order_list_items(orders), total=total, limit=limit, next_cursor=next_cursor
         )
 
+    return await load_orders_page(current_user["id"], page, limit, status)
+
+
+def build_order_list_items(orders) -> list[schemas.OrderListItem]:
+    return [
+        schemas.OrderListItem(
+            id=o.id,
+            status=o.status,
+            total_amount=Decimal(str(o.total_amount)),
+            item_count=item_count,
+            created_at=o.created_at,
+            updated_at=o.updated_at,
+        )
+        for o, item_count in orders
+    ]
+
+
+async def order_page_key(user_id: str, page: int, limit: int, status: str | None):
+    generation = await get_order_generation(user_id)
+    if generation is None:
+        return None
+    return f"orders:user:{user_id}:{generation}:page:{page}:{limit}:{status or 'all'}"
+
+
+@cached(key=order_page_key, ttl=5 * 60)
+async def load_orders_page(user_id: str, page: int, limit: int, status: str | None):
+    orders, total = await run_in_session(crud.list_orders_for_user, user_id, page, limit, status)
     pages = ceil(total / limit) if limit else 1
-    resp = schemas.PaginatedOrders(items=items, total=total, page=page, limit=limit, pages=pages)
-    cache_set(cache_key, resp.dict(), ttl=5 * 60)
-    return resp
+    return schemas.PaginatedOrders(
+        items=build_order_list_items(orders), total=total, page=page, limit=limit, pages=pages
+    )
+
 
+# approximate: not invalidated, just short-lived
+@cached(key=lambda user_id, status: f"orders:user:{user_id}:count:{status or 'all'}", ttl=ORDER_COUNT_CACHE_TTL)
+async def count_orders(user_id: str, status: str | None):
+    return await run_in_session(crud.count_orders_for_user, user_id, status)
 
 
 @router.get("/stats", response_model=schemas.OrderStats)
-def get_stats(
-    db: Session = Depends(get_db),
+async def get_stats(
+    db: DBSession = Depends(get_db),
     current_user: dict = Depends(get_current_user),
 ):
-    total_orders, total_spent, orders_by_status, total_books = crud.get_user_stats(db, current_user["id"])
+    total_orders, total_spent, orders_by_status, total_books = await run_db(db, crud.get_user_stats, current_user["id"])
     return schemas.OrderStats(
         total_orders=total_orders,
         total_spent=Decimal(str(total_spent)),
@@ -149,37 +188,61 @@ def get_stats(
     )
 
 
-@router.get("/{order_id}", response_model=schemas.OrderDetail)
-def get_order(
+@router.get("/{order_id}/status", response_model=schemas.OrderStatusUpdateResponse)
+async def get_order_status(
     order_id: str,
-    db: Session = Depends(get_db),
+    wait: float = Query(0, ge=0, le=30),
+    db: DBSession = Depends(get_db),
     current_user: dict = Depends(get_current_user),
 ):
-    cache_key = f"order:{order_id}"
-    cached = cache_get(cache_key)
-    if cached:
-        return cached
-
-    order = crud.get_order(db, order_id)
+    order = await run_db(db, crud.get_order, order_id)
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
 
     if order.user_id != current_user["id"] and not current_user.get("is_admin"):
         raise HTTPException(status_code=403, detail="Forbidden")
 
-    detail = build_order_detail(db, order)
-    cache_set(cache_key, detail.dict(), ttl=10 * 60)
+    # long poll: with wait=N, a queued order answers as soon as checkout settles it
+    if order.status == "queued" and wait:
+        async def current_status():
+            return (await run_db(db, crud.get_order_status, order_id)).status
+
+        await checkout.wait_for_status(order_id, wait, current_status)
+
+    status = await run_db(db, crud.get_order_status, order_id)
+    return schemas.OrderStatusUpdateResponse(id=status.id, status=status.status, updated_at=status.updated_at)
+
+
+@router.get("/{order_id}", response_model=schemas.OrderDetail)
+async def get_order(
+    order_id: str,
+    current_user: dict = Depends(get_current_user),
+):
+    detail = await load_order_detail(order_id)
+    if detail is None:
+        raise HTTPException(status_code=404, detail="Order not found")
+
+    if detail["user_id"] != current_user["id"] and not current_user.get("is_admin"):
+        raise HTTPException(status_code=403, detail="Forbidden")
     return detail
 
 
+@cached(key=lambda order_id: f"order:{order_id}", ttl=10 * 60)
+async def load_order_detail(order_id: str):
+    order = await run_in_session(crud.get_order_with_items, order_id)
+    if not order:
+        return None
+    return build_order_detail(order)
+
+
 @router.patch("/{order_id}/status", response_model=schemas.OrderStatusUpdateResponse)
-def update_order_status(
+async def update_order_status(
     order_id: str,
     payload: schemas.OrderStatusUpdateRequest,
-    db: Session = Depends(get_db),
+    db: DBSession = Depends(get_db),
     admin: dict = Depends(require_admin),
 ):
-    order = crud.get_order(db, order_id)
+    order = await run_db(db, crud.get_order, order_id)
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
 
@@ -191,24 +254,24 @@ def update_order_status(
     if order.status in {"cancelled", "completed"} and payload.status != order.status:
         raise HTTPException(status_code=400, detail="Invalid status transition")
 
-    order = crud.update_order_status(db, order, payload.status)
-    cache_delete(f"order:{order_id}")
+    # queued orders belong to the checkout workers; rejected ones are final
+    if order.status in {"queued", "rejected"}:
+        raise HTTPException(status_code=400, detail="Invalid status transition")
 
-    if payload.status == "completed":
-        publish_event("order.completed", {"order_id": order.id, "user_id": order.user_id})
-    elif payload.status == "cancelled":
-        publish_event("order.cancelled", {"order_id": order.id, "user_id": order.user_id})
+    order = await run_db(db, crud.update_order_status, order, payload.status)
+    await cache_delete(f"order:{order_id}")
+    await bump_order_generations(order.user_id)
 
     return schemas.OrderStatusUpdateResponse(id=order.id, status=order.status, updated_at=order.updated_at)
 
 
 @router.delete("/{order_id}", response_model=schemas.OrderCancelResponse)
-def cancel_order(
+async def cancel_order(
     order_id: str,
-    db: Session = Depends(get_db),
+    db: DBSession = Depends(get_db),
     current_user: dict = Depends(get_current_user),
 ):
-    order = crud.get_order(db, order_id)
+    order = await run_db(db, crud.get_order, order_id)
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
 
@@ -218,10 +281,9 @@ def cancel_order(
     if order.status != "pending":
         raise HTTPException(status_code=400, detail="Cannot cancel order in current status")
 
-    order = crud.cancel_order(db, order)
-    cache_delete(f"order:{order_id}")
-
-    publish_event("order.cancelled", {"order_id": order.id, "user_id": order.user_id})
+    order = await run_db(db, crud.cancel_order, order)
+    await cache_delete(f"order:{order_id}")
+    await bump_order_generations(order.user_id)
 
     return schemas.OrderCancelResponse(
         id=order.id,
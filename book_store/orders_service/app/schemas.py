@@ -17,6 +17,8 @@ class OrderItemOut(BaseModel):
     id: str
     book_id: str
     book_title: Optional[str] = None
+    book_isbn: Optional[str] = None
+    book_author: Optional[str] = None
     quantity: int
     price_at_purchase: condecimal(max_digits=10, decimal_places=2)
     subtotal: condecimal(max_digits=10, decimal_places=2)
@@ -49,14 +51,16 @@ class OrderListItem(BaseModel):
 
 class PaginatedOrders(BaseModel):
     items: List[OrderListItem]
-    total: int
-    page: int
+    # cursor paging: total only with include_total, no page/pages
+    total: Optional[int] = None
+    page: Optional[int] = None
     limit: int
-    pages: int
+    pages: Optional[int] = None
+    next_cursor: Optional[str] = None
 
 
 class OrderStatusUpdateRequest(BaseModel):
-    status: str  # pending, processing, completed, cancelled
+    status: str  # pending, processing, completed, cancelled (queued/rejected are set by checkout)
 
 
 class OrderStatusUpdateResponse(BaseModel):
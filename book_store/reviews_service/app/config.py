@@ -9,4 +9,37 @@ AUTH_SERVICE_URL = os.getenv("AUTH_SERVICE_URL", "http://auth_service:8001")
 BOOKS_SERVICE_URL = os.getenv("BOOKS_SERVICE_URL", "http://books_service:8002")
 
 USE_FAKEREDIS = os.getenv("USE_FAKEREDIS", "False").lower() == "False"
-REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
\ No newline at end of file
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
+
+# Trusted identity headers signed by the gateway (must match the gateway)
+TRUSTED_IDENTITY = os.getenv("TRUSTED_IDENTITY", "false").lower() == "true"
+IDENTITY_SECRET = os.getenv("IDENTITY_SECRET", "super-secret-identity")
+
+# In-process cache of /auth/me lookups (seconds, capped by the token's exp)
+AUTH_CACHE_TTL = int(os.getenv("AUTH_CACHE_TTL", "30"))
+AUTH_CACHE_MAX_SIZE = int(os.getenv("AUTH_CACHE_MAX_SIZE", "10000"))
+
+# Async mode: async SQLAlchemy sessions (aiosqlite/asyncpg) instead of
+# running the blocking session in the threadpool
+ASYNC_MODE = os.getenv("ASYNC_MODE", "false").lower() == "true"
+
+# cached(): stale window served while recomputing, XFetch beta, recompute lock
+CACHE_STALE_TTL = int(os.getenv("CACHE_STALE_TTL", "300"))
+CACHE_EARLY_REFRESH_BETA = float(os.getenv("CACHE_EARLY_REFRESH_BETA", "1.0"))
+CACHE_LOCK_TTL_MS = int(os.getenv("CACHE_LOCK_TTL_MS", "10000"))
+CACHE_LOCK_WAIT_MS = int(os.getenv("CACHE_LOCK_WAIT_MS", "50"))
+CACHE_LOCK_WAIT_STEPS = int(os.getenv("CACHE_LOCK_WAIT_STEPS", "10"))
+
+# JSON library for Redis payloads and responses: auto, orjson, msgspec or json
+JSON_BACKEND = os.getenv("JSON_BACKEND", "auto")
+
+# Review pages and counts are invalidated by per-book / per-user generation
+# bumps, so they can live long
+REVIEW_PAGE_CACHE_TTL = int(os.getenv("REVIEW_PAGE_CACHE_TTL", "3600"))
+
+# Outbox relay and Redis Streams consumers (see events.py)
+OUTBOX_RELAY_BATCH = int(os.getenv("OUTBOX_RELAY_BATCH", "500"))
+OUTBOX_POLL_MS = int(os.getenv("OUTBOX_POLL_MS", "500"))
+EVENT_STREAM_MAXLEN = int(os.getenv("EVENT_STREAM_MAXLEN", "100000"))
+EVENT_CONSUMER_BATCH = int(os.getenv("EVENT_CONSUMER_BATCH", "100"))
+EVENT_CLAIM_IDLE_MS = int(os.getenv("EVENT_CLAIM_IDLE_MS", "30000"))
@@ -1,12 +1,54 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from typing import List, Optional, Dict
 from . import models
+from .events import publish_event
+from .pagination import SortKey, paginate
+
+
+def _ensure_rating_stats(db: Session, book_id: str):
+    dialect = db.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        insert = sqlite_insert if dialect == "sqlite" else pg_insert
+        db.execute(
+            insert(models.BookRatingStats).values(book_id=book_id).on_conflict_do_nothing(index_elements=["book_id"])
+        )
+    elif db.get(models.BookRatingStats, book_id) is None:
+        db.add(models.BookRatingStats(book_id=book_id))
+        db.flush()
+
+
+def _add_rating(db: Session, book_id: str, rating: int, sign: int):
+    # increments in SQL, so concurrent writers to one book do not lose updates
+    stats = models.BookRatingStats
+    star = getattr(stats, f"stars_{rating}")
+    db.query(stats).filter(stats.book_id == book_id).update(
+        {
+            stats.review_count: stats.review_count + sign,
+            stats.rating_sum: stats.rating_sum + sign * rating,
+            star: star + sign,
+            stats.version: stats.version + 1,
+        },
+        synchronize_session=False,
+    )
+
+
+def _publish_review_event(db: Session, topic: str, review: models.Review):
+    # carries the book's totals after this write, not a delta, so consumers
+    # can apply an event more than once; the version lets them drop events
+    # that arrive after a newer one
+    payload = {"review_id": review.id, "book_id": review.book_id, **rating_stats(db, review.book_id)}
+    publish_event(db, topic, payload)
 
 
 def create_review(db: Session, data: dict):
     review = models.Review(**data)
     db.add(review)
+    _ensure_rating_stats(db, review.book_id)
+    _add_rating(db, review.book_id, review.rating, +1)
+    db.flush()  # get review.id
+    _publish_review_event(db, "review.created", review)
     db.commit()
     db.refresh(review)
     return review
@@ -23,39 +65,73 @@ def get_user_review_for_book(db: Session, user_id: str, book_id: str):
     ).first()
 
 
-def list_reviews_for_book(db: Session, book_id: str, page: int, limit: int,
-                          rating: Optional[int], sort_by: str, order: str):
+def _book_reviews(db: Session, book_id: str, rating: Optional[int]):
     q = db.query(models.Review).filter(models.Review.book_id == book_id)
-
     if rating:
         q = q.filter(models.Review.rating == rating)
+    return q
+
+
+def _review_sort_keys(sort_by: str, order: str) -> List[SortKey]:
+    desc = order != "asc"
+    column = models.Review.rating if sort_by == "rating" else models.Review.created_at
+    return [SortKey(column, desc), SortKey(models.Review.id, desc)]
+
+
+def _ordered(q, keys: List[SortKey]):
+    return q.order_by(*(key.column.desc() if key.desc else key.column.asc() for key in keys))
 
-    if order == "asc":
-        if sort_by == "rating":
-            q = q.order_by(models.Review.rating.asc())
-        else:
-            q = q.order_by(models.Review.created_at.asc())
-    else:
-        if sort_by == "rating":
-            q = q.order_by(models.Review.rating.desc())
-        else:
-            q = q.order_by(models.Review.created_at.desc())
+
+def list_reviews_for_book(db: Session, book_id: str, page: int, limit: int,
+                          rating: Optional[int], sort_by: str, order: str):
+    q = _book_reviews(db, book_id, rating)
 
     total = q.count()
-    items = q.offset((page-1)*limit).limit(limit).all()
+    items = _ordered(q, _review_sort_keys(sort_by, order)).offset((page-1)*limit).limit(limit).all()
     return items, total
 
 
+def list_reviews_for_book_keyset(db: Session, book_id: str, cursor: Optional[str], limit: int,
+                                 rating: Optional[int], sort_by: str, order: str):
+    """Raises ValueError for a cursor that does not belong to this sort."""
+    keys = _review_sort_keys(sort_by, order)
+    sort = f"reviews:{'rating' if sort_by == 'rating' else 'created_at'}:{'asc' if order == 'asc' else 'desc'}"
+    return paginate(_book_reviews(db, book_id, rating), keys, sort, cursor, limit)
+
+
+def count_reviews_for_book(db: Session, book_id: str, rating: Optional[int]) -> int:
+    return _book_reviews(db, book_id, rating).count()
+
+
+USER_REVIEW_SORT_KEYS = [SortKey(models.Review.created_at, desc=True), SortKey(models.Review.id, desc=True)]
+
+
 def get_reviews_by_user(db: Session, user_id: str, page: int, limit: int):
     q = db.query(models.Review).filter(models.Review.user_id == user_id)
     total = q.count()
-    items = q.order_by(models.Review.created_at.desc()).offset((page-1)*limit).limit(limit).all()
+    items = _ordered(q, USER_REVIEW_SORT_KEYS).offset((page-1)*limit).limit(limit).all()
     return items, total
 
 
+def get_reviews_by_user_keyset(db: Session, user_id: str, cursor: Optional[str], limit: int):
+    """Raises ValueError for a cursor that was not issued by this listing."""
+    q = db.query(models.Review).filter(models.Review.user_id == user_id)
+    return paginate(q, USER_REVIEW_SORT_KEYS, "reviews:user:created_at:desc", cursor, limit)
+
+
+def count_reviews_by_user(db: Session, user_id: str) -> int:
+    return db.query(models.Review).filter(models.Review.user_id == user_id).count()
+
+
 def update_review(db: Session, review: models.Review, data: dict):
+    old_rating = review.rating
     for k, v in data.items():
         setattr(review, k, v)
+    if review.rating != old_rating:
+        _ensure_rating_stats(db, review.book_id)
+        _add_rating(db, review.book_id, old_rating, -1)
+        _add_rating(db, review.book_id, review.rating, +1)
+    _publish_review_event(db, "review.updated", review)
     db.commit()
     db.refresh(review)
     return review
@@ -63,21 +139,32 @@ def update_review(db: Session, review: models.Review, data: dict):
 
 def delete_review(db: Session, review: models.Review):
     db.delete(review)
+    _add_rating(db, review.book_id, review.rating, -1)
+    _publish_review_event(db, "review.deleted", review)
     db.commit()
 
 
-def review_summary(db: Session, book_id: str):
-    rows = db.query(
-        models.Review.rating, func.count(models.Review.id)
-    ).filter(
-        models.Review.book_id == book_id
-    ).group_by(models.Review.rating).all()
+def rating_stats(db: Session, book_id: str) -> Dict[str, int]:
+    # a query, not db.get: the row may have just been updated in SQL
+    stats = models.BookRatingStats
+    row = db.query(stats.review_count, stats.rating_sum, stats.version).filter(stats.book_id == book_id).first()
+    if row is None:
+        return {"review_count": 0, "rating_sum": 0, "version": 0}
+    return {"review_count": row.review_count, "rating_sum": row.rating_sum, "version": row.version}
 
-    total = sum(count for _, count in rows) or 0
-    avg = sum(rating * count for rating, count in rows) / total if total else 0
 
-    dist = {str(i): 0 for i in range(1, 6)}
-    for rating, count in rows:
-        dist[str(rating)] = count
+def average_rating(db: Session, book_id: str) -> float:
+    stats = db.get(models.BookRatingStats, book_id)
+    if stats is None or not stats.review_count:
+        return 0
+    return stats.rating_sum / stats.review_count
+
+
+def review_summary(db: Session, book_id: str):
+    stats = db.get(models.BookRatingStats, book_id)
+    if stats is None or not stats.review_count:
+        return 0, 0, {str(i): 0 for i in range(1, 6)}
 
-    return total, avg, dist
\ No newline at end of file
+    avg = stats.rating_sum / stats.review_count
+    dist = {str(i): getattr(stats, f"stars_{i}") for i in range(1, 6)}
+    return stats.review_count, avg, dist
@@ -1,6 +1,8 @@
+from typing import Union
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
-from .config import DATABASE_URL
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
+from .config import DATABASE_URL, ASYNC_MODE
 
 engine = create_engine(
     DATABASE_URL,
@@ -10,10 +12,63 @@ engine = create_engine(
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+DBSession = Session
+
+
+def async_database_url(url: str) -> str:
+    for sync_prefix, async_prefix in (
+        ("sqlite://", "sqlite+aiosqlite://"),
+        ("postgresql+psycopg2://", "postgresql+asyncpg://"),
+        ("postgresql://", "postgresql+asyncpg://"),
+    ):
+        if url.startswith(sync_prefix):
+            return async_prefix + url[len(sync_prefix):]
+    return url
+
+
+if ASYNC_MODE:
+    # imported lazily: sqlalchemy.ext.asyncio needs greenlet, which sync-only
+    # deployments don't have to install
+    from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+    DBSession = Union[Session, AsyncSession]
+    async_engine = create_async_engine(async_database_url(DATABASE_URL))
+    # objects are used after commit outside the session's greenlet
+    AsyncSessionLocal = sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+
+async def get_db():
+    if ASYNC_MODE:
+        async with AsyncSessionLocal() as db:
+            yield db
+        return
 
-def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+async def run_db(db: DBSession, fn, *args, **kwargs):
+    # crud functions stay sync; they run on the async connection's greenlet
+    # in async mode, or in the threadpool with a blocking session otherwise
+    if ASYNC_MODE:
+        return await db.run_sync(fn, *args, **kwargs)
+    return await run_in_threadpool(fn, db, *args, **kwargs)
+
+
+async def run_in_session(fn, *args, **kwargs):
+    # own short-lived session for work that outlives the request
+    # (background cache refreshes); same dispatch as run_db
+    if ASYNC_MODE:
+        async with AsyncSessionLocal() as db:
+            return await db.run_sync(fn, *args, **kwargs)
+
+    def call():
+        db = SessionLocal()
+        try:
+            return fn(db, *args, **kwargs)
+        finally:
+            db.close()
+    return await run_in_threadpool(call)
@@ -0,0 +1,255 @@
+import asyncio
+import os
+import socket
+import time
+
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+
+from . import models
+from .config import (
+    OUTBOX_RELAY_BATCH,
+    OUTBOX_POLL_MS,
+    EVENT_STREAM_MAXLEN,
+    EVENT_CONSUMER_BATCH,
+    EVENT_CLAIM_IDLE_MS,
+)
+from .database import run_in_session
+from .redis_utils import redis_client
+from .serialization import dumps, loads
+
+# Transactional outbox relayed to Redis Streams.
+#
+#   publish_event(db, topic, payload)  adds an outbox row to db's transaction,
+#                                      so the event exists iff the change commits
+#   start_relay()                      one replica at a time (Redis lock) moves
+#                                      outbox rows to the stream events:{topic}
+#                                      in pipelined batches, then deletes them
+#   consume(group, topics, handler)    consumer-group reader: each message goes
+#                                      to one replica of the group and is acked
+#                                      once handled, a batch at a time
+#
+# Delivery is at-least-once: a relay that dies between XADD and DELETE sends
+# its batch again, and a message whose handler raised (or whose consumer died)
+# is claimed again after EVENT_CLAIM_IDLE_MS. Handlers must be idempotent;
+# entries carry the row's event_id, the same on every send, for those that
+# need to deduplicate (not the outbox id: SQLite reuses the ids of deleted
+# rows). Messages are relayed in outbox id order.
+#
+# Cache invalidations that every replica must see (auth_cache, the books L1)
+# stay on plain pub/sub.
+
+STREAM_PREFIX = "events:"
+RELAY_LOCK_KEY = "outbox:relay:reviews"
+RELAY_LOCK_MS = 5000
+# stable across restarts of the same container, so its pending entries are
+# picked up again under the same name
+CONSUMER_NAME = f"{socket.gethostname()}-{os.getpid()}"
+
+event_stats = {"relayed": 0, "relay_batches": 0, "consumed": 0, "failed": 0, "reclaimed": 0}
+
+_loop: asyncio.AbstractEventLoop | None = None
+_wake: asyncio.Event | None = None
+_groups: dict[str, list[str]] = {}
+
+
+def stream_name(topic: str) -> str:
+    return STREAM_PREFIX + topic
+
+
+def publish_event(db: Session, topic: str, payload: dict):
+    """Adds an event to db's current transaction; the caller commits."""
+    db.add(models.OutboxEvent(topic=topic, payload=dumps(payload).decode()))
+    event.listen(db, "after_commit", _wake_relay, once=True)
+
+
+def _wake_relay(session):
+    # after_commit runs in the threadpool (or the async session's greenlet)
+    if _loop is not None:
+        _loop.call_soon_threadsafe(_wake.set)
+
+
+# ---------- relay ---------- #
+
+def _pending(db: Session, limit: int):
+    outbox = models.OutboxEvent
+    rows = db.query(outbox.id, outbox.event_id, outbox.topic, outbox.payload).order_by(outbox.id).limit(limit)
+    return [tuple(row) for row in rows]
+
+
+def _delete(db: Session, ids: list):
+    db.query(models.OutboxEvent).filter(models.OutboxEvent.id.in_(ids)).delete(synchronize_session=False)
+    db.commit()
+
+
+async def relay_once(limit: int = OUTBOX_RELAY_BATCH) -> int:
+    rows = await run_in_session(_pending, limit)
+    if not rows:
+        return 0
+
+    pipe = redis_client.pipeline(transaction=False)
+    for outbox_id, event_id, topic, payload in rows:
+        pipe.xadd(
+            stream_name(topic),
+            # rows written before event_id existed fall back to the outbox id
+            {"id": outbox_id, "event_id": event_id or f"outbox:{outbox_id}", "topic": topic, "payload": payload},
+            maxlen=EVENT_STREAM_MAXLEN,
+            approximate=True,
+        )
+    await pipe.execute()
+    await run_in_session(_delete, [row[0] for row in rows])
+
+    event_stats["relayed"] += len(rows)
+    event_stats["relay_batches"] += 1
+    return len(rows)
+
+
+async def _hold_relay_lock() -> bool:
+    if await redis_client.set(RELAY_LOCK_KEY, CONSUMER_NAME, nx=True, px=RELAY_LOCK_MS):
+        return True
+    if await redis_client.get(RELAY_LOCK_KEY) == CONSUMER_NAME:
+        await redis_client.pexpire(RELAY_LOCK_KEY, RELAY_LOCK_MS)
+        return True
+    return False
+
+
+async def _relay():
+    while True:
+        _wake.clear()
+        try:
+            # full batches mean a backlog: keep going without waiting
+            while await _hold_relay_lock() and await relay_once() == OUTBOX_RELAY_BATCH:
+                pass
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print("[Events] relay error:", e)
+        # woken early by this replica's commits; the poll covers the others'
+        try:
+            await asyncio.wait_for(_wake.wait(), OUTBOX_POLL_MS / 1000)
+        except asyncio.TimeoutError:
+            pass
+
+
+def start_relay() -> asyncio.Task:
+    global _loop, _wake
+    _loop = asyncio.get_running_loop()
+    _wake = asyncio.Event()
+    return asyncio.create_task(_relay())
+
+
+# ---------- consumers ---------- #
+
+async def _ensure_group(group: str, stream: str):
+    try:
+        await redis_client.xgroup_create(stream, group, id="0", mkstream=True)
+    except Exception as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+async def _handle(group: str, stream: str, messages, handler, batched: bool):
+    if batched:
+        # one call for the whole read; acked together or left pending together
+        events = [(fields["topic"], loads(fields["payload"])) for _, fields in messages if fields]
+        try:
+            if events:
+                await handler(events)
+        except Exception as e:
+            event_stats["failed"] += len(messages)
+            print(f"[Events] {group} could not handle a batch of {len(messages)} from {stream}:", e)
+            return
+        await redis_client.xack(stream, group, *(message_id for message_id, _ in messages))
+        event_stats["consumed"] += len(messages)
+        return
+
+    acked = []
+    for message_id, fields in messages:
+        if not fields:  # trimmed from the stream while pending
+            acked.append(message_id)
+            continue
+        try:
+            await handler(fields["topic"], loads(fields["payload"]))
+            acked.append(message_id)
+        except Exception as e:
+            event_stats["failed"] += 1
+            print(f"[Events] {group} could not handle {stream} {message_id}:", e)
+    if acked:
+        await redis_client.xack(stream, group, *acked)
+        event_stats["consumed"] += len(acked)
+
+
+async def consume(
+    group: str,
+    topics,
+    handler,
+    batch: int = EVENT_CONSUMER_BATCH,
+    block_ms: int = 1000,
+    consumer: str = CONSUMER_NAME,
+    batched: bool = False,
+):
+    """
+    Reads `topics` as consumer group `group` until cancelled, awaiting
+    handler(topic, payload) for each event, or handler([(topic, payload), ...])
+    once per read with batched=True. Failed events stay pending and are
+    retried after EVENT_CLAIM_IDLE_MS, by whichever consumer claims them.
+    Tasks sharing a group within one process need their own `consumer`.
+    """
+    streams = [stream_name(topic) for topic in topics]
+    _groups[group] = streams
+    ready = False
+    last_claim = 0.0
+    while True:
+        try:
+            if not ready:
+                for stream in streams:
+                    await _ensure_group(group, stream)
+                ready = True
+
+            if time.monotonic() - last_claim >= EVENT_CLAIM_IDLE_MS / 1000:
+                last_claim = time.monotonic()
+                for stream in streams:
+                    claimed = (await redis_client.xautoclaim(
+                        stream, group, consumer, EVENT_CLAIM_IDLE_MS, count=batch
+                    ))[1]
+                    if claimed:
+                        event_stats["reclaimed"] += len(claimed)
+                        await _handle(group, stream, claimed, handler, batched)
+
+            response = await redis_client.xreadgroup(
+                group, consumer, {stream: ">" for stream in streams}, count=batch, block=block_ms
+            )
+            for stream, messages in response or []:
+                await _handle(group, stream, messages, handler, batched)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[Events] consumer {group} error:", e)
+            ready = False
+            await asyncio.sleep(1)
+
+
+def start_consumer(group: str, topics, handler, **options) -> asyncio.Task:
+    return asyncio.create_task(consume(group, topics, handler, **options))
+
+
+# ---------- metrics ---------- #
+
+def _outbox_backlog(db: Session):
+    count, oldest = db.query(func.count(models.OutboxEvent.id), func.min(models.OutboxEvent.created_at)).one()
+    return {"rows": count, "oldest": oldest.isoformat() if oldest else None}
+
+
+async def stats() -> dict:
+    """Relay and consumer counters, outbox backlog and per-group lag."""
+    groups = {}
+    for group, streams in _groups.items():
+        for stream in streams:
+            try:
+                info = next((g for g in await redis_client.xinfo_groups(stream) if g["name"] == group), None)
+            except Exception:
+                info = None
+            if info is not None:
+                # "lag" (entries not yet delivered) needs Redis 7
+                groups[f"{group} {stream}"] = {"pending": info.get("pending"), "lag": info.get("lag")}
+    return {**event_stats, "outbox": await run_in_session(_outbox_backlog), "groups": groups}
@@ -1,14 +1,41 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from .database import Base, engine
+from . import auth_cache, deps, events, redis_utils
 from .routes import router
+from .migrations import migrate
+from .serialization import FastJSONResponse
 
-app = FastAPI(title="BookHub Reviews Service", version="1.0")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    listener = auth_cache.start_invalidation_listener()
+    relay = events.start_relay()
+    yield
+    listener.cancel()
+    relay.cancel()
+    await deps.http_client.aclose()
+
+
+app = FastAPI(title="BookHub Reviews Service", version="1.0", lifespan=lifespan, default_response_class=FastJSONResponse)
 
 Base.metadata.create_all(bind=engine)
+# bring databases created by older versions up to date
+migrate()
 
 app.include_router(router)
 
 
 @app.get("/")
 def root():
-    return {"status": "Reviews service running"}
\ No newline at end of file
+    return {"status": "Reviews service running"}
+
+
+@app.get("/stats/cache")
+def cache_stats():
+    return redis_utils.cache_stats
+
+
+@app.get("/stats/events")
+async def event_stats():
+    return await events.stats()
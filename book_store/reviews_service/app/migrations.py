@@ -0,0 +1,92 @@
+"""
+Versioned schema migrations for the reviews database.
+
+create_all only creates missing tables, so changes to existing ones
+(columns, indexes) are numbered steps here. Each version runs once, in its
+own transaction, and is recorded in schema_migrations; steps are written to
+be harmless on a database create_all just built from the current models.
+Never edit an applied version - add a new one.
+
+    python -m app.migrations            # apply pending versions
+    python -m app.migrations status
+"""
+import sys
+from datetime import datetime, timezone
+
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import IntegrityError
+
+from . import models
+from .database import engine
+from .rebuild_rating_stats import rebuild as rebuild_rating_stats
+
+# uq_book_user already serves book_id/user_id equality lookups; these add the
+# sort keys used by crud.list_reviews_for_book and get_reviews_by_user
+MIGRATIONS = [
+    (1, "listing indexes", [
+        "CREATE INDEX IF NOT EXISTS ix_reviews_book_created_at ON reviews (book_id, created_at, id)",
+        "CREATE INDEX IF NOT EXISTS ix_reviews_book_rating ON reviews (book_id, rating, id)",
+        "CREATE INDEX IF NOT EXISTS ix_reviews_user_created_at ON reviews (user_id, created_at, id)",
+    ]),
+    (2, "book rating stats", [
+        lambda conn: models.BookRatingStats.__table__.create(conn, checkfirst=True),
+        rebuild_rating_stats,
+    ]),
+    (3, "rating stats version", [
+        lambda conn: _add_columns(conn, "book_rating_stats", {"version": "INTEGER NOT NULL DEFAULT 0"}),
+    ]),
+    (4, "outbox event ids", [
+        lambda conn: _add_columns(conn, "outbox", {"event_id": "VARCHAR(36)"}),
+    ]),
+]
+
+
+def _add_columns(conn, table: str, columns: dict):
+    existing = {c["name"] for c in inspect(conn).get_columns(table)}
+    for name, ddl in columns.items():
+        if name not in existing:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+
+
+def _ensure_table(conn):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version INTEGER PRIMARY KEY, name VARCHAR(255) NOT NULL, applied_at VARCHAR(40) NOT NULL)"
+    ))
+
+
+def applied_versions() -> set:
+    with engine.begin() as conn:
+        _ensure_table(conn)
+        return {row[0] for row in conn.execute(text("SELECT version FROM schema_migrations"))}
+
+
+def migrate():
+    done = applied_versions()
+    for version, name, steps in MIGRATIONS:
+        if version in done:
+            continue
+        try:
+            with engine.begin() as conn:
+                for step in steps:
+                    if isinstance(step, str):
+                        conn.execute(text(step))
+                    else:
+                        step(conn)
+                conn.execute(
+                    text("INSERT INTO schema_migrations (version, name, applied_at) VALUES (:v, :n, :t)"),
+                    {"v": version, "n": name, "t": datetime.now(timezone.utc).isoformat()},
+                )
+        except IntegrityError:
+            # another replica applied it first
+            continue
+        print(f"[Migrations] applied {version}: {name}")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["status"]:
+        done = applied_versions()
+        for version, name, _ in MIGRATIONS:
+            print(f"{version:>4} {'applied' if version in done else 'pending':8} {name}")
+    else:
+        migrate()
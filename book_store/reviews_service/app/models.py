@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, Text, DateTime, UniqueConstraint
+from sqlalchemy import Column, String, Integer, Text, DateTime, UniqueConstraint, Index
 from sqlalchemy.sql import func
 from uuid import uuid4
 from .database import Base
@@ -22,4 +22,40 @@ class Review(Base):
 
     __table_args__ = (
         UniqueConstraint("book_id", "user_id", name="uq_book_user"),
-    )
\ No newline at end of file
+        # also created on existing databases by migrations.py
+        Index("ix_reviews_book_created_at", "book_id", "created_at", "id"),
+        Index("ix_reviews_book_rating", "book_id", "rating", "id"),
+        Index("ix_reviews_user_created_at", "user_id", "created_at", "id"),
+    )
+
+
+class BookRatingStats(Base):
+    # running totals kept in step with reviews by crud, so summaries are one row
+    __tablename__ = "book_rating_stats"
+
+    book_id = Column(String(36), primary_key=True)
+    review_count = Column(Integer, nullable=False, default=0)
+    rating_sum = Column(Integer, nullable=False, default=0)
+    stars_1 = Column(Integer, nullable=False, default=0)
+    stars_2 = Column(Integer, nullable=False, default=0)
+    stars_3 = Column(Integer, nullable=False, default=0)
+    stars_4 = Column(Integer, nullable=False, default=0)
+    stars_5 = Column(Integer, nullable=False, default=0)
+    # bumped by every change to the totals; orders the review events a book's
+    # read model applies
+    version = Column(Integer, nullable=False, default=0, server_default="0")
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class OutboxEvent(Base):
+    # written in the same transaction as the change it describes; relayed to
+    # Redis Streams and deleted by events.py
+    __tablename__ = "outbox"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    # what consumers deduplicate on: SQLite hands out the ids of deleted rows
+    # again, and the relay deletes every row it sends
+    event_id = Column(String(36), default=uuid_str)
+    topic = Column(String(100), nullable=False)
+    payload = Column(Text, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
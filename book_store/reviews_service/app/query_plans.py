@@ -0,0 +1,87 @@
+"""
+EXPLAIN check for the reviews service's hot queries: exits 1 when one of
+them reads a whole table instead of going through an index. Applies pending
+migrations to the configured database first. On Postgres sequential scans
+are disabled for the check, so it asks whether a usable index exists rather
+than what the planner prefers for a small table.
+
+    python -m app.query_plans
+"""
+import re
+import sys
+
+from sqlalchemy import text
+
+from . import crud, models
+from .database import Base, SessionLocal, engine
+from .migrations import migrate
+
+
+BOOK = USER = "00000000-0000-0000-0000-000000000000"
+
+
+def book_reviews(sort_by="created_at", rating=None):
+    def build(db):
+        keys = crud._review_sort_keys(sort_by, "desc")
+        return crud._ordered(crud._book_reviews(db, BOOK, rating), keys).limit(20)
+    return build
+
+
+CHECKS = {
+    "reviews of a book, newest": book_reviews(),
+    "reviews of a book by rating": book_reviews("rating"),
+    "reviews of a book with a rating": book_reviews(rating=5),
+    "reviews by a user": lambda db: crud._ordered(
+        db.query(models.Review).filter(models.Review.user_id == USER), crud.USER_REVIEW_SORT_KEYS
+    ).limit(20),
+    "rating stats of a book": lambda db: db.query(models.BookRatingStats).filter(
+        models.BookRatingStats.book_id == BOOK
+    ),
+}
+
+
+TABLES = set(Base.metadata.tables)
+
+
+def explain(db, query) -> list[str]:
+    sql = query.statement.compile(dialect=engine.dialect, compile_kwargs={"literal_binds": True})
+    if engine.dialect.name == "sqlite":
+        return [row[-1] for row in db.execute(text(f"EXPLAIN QUERY PLAN {sql}"))]
+    db.execute(text("SET LOCAL enable_seqscan = off"))
+    return [row[0] for row in db.execute(text(f"EXPLAIN {sql}"))]
+
+
+def full_scans(plan: list[str]) -> list[str]:
+    scans = []
+    for line in plan:
+        # SQLite: "SCAN books" / "SCAN TABLE books" without "USING ... INDEX"
+        sqlite_scan = re.match(r"\s*SCAN (?:TABLE )?(\w+)", line)
+        if sqlite_scan and sqlite_scan.group(1) in TABLES and "USING" not in line:
+            scans.append(line.strip())
+        pg_scan = re.search(r"Seq Scan on (\w+)", line)
+        if pg_scan and pg_scan.group(1) in TABLES:
+            scans.append(line.strip())
+    return scans
+
+
+def main() -> int:
+    migrate()
+    failed = 0
+    db = SessionLocal()
+    try:
+        for name, build in CHECKS.items():
+            plan = explain(db, build(db))
+            scans = full_scans(plan)
+            sort = any("TEMP B-TREE FOR ORDER BY" in line or line.lstrip().startswith("Sort") for line in plan)
+            print(f"{'FULL SCAN' if scans else 'ok':9} {name}{' (sorts in memory)' if sort and not scans else ''}")
+            for line in plan if scans else ():
+                print(f"          {line}")
+            failed += bool(scans)
+            db.rollback()
+    finally:
+        db.close()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
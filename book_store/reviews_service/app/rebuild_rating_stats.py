@@ -0,0 +1,41 @@
+"""
+Recomputes book_rating_stats from the reviews table.
+
+crud keeps the per-book count, sum and star histogram in step with every
+review write; this recomputes them all in one upsert, for after bulk
+imports, manual edits or a suspected drift. Rows are zeroed and updated in
+place rather than replaced, so each book keeps the version its rating events
+are ordered by. Also run as migration 2 to fill the table on an existing
+database.
+
+    python -m app.rebuild_rating_stats
+"""
+from sqlalchemy import text
+
+from .database import engine
+
+_TOTALS = ("review_count", "rating_sum", "stars_1", "stars_2", "stars_3", "stars_4", "stars_5")
+_STARS = ", ".join(f"SUM(CASE WHEN rating = {i} THEN 1 ELSE 0 END)" for i in range(1, 6))
+
+
+def rebuild(conn):
+    # books whose reviews are all gone keep their row, at zero
+    conn.execute(text(
+        f"UPDATE book_rating_stats SET {', '.join(f'{c} = 0' for c in _TOTALS)}, updated_at = CURRENT_TIMESTAMP"
+    ))
+    # WHERE 1 = 1 keeps SQLite from reading ON CONFLICT as a join constraint
+    result = conn.execute(text(
+        f"INSERT INTO book_rating_stats (book_id, {', '.join(_TOTALS)}, updated_at) "
+        f"SELECT book_id, COUNT(*), SUM(rating), {_STARS}, CURRENT_TIMESTAMP "
+        "FROM reviews WHERE 1 = 1 GROUP BY book_id "
+        f"ON CONFLICT (book_id) DO UPDATE SET {', '.join(f'{c} = excluded.{c}' for c in _TOTALS)}"
+    ))
+    print(f"[RatingStats] rebuilt stats for {result.rowcount} books")
+
+
+if __name__ == "__main__":
+    from .migrations import migrate  # migrations imports this module
+
+    migrate()
+    with engine.begin() as conn:
+        rebuild(conn)
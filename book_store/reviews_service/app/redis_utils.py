@@ -1,34 +1,284 @@
-import json
-from .config import USE_FAKEREDIS, REDIS_URL
+import asyncio
+import functools
+import inspect
+import hashlib
+import math
+import random
+import time
+from typing import NamedTuple
+
+from fastapi import Request, Response
+from pydantic import BaseModel
+
+from .config import (
+    USE_FAKEREDIS,
+    REDIS_URL,
+    CACHE_STALE_TTL,
+    CACHE_EARLY_REFRESH_BETA,
+    CACHE_LOCK_TTL_MS,
+    CACHE_LOCK_WAIT_MS,
+    CACHE_LOCK_WAIT_STEPS,
+)
+from .serialization import dumps, loads
 
 if USE_FAKEREDIS:
-    import fakeredis
-    redis_client = fakeredis.FakeStrictRedis(decode_responses=True)
+    from fakeredis import aioredis
+    redis_client = aioredis.FakeRedis(decode_responses=True)
     print("[Reviews] Using fakeredis")
 else:
-    import redis
+    import redis.asyncio as redis
     redis_client = redis.from_url(REDIS_URL, decode_responses=True)
     print("[Reviews] Using real Redis:", REDIS_URL)
 
 
-def cache_set(key, value, ttl):
+async def cache_set(key, value, ttl):
     try:
-        redis_client.set(key, json.dumps(value), ex=ttl)
+        await redis_client.set(key, dumps(value), ex=ttl)
     except:
         pass
 
-def cache_get(key):
+async def cache_get(key):
     try:
-        val = redis_client.get(key)
-        return json.loads(val) if val else None
+        val = await redis_client.get(key)
+        return loads(val) if val else None
     except:
         return None
 
-def cache_delete(key):
+async def cache_delete(key):
     try:
-        redis_client.delete(key)
+        await redis_client.delete(key)
     except:
         pass
 
-def publish_event(topic: str, payload: dict):
-    print(f"[PUB] {topic} => {payload}")
\ No newline at end of file
+
+# Review pages and counts embed their book's (or user's) generation number
+# in the key: reviews:book:{id}:gen and reviews:user:{id}:gen. A write bumps
+# both in one round trip, which orphans every cached page of that book and
+# user whatever its filters, sort or limit; the old keys just age out.
+
+def review_generation_key(scope: str, owner_id: str) -> str:
+    return f"reviews:{scope}:{owner_id}:gen"
+
+
+async def get_review_generation(scope: str, owner_id: str):
+    try:
+        return int(await redis_client.get(review_generation_key(scope, owner_id)) or 0)
+    except Exception as e:
+        print("[Redis] get_review_generation error:", e)
+        return None
+
+
+async def bump_review_generations(book_id: str, user_id: str):
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.incr(review_generation_key("book", book_id))
+        pipe.incr(review_generation_key("user", user_id))
+        await pipe.execute()
+    except Exception as e:
+        print("[Redis] bump_review_generations error:", e)
+
+
+# ---------- cached(): stampede-protected read-through cache ---------- #
+#
+# Values are stored as {"v": value, "exp": soft expiry, "d": compute seconds}
+# with a Redis TTL of ttl + stale_ttl:
+#   * fresh hit      -> served; refreshed early in the background with a
+#                       probability that grows as expiry nears (XFetch)
+#   * stale hit      -> served as is while one background task recomputes
+#   * miss           -> one caller per key recomputes (in-process futures plus
+#                       a short Redis lock across replicas), the rest wait
+# Loaders must not use request-scoped resources: background refreshes run
+# after the response is sent (see database.run_in_session).
+
+# Rendered mode (cached(render=True)) keeps the response body itself: the
+# JSON bytes plus their ETag, stored in Redis as "R1 <exp> <d> <etag>\n<body>".
+# Hits go out through cached_response() as a raw Response, skipping decode,
+# response_model validation and re-encoding.
+
+RENDERED_PREFIX = "R1 "
+
+
+class CachedBody(NamedTuple):
+    body: bytes
+    etag: str
+
+
+def render_body(value) -> CachedBody | None:
+    if value is None:
+        return None
+    if isinstance(value, BaseModel):
+        body = value.model_dump_json().encode("utf-8")
+    else:
+        body = dumps(value)
+    return CachedBody(body, f'"{hashlib.md5(body).hexdigest()}"')
+
+
+def cached_response(request: Request, cached: CachedBody) -> Response:
+    headers = {"ETag": cached.etag}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and cached.etag in {tag.strip() for tag in if_none_match.split(",")}:
+        return Response(status_code=304, headers=headers)
+    return Response(cached.body, media_type="application/json", headers=headers)
+
+
+def _decode_entry(data: str):
+    if data.startswith(RENDERED_PREFIX):
+        header, body = data.split("\n", 1)
+        _, exp, delta, etag = header.split(" ")
+        return {"v": CachedBody(body.encode("utf-8"), etag), "exp": float(exp), "d": float(delta)}
+    entry = loads(data)
+    return entry if isinstance(entry, dict) and "exp" in entry else None
+
+
+def _encode_entry(entry: dict) -> str:
+    value = entry["v"]
+    if isinstance(value, CachedBody):
+        return f"{RENDERED_PREFIX}{entry['exp']} {entry['d']} {value.etag}\n{value.body.decode('utf-8')}"
+    return dumps(entry)
+
+
+cache_stats = {"hit": 0, "stale": 0, "miss": 0, "recompute": 0, "error": 0}
+_inflight: dict[str, asyncio.Future] = {}
+_refreshing: set[str] = set()
+_background: set[asyncio.Task] = set()
+
+
+async def _read_entry(key: str):
+    try:
+        data = await redis_client.get(key)
+        return _decode_entry(data) if data else None
+    except Exception as e:
+        cache_stats["error"] += 1
+        print("[Cache] read error:", e)
+        return None
+
+
+async def _compute(key: str, loader, ttl: int, stale_ttl: int):
+    start = time.monotonic()
+    value = await loader()
+    if isinstance(value, BaseModel):
+        value = value.model_dump(mode="json")
+    cache_stats["recompute"] += 1
+    if value is None:
+        return None
+
+    entry = {"v": value, "exp": time.time() + ttl, "d": time.monotonic() - start}
+    try:
+        await redis_client.set(key, _encode_entry(entry), ex=ttl + stale_ttl)
+    except Exception as e:
+        cache_stats["error"] += 1
+        print("[Cache] write error:", e)
+    return value
+
+
+async def _acquire_lock(key: str) -> bool:
+    try:
+        return bool(await redis_client.set(f"lock:{key}", "1", nx=True, px=CACHE_LOCK_TTL_MS))
+    except Exception:
+        return True  # no Redis, no cross-replica coordination
+
+
+async def _release_lock(key: str):
+    try:
+        await redis_client.delete(f"lock:{key}")
+    except Exception:
+        pass
+
+
+async def _load_once(key: str, loader, ttl: int, stale_ttl: int):
+    pending = _inflight.get(key)
+    if pending is not None:
+        return await asyncio.shield(pending)
+
+    pending = asyncio.get_running_loop().create_future()
+    _inflight[key] = pending
+    try:
+        if not await _acquire_lock(key):
+            # another replica is computing it; give it a moment to land
+            for _ in range(CACHE_LOCK_WAIT_STEPS):
+                await asyncio.sleep(CACHE_LOCK_WAIT_MS / 1000)
+                entry = await _read_entry(key)
+                if entry is not None:
+                    pending.set_result(entry["v"])
+                    return entry["v"]
+            value = await _compute(key, loader, ttl, stale_ttl)
+        else:
+            try:
+                value = await _compute(key, loader, ttl, stale_ttl)
+            finally:
+                await _release_lock(key)
+        pending.set_result(value)
+        return value
+    except BaseException as e:
+        pending.set_exception(e)
+        pending.exception()  # mark retrieved when nobody else was waiting
+        raise
+    finally:
+        _inflight.pop(key, None)
+
+
+def _refresh_in_background(key: str, loader, ttl: int, stale_ttl: int):
+    if key in _refreshing:
+        return
+
+    async def refresh():
+        try:
+            if await _acquire_lock(key):
+                try:
+                    await _compute(key, loader, ttl, stale_ttl)
+                finally:
+                    await _release_lock(key)
+        except Exception as e:
+            cache_stats["error"] += 1
+            print("[Cache] background refresh error:", e)
+        finally:
+            _refreshing.discard(key)
+
+    _refreshing.add(key)
+    task = asyncio.create_task(refresh())
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+
+
+async def get_or_compute(key: str, loader, ttl: int, stale_ttl: int = CACHE_STALE_TTL, beta: float = CACHE_EARLY_REFRESH_BETA):
+    entry = await _read_entry(key)
+    if entry is not None:
+        remaining = entry["exp"] - time.time()
+        if remaining > 0:
+            cache_stats["hit"] += 1
+            # XFetch: -delta * beta * ln(rand) grows past `remaining` more often near expiry
+            if -entry.get("d", 0) * beta * math.log(random.random() or 1e-12) >= remaining:
+                _refresh_in_background(key, loader, ttl, stale_ttl)
+            return entry["v"]
+        cache_stats["stale"] += 1
+        _refresh_in_background(key, loader, ttl, stale_ttl)
+        return entry["v"]
+
+    cache_stats["miss"] += 1
+    return await _load_once(key, loader, ttl, stale_ttl)
+
+
+def cached(key, ttl: int, stale_ttl: int = CACHE_STALE_TTL, beta: float = CACHE_EARLY_REFRESH_BETA, render: bool = False):
+    """
+    Decorates an async loader. `key` gets the loader's arguments and returns
+    the cache key (or an awaitable of it); None skips the cache. Models are
+    stored and returned as JSON-ready dicts, or as a CachedBody with
+    render=True; None results are not cached.
+    """
+    def decorator(fn):
+        async def load(*args, **kwargs):
+            value = await fn(*args, **kwargs)
+            if render:
+                return render_body(value)
+            return value.model_dump(mode="json") if isinstance(value, BaseModel) else value
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            cache_key = key(*args, **kwargs)
+            if inspect.isawaitable(cache_key):
+                cache_key = await cache_key
+            if cache_key is None:
+                return await load(*args, **kwargs)
+            return await get_or_compute(cache_key, lambda: load(*args, **kwargs), ttl, stale_ttl, beta)
+        return wrapper
+    return decorator
@@ -1,11 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from math import ceil
 
-from .database import get_db
+from .database import DBSession, get_db, run_db, run_in_session
 from . import crud, schemas
 from .deps import get_current_user, fetch_book
-from .redis_utils import cache_get, cache_set, cache_delete, publish_event
+from .redis_utils import (
+    cached,
+    cached_response,
+    cache_delete,
+    bump_review_generations,
+    get_review_generation,
+)
+from .config import REVIEW_PAGE_CACHE_TTL
 
 router = APIRouter(prefix="/api/v1/reviews", tags=["reviews"])
 
@@ -13,13 +19,13 @@ router = APIRouter(prefix="/api/v1/reviews", tags=["reviews"])
 # ---------------- CREATE REVIEW ---------------- #
 
 @router.post("", response_model=schemas.ReviewOut, status_code=201)
-def create_review(payload: schemas.ReviewCreate,
-                  db: Session = Depends(get_db),
+async def create_review(payload: schemas.ReviewCreate,
+                  db: DBSession = Depends(get_db),
                   current_user: dict = Depends(get_current_user)):
 
-    book = fetch_book(payload.book_id)
+    book = await fetch_book(payload.book_id)
 
-    existing = crud.get_user_review_for_book(db, current_user["id"], payload.book_id)
+    existing = await run_db(db, crud.get_user_review_for_book, current_user["id"], payload.book_id)
     if existing:
         raise HTTPException(status_code=400, detail="You already reviewed this book")
 
@@ -32,14 +38,11 @@ def create_review(payload: schemas.ReviewCreate,
         "comment": payload.comment,
     }
 
-    review = crud.create_review(db, data)
+    review = await run_db(db, crud.create_review, data)
 
     # invalidate caches
-    cache_delete(f"reviews:book:{payload.book_id}:page:1")
-    cache_delete(f"reviews:user:{current_user['id']}:page:1")
-    cache_delete(f"reviews:summary:{payload.book_id}")
-
-    publish_event("review.created", {"review_id": review.id})
+    await bump_review_generations(payload.book_id, current_user["id"])
+    await cache_delete(f"reviews:summary:{payload.book_id}")
 
     return review
 
@@ -47,29 +50,56 @@ def create_review(payload: schemas.ReviewCreate,
 # ---------------- LIST REVIEWS FOR BOOK ---------------- #
 
 @router.get("/book/{book_id}", response_model=schemas.PaginatedReviews)
-def list_reviews(book_id: str,
+async def list_reviews(book_id: str,
+                 request: Request,
                  page: int = Query(1, ge=1),
                  limit: int = Query(20, ge=1, le=100),
                  rating: int | None = Query(None),
                  sort_by: str = Query("created_at"),
                  sort_order: str = Query("desc"),
-                 db: Session = Depends(get_db)):
-
-    cache_key = f"reviews:book:{book_id}:page:{page}:{rating}:{sort_by}:{sort_order}"
-    cached = cache_get(cache_key)
-    if cached:
-        return cached
-
-    items, total = crud.list_reviews_for_book(
-        db, book_id, page, limit, rating, sort_by, sort_order
+                 paging: str = Query("offset", regex="^(offset|cursor)$"),
+                 cursor: str | None = None,
+                 include_total: bool = False,
+                 db: DBSession = Depends(get_db)):
+
+    if cursor or paging == "cursor":
+        try:
+            items, next_cursor = await run_db(
+                db, crud.list_reviews_for_book_keyset, book_id, cursor, limit, rating, sort_by, sort_order
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return schemas.PaginatedReviews(
+            items=items,
+            total=await count_book_reviews(book_id, rating) if include_total else None,
+            limit=limit,
+            average_rating=round(await run_db(db, crud.average_rating, book_id), 1),
+            next_cursor=next_cursor,
+        )
+
+    return cached_response(request, await load_book_reviews(book_id, page, limit, rating, sort_by, sort_order))
+
+
+async def review_page_key(scope: str, owner_id: str, *parts):
+    generation = await get_review_generation(scope, owner_id)
+    if generation is None:
+        return None
+    return ":".join(map(str, (f"reviews:{scope}:{owner_id}:{generation}", *parts)))
+
+
+@cached(key=lambda book_id, page, limit, rating, sort_by, sort_order:
+        review_page_key("book", book_id, "page", page, limit, rating, sort_by, sort_order),
+        ttl=REVIEW_PAGE_CACHE_TTL, render=True)
+async def load_book_reviews(book_id, page, limit, rating, sort_by, sort_order):
+    items, total = await run_in_session(
+        crud.list_reviews_for_book, book_id, page, limit, rating, sort_by, sort_order
     )
 
     pages = ceil(total / limit) if limit else 1
 
-    # compute average rating
-    total_reviews, avg, _ = crud.review_summary(db, book_id)
+    avg = await run_in_session(crud.average_rating, book_id)
 
-    resp = schemas.PaginatedReviews(
+    return schemas.PaginatedReviews(
         items=items,
         total=total,
         page=page,
@@ -78,21 +108,23 @@ def list_reviews(book_id: str,
         average_rating=round(avg, 1),
     )
 
-    cache_set(cache_key, resp.model_dump(), ttl=10 * 60)
-    return resp
+
+@cached(key=lambda book_id, rating: review_page_key("book", book_id, "count", rating), ttl=REVIEW_PAGE_CACHE_TTL)
+async def count_book_reviews(book_id, rating):
+    return await run_in_session(crud.count_reviews_for_book, book_id, rating)
 
 
 # ---------------- GET REVIEW ---------------- #
 
 @router.get("/{review_id}", response_model=schemas.ReviewDetail)
-def get_review(review_id: str,
-               db: Session = Depends(get_db)):
+async def get_review(review_id: str,
+               db: DBSession = Depends(get_db)):
 
-    review = crud.get_review(db, review_id)
+    review = await run_db(db, crud.get_review, review_id)
     if not review:
         raise HTTPException(status_code=404, detail="Review not found")
 
-    book = fetch_book(review.book_id)
+    book = await fetch_book(review.book_id)
 
     return schemas.ReviewDetail(
         id=review.id,
@@ -111,25 +143,22 @@ def get_review(review_id: str,
 # ---------------- UPDATE REVIEW ---------------- #
 
 @router.put("/{review_id}", response_model=schemas.ReviewOut)
-def update_review(review_id: str,
+async def update_review(review_id: str,
                   payload: schemas.ReviewUpdate,
-                  db: Session = Depends(get_db),
+                  db: DBSession = Depends(get_db),
                   current_user: dict = Depends(get_current_user)):
 
-    review = crud.get_review(db, review_id)
+    review = await run_db(db, crud.get_review, review_id)
     if not review:
         raise HTTPException(status_code=404, detail="Review not found")
 
     if review.user_id != current_user["id"] and not current_user.get("is_admin"):
         raise HTTPException(status_code=403, detail="Not allowed")
 
-    review = crud.update_review(db, review, payload.model_dump(exclude_unset=True))
-
-    cache_delete(f"reviews:book:{review.book_id}:page:1")
-    cache_delete(f"reviews:user:{review.user_id}:page:1")
-    cache_delete(f"reviews:summary:{review.book_id}")
+    review = await run_db(db, crud.update_review, review, payload.model_dump(exclude_unset=True))
 
-    publish_event("review.updated", {"review_id": review.id})
+    await bump_review_generations(review.book_id, review.user_id)
+    await cache_delete(f"reviews:summary:{review.book_id}")
 
     return review
 
@@ -137,24 +166,21 @@ def update_review(review_id: str,
 # ---------------- DELETE REVIEW ---------------- #
 
 @router.delete("/{review_id}", status_code=204)
-def delete_review(review_id: str,
-                  db: Session = Depends(get_db),
+async def delete_review(review_id: str,
+                  db: DBSession = Depends(get_db),
                   current_user: dict = Depends(get_current_user)):
 
-    review = crud.get_review(db, review_id)
+    review = await run_db(db, crud.get_review, review_id)
     if not review:
         raise HTTPException(status_code=404, detail="Review not found")
 
     if review.user_id != current_user["id"] and not current_user.get("is_admin"):
         raise HTTPException(status_code=403, detail="Not allowed")
 
-    crud.delete_review(db, review)
+    await run_db(db, crud.delete_review, review)
 
-    cache_delete(f"reviews:book:{review.book_id}:page:1")
-    cache_delete(f"reviews:user:{review.user_id}:page:1")
-    cache_delete(f"reviews:summary:{review.book_id}")
-
-    publish_event("review.deleted", {"review_id": review.id})
+    await bump_review_generations(review.book_id, review.user_id)
+    await cache_delete(f"reviews:summary:{review.book_id}")
 
     return
 
@@ -162,19 +188,36 @@ def delete_review(review_id: str,
 # ---------------- USER’S OWN REVIEWS ---------------- #
 
 @router.get("/user/me", response_model=schemas.PaginatedReviews)
-def get_my_reviews(page: int = 1, limit: int = 20,
-                   db: Session = Depends(get_db),
+async def get_my_reviews(request: Request, page: int = 1, limit: int = 20,
+                   paging: str = Query("offset", regex="^(offset|cursor)$"),
+                   cursor: str | None = None,
+                   include_total: bool = False,
+                   db: DBSession = Depends(get_db),
                    current_user: dict = Depends(get_current_user)):
 
-    cache_key = f"reviews:user:{current_user['id']}:page:{page}"
-    cached = cache_get(cache_key)
-    if cached:
-        return cached
-
-    items, total = crud.get_reviews_by_user(db, current_user["id"], page, limit)
+    if cursor or paging == "cursor":
+        try:
+            items, next_cursor = await run_db(db, crud.get_reviews_by_user_keyset, current_user["id"], cursor, limit)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return schemas.PaginatedReviews(
+            items=items,
+            total=await count_user_reviews(current_user["id"]) if include_total else None,
+            limit=limit,
+            average_rating=0,
+            next_cursor=next_cursor,
+        )
+
+    return cached_response(request, await load_user_reviews(current_user["id"], page, limit))
+
+
+@cached(key=lambda user_id, page, limit: review_page_key("user", user_id, "page", page, limit),
+        ttl=REVIEW_PAGE_CACHE_TTL, render=True)
+async def load_user_reviews(user_id, page, limit):
+    items, total = await run_in_session(crud.get_reviews_by_user, user_id, page, limit)
     pages = ceil(total / limit) if limit else 1
 
-    resp = schemas.PaginatedReviews(
+    return schemas.PaginatedReviews(
         items=items,
         total=total,
         page=page,
@@ -183,29 +226,26 @@ def get_my_reviews(page: int = 1, limit: int = 20,
         average_rating=0,
     )
 
-    cache_set(cache_key, resp.model_dump(), ttl=10 * 60)
-    return resp
+
+@cached(key=lambda user_id: review_page_key("user", user_id, "count"), ttl=REVIEW_PAGE_CACHE_TTL)
+async def count_user_reviews(user_id):
+    return await run_in_session(crud.count_reviews_by_user, user_id)
 
 
 # ---------------- SUMMARY ---------------- #
 
 @router.get("/book/{book_id}/summary", response_model=schemas.ReviewSummary)
-def summary(book_id: str,
-            db: Session = Depends(get_db)):
+async def summary(book_id: str, request: Request):
+    return cached_response(request, await load_summary(book_id))
 
-    cache_key = f"reviews:summary:{book_id}"
-    cached = cache_get(cache_key)
-    if cached:
-        return cached
 
-    total, avg, dist = crud.review_summary(db, book_id)
+@cached(key=lambda book_id: f"reviews:summary:{book_id}", ttl=15 * 60, render=True)
+async def load_summary(book_id):
+    total, avg, dist = await run_in_session(crud.review_summary, book_id)
 
-    resp = schemas.ReviewSummary(
+    return schemas.ReviewSummary(
         book_id=book_id,
         total_reviews=total,
         average_rating=round(avg, 1),
         rating_distribution=dist,
     )
-
-    cache_set(cache_key, resp.model_dump(), ttl=15 * 60)
-    return resp
\ No newline at end of file
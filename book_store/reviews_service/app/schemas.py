@@ -1,11 +1,11 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, conint
 from datetime import datetime
 from typing import List, Optional, Dict
 
 
 class ReviewCreate(BaseModel):
     book_id: str
-    rating: int
+    rating: conint(ge=1, le=5)
     title: Optional[str] = None
     comment: Optional[str] = None
 
@@ -29,7 +29,7 @@ class ReviewDetail(ReviewOut):
 
 
 class ReviewUpdate(BaseModel):
-    rating: Optional[int]
+    rating: Optional[conint(ge=1, le=5)]
     title: Optional[str]
     comment: Optional[str]
 
@@ -48,11 +48,13 @@ class ReviewListItem(BaseModel):
 
 class PaginatedReviews(BaseModel):
     items: List[ReviewListItem]
-    total: int
-    page: int
+    # cursor paging: total only with include_total, no page/pages
+    total: Optional[int] = None
+    page: Optional[int] = None
     limit: int
-    pages: int
+    pages: Optional[int] = None
     average_rating: float
+    next_cursor: Optional[str] = None
 
 
 class ReviewSummary(BaseModel):